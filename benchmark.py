@@ -0,0 +1,49 @@
+# generate synthetic captures and benchmark ingestion and the analyses on them
+# example: python benchmark.py run --sizes 1000000 10000000 --hosts 500 --vlans 8
+#          python benchmark.py compare a33f0e6  (against the current commit)
+#          python benchmark.py generate 50000000 --csv files/big.csv --pcap files/big.pcap
+import argparse
+from src.benchmark import run_benchmark, compare_results, git_commit, ENTRY_POINTS, RESULTS_FILE, DATA_DIR, STREAM_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic captures and performance benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    network = argparse.ArgumentParser(add_help=False)
+    network.add_argument('--hosts', type=int, default=200, help='hosts in the synthetic network')
+    network.add_argument('--vlans', type=int, default=4, help='vlans the hosts are spread over')
+    network.add_argument('--flows', type=int, default=20_000, help='distinct flows (zipf-like popularity)')
+
+    generate = commands.add_parser('generate', parents=[network], help='write a synthetic capture')
+    generate.add_argument('packets', type=int, help='number of packets')
+    generate.add_argument('--csv', help='tshark-style csv export to write')
+    generate.add_argument('--pcap', help='pcap file to write')
+    generate.add_argument('--pps', type=int, default=10_000, help='average packets per second')
+    generate.add_argument('--seed', type=int, default=0)
+
+    run = commands.add_parser('run', parents=[network], help='benchmark ingestion and the analyses')
+    run.add_argument('--sizes', type=int, nargs='+', default=[1_000_000], help='capture sizes in packets')
+    run.add_argument('--formats', nargs='+', default=['csv', 'pcap'], choices=['csv', 'pcap'])
+    run.add_argument('--entry-points', nargs='+', choices=list(ENTRY_POINTS), help='analyses to run (default: all)')
+    run.add_argument('--repeat', type=int, default=1, help='runs per stage (the fastest is kept)')
+    run.add_argument('--no-memory', action='store_true', help="skip the (slower) traced run that measures peak memory")
+    run.add_argument('--results', default=RESULTS_FILE, help='json lines file the results are appended to')
+    run.add_argument('--data-dir', default=DATA_DIR, help='where the generated captures are kept between runs')
+    run.add_argument('--stream-size', type=int, default=STREAM_SIZE, help='only stream captures of at least this many packets')
+
+    compare = commands.add_parser('compare', help='compare the stored results of two commits')
+    compare.add_argument('base', help='commit (hash prefix) to compare against')
+    compare.add_argument('new', nargs='?', help='commit to compare (default: the current one)')
+    compare.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        from src.synthetic_capture import generate_capture
+        packets = generate_capture(args.packets, args.csv, args.pcap, args.hosts, args.vlans, args.flows, args.pps, args.seed)
+        print(f'wrote {packets} packets')
+    elif args.command == 'run':
+        run_benchmark(args.sizes, args.hosts, args.vlans, args.flows, args.formats, args.entry_points, args.repeat,
+                      not args.no_memory, args.results, args.data_dir, stream_size=args.stream_size)
+    else:
+        table = compare_results(args.base, args.new or git_commit(), args.results)
+        print(table.to_string(index=False))
@@ -0,0 +1,15 @@
+# convert a directory (or glob) of pcap/pcapng/csv captures into one time-ordered parquet dataset
+# example: python ingest.py pcaps/incident/ files/incident.parquet --workers 8
+import argparse
+from src.multi_ingest import ingest_captures, SPLIT_SIZE
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decode many captures in parallel and merge them in time order')
+    parser.add_argument('inputs', nargs='+', help='capture files, directories or glob patterns')
+    parser.add_argument('output', help='merged .parquet file (pass it to analyze() like a csv)')
+    parser.add_argument('--workers', type=int, default=None, help='processes to use (default: one per core)')
+    parser.add_argument('--split-size', type=int, default=SPLIT_SIZE, help='split files larger than this many bytes into ranges')
+    args = parser.parse_args()
+
+    written = ingest_captures(args.inputs, args.output, workers=args.workers, split_size=args.split_size)
+    print(f'wrote {written} packets to {args.output}')
@@ -1,132 +1,399 @@
-import subprocess
-from src.read_events import *
-from src.pcap_to_pandas import *
-from src.bandwidth import * 
-from src.top_talkers import *
-from src.read_hostnames import *
-from src.packet_count import *
-from src.packet_size import *
-from src.unusual_ports_protocols import *
-from src.new_rare_conversations import *
-from src.plot_jitter_over_time import *
-from src.burst_detection import *
-from src.protocol_entropy import *
-from src.lateral_movement_analysis import *
-
-def analyze(event_traffic_csv=None, baseline_traffic_csv=None, event_file=None, hostname_file=None, interval='1S', vlan_filter=None, protocol_filter=None, time_filter=None):
-    
+# command line entry point
+# example: python main.py analyze --config files/analysis.toml
+#          python main.py metric bursts files/event_traffic.csv
+#          python main.py summary files/event_traffic.csv
+#          python main.py analyze --config files/analysis.toml --event-window 5Min
+#          python main.py analyze files/event_traffic.csv --metrics bandwidth bursts --dashboard plots/dashboard.html
+#          python main.py analyze files/event_traffic.csv --metrics bandwidth packet_count --rollups
+#          python main.py export pcaps/day.pcap files/hour.csv --vlan 20 --time 1748275200 1748278800
+# modules are imported by the stages and metrics that use them, so a summary or a single metric doesn't load
+# every analysis module and plotting backend first
+import argparse
+import json
+
+DEFAULT_METRICS = ['bandwidth', 'bursts']
+
+
+### metrics: what each one needs ('cube', 'flows', 'packets' or 'capture' - the path, read in chunks by the metric itself),
+# whether it compares against the baseline (or can), whether it works on streamed aggregates and whether it renders
+# png plots (so the renderer only starts when needed). A 'stream' variant replaces a metric that needs the packets
+# in streaming runs.
+
+def _bandwidth(run):
+    from src.bandwidth import plot_bandwidth
+    return plot_bandwidth(run['event_cube'], graphs=['overall', 'vlan', 'protocol'], result='html', save=True, events=run['event_log'])
+
+def _bursts(run):
+    from src.burst_detection import detect_bandwidth_bursts
+    return detect_bandwidth_bursts(run['event_cube'], save=True)
+
+def _packet_count(run):
+    from src.packet_count import plot_packet_count
+    return plot_packet_count(run['event_cube'], graphs=['overall', 'vlan', 'protocol'], save=True, events=run['event_log'])
+
+def _packet_size(run):
+    from src.packet_size import plot_avg_packet_sizes
+    return plot_avg_packet_sizes(run['event_cube'], graphs=['overall', 'vlan', 'protocol'], save=True, events=run['event_log'])
+
+def _top_talkers(run):
+    from src.top_talkers import compare_top_talkers
+    return compare_top_talkers(run['baseline_flows'], run['event_flows'], save=True, top_k=run['top_k'])
+
+def _top_receivers(run):
+    from src.top_talkers import compare_top_receivers
+    return compare_top_receivers(run['baseline_flows'], run['event_flows'], save=True, top_k=run['top_k'])
+
+def _port_protocol_activity(run):
+    from src.unusual_ports_protocols import plot_port_protocol_activity
+    plot_port_protocol_activity(run['baseline_flows'], run['event_flows'], port='src', top_n=10, save=True)
+    plot_port_protocol_activity(run['baseline_flows'], run['event_flows'], port='dst', top_n=10, save=True)
+
+def _entropy(run):
+    from src.protocol_entropy import calculate_protocol_entropy
+    return calculate_protocol_entropy(run['event_cube'], save=True)
+
+def _jitter(run):
+    from src.plot_jitter_over_time import plot_jitter
+    return plot_jitter(run['event_traffic'], interval='1Min', save=True)
+
+def _stream_jitter(run):
+    from src.jitter import stream_jitter
+    from src.plot_jitter_over_time import plot_jitter
+    stats = stream_jitter(run['event_capture'], interval='1Min', chunksize=run['chunksize'], **run['filters'])
+    return plot_jitter(None, save=True, stats=stats)
+
+def _burst_events(run):
+    # online (EWMA) burst detection, one pass over the capture in chunks
+    from src.burst_detection import stream_bursts
+    events = stream_bursts(run['event_capture'], chunksize=run['chunksize'], **run['filters'])
+    events.to_csv('burst_events.csv', index=False)
+    print(events)
+    return events
+
+def _dimension_entropy(run):
+    # protocol, destination port, destination ip and packet size entropy per vlan and minute
+    import pandas as pd
+    from src.protocol_entropy import stream_entropy
+    entropy = stream_entropy(run['event_capture'], interval='1Min', chunksize=run['chunksize'], **run['filters'])
+    entropy = pd.concat([df.assign(dimension=dim) for dim, df in entropy.items()], ignore_index=True)
+    entropy.to_csv('dimension_entropy.csv', index=False)
+    return entropy
+
+def _rare_conversations(run):
+    from src.new_rare_conversations import detect_new_or_rare_conversations
+    from src.addresses import format_addresses
+    rare_flows = format_addresses(detect_new_or_rare_conversations(run['baseline_flows'], run['event_flows'], rare_threshold=3))
+    rare_flows.to_csv('rare_connections.csv', index=False)
+    print(rare_flows[['ip.src', 'ip.dst', 'ip.proto', 'count_baseline', 'count_event', 'is_new', 'is_rare']])
+    return rare_flows
+
+def _lateral_movement(run):
+    from src.lateral_movement_analysis import lateral_movement_analysis
+    return lateral_movement_analysis(run['event_flows'], run.get('baseline_flows'), save=True)
+
+def _stream_lateral_movement(run):
+    from src.lateral_movement_analysis import stream_lateral_movement
+    return stream_lateral_movement(run['event_capture'], run.get('baseline_flows'), chunksize=run['chunksize'], save=True, **run['filters'])
+
+def _event_stats(run):
+    # bandwidth and packets per minute before, during and after every event
+    from src.read_events import event_window_stats
+    from src.traffic_cube import get_cube, cube_series
+    if run['event_log'] is None:
+        print("skipping event_stats: it needs an event file")
+        return None
+    series = cube_series(get_cube(run['event_cube'], '1Min'), ['frame.time_epoch'], ['frame.len', 'packet_count'])
+    series['bandwidth_mbps'] = series['frame.len'] * 8 / (60 * 10**6)
+    stats = event_window_stats(series, run['event_log'], ['bandwidth_mbps', 'packet_count'], stats=('mean', 'max', 'sum'))
+    stats.to_csv('event_stats.csv', index=False)
+    print(stats)
+    return stats
+
+# the table each kind of metric reads (recorded as the stage's input)
+METRIC_INPUTS = {'cube': 'event_cube', 'flows': 'event_flows', 'packets': 'event_traffic', 'capture': 'event_capture'}
+
+METRICS = {
+    'bandwidth': {'fn': _bandwidth, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': False},
+    'bursts': {'fn': _bursts, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': True},
+    'packet_count': {'fn': _packet_count, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': True},
+    'packet_size': {'fn': _packet_size, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': True},
+    'top_talkers': {'fn': _top_talkers, 'needs': 'flows', 'baseline': True, 'aggregates': True, 'png': True},
+    'top_receivers': {'fn': _top_receivers, 'needs': 'flows', 'baseline': True, 'aggregates': True, 'png': True},
+    'port_protocol_activity': {'fn': _port_protocol_activity, 'needs': 'flows', 'baseline': True, 'aggregates': True, 'png': True},
+    'entropy': {'fn': _entropy, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': True},
+    'jitter': {'fn': _jitter, 'needs': 'packets', 'baseline': False, 'aggregates': False, 'png': True, 'stream': _stream_jitter},
+    'rare_conversations': {'fn': _rare_conversations, 'needs': 'flows', 'baseline': True, 'aggregates': True, 'png': False},
+    'event_stats': {'fn': _event_stats, 'needs': 'cube', 'baseline': False, 'aggregates': True, 'png': False},
+    'lateral_movement': {'fn': _lateral_movement, 'needs': 'flows', 'baseline': 'optional', 'aggregates': False, 'png': True, 'stream': _stream_lateral_movement},
+    'burst_events': {'fn': _burst_events, 'needs': 'capture', 'baseline': False, 'aggregates': True, 'png': False},
+    'dimension_entropy': {'fn': _dimension_entropy, 'needs': 'capture', 'baseline': False, 'aggregates': True, 'png': False},
+}
+
+
+def _metric_fn(spec, aggregated):
+    # the function a metric runs and what it needs: in streaming runs the metrics that need the packets or flow
+    # records read the capture in chunks themselves
+    if aggregated and not spec['aggregates'] and spec.get('stream'):
+        return spec['stream'], 'capture'
+    return spec['fn'], spec['needs']
+
+
+def analyze(event_traffic_csv=None, baseline_traffic_csv=None, event_file=None, hostname_file=None, interval='1S', vlan_filter=None, protocol_filter=None, time_filter=None, chunksize=None, plot_workers=None, state_dir=None, baseline_profile=None, report=None, summary=False, profile=False, metrics=DEFAULT_METRICS, host_filter=None, subnet_filter=None, event_window=None, top_k=None, dashboard=None, rollups=False):
+    from src.instrumentation import start_report, finish_report, stage, timed
+
     if not event_traffic_csv and not baseline_traffic_csv:
         print("Can't analyze stuff if there's no capture file")
         return
-    
-    ### read the csv
-    if event_traffic_csv: event_traffic = read_pcap_csv(event_traffic_csv)
-    if baseline_traffic_csv: baseline_traffic = read_pcap_csv(baseline_traffic_csv)
+
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError(f"unknown metrics {unknown} (choose from {list(METRICS)})")
+    selected = {m: METRICS[m] for m in metrics}
+    aggregated = bool(chunksize or state_dir)
+    needs = {_metric_fn(spec, aggregated)[1] for spec in selected.values()}
+
+    # per-stage timings, memory and row counts (written to the report json and/or printed as a table)
+    if report or summary or profile: start_report(profile)
+
+    # a saved baseline profile replaces the baseline capture (it is built from baseline_traffic_csv on the first run)
+    if baseline_profile:
+        from src.baseline_profile import build_profile, load_profile, save_profile
+    base_profile = timed('load_profile', load_profile, baseline_profile) if baseline_profile else None
+    if base_profile is not None: baseline_traffic_csv = None
+    # nothing to read the baseline for (unless the profile is being built from it)
+    if not baseline_profile and not any(spec['baseline'] for spec in selected.values()): baseline_traffic_csv = None
+
+    # saved png plots are rendered on a process pool while the analysis continues (plot_workers=1 renders them inline)
+    if any(spec['png'] for spec in selected.values()):
+        from src.my_plot import start_renderer
+        start_renderer(plot_workers)
+
+    # with a dashboard (e.g. 'plots/dashboard.html') every figure of the run also goes into that one page
+    # (the html plots only go there, instead of one file per plot)
+    if dashboard:
+        from src.my_plot import start_dashboard
+        start_dashboard(dashboard)
 
     ### read the optional files
-    event_log = read_events(event_file) if event_file else None
-    hostnames = load_ip_hostname_mapping(hostname_file) if hostname_file else None
-    
-    ### clean up the data
-
-    # Ensure timestamp and length are correct types
-    if event_traffic_csv: event_traffic['frame.len'] = event_traffic['frame.len'].astype(int)
-    if baseline_traffic_csv: baseline_traffic['frame.len'] = baseline_traffic['frame.len'].astype(int)
-    
-    # ensure vlan.id is an int
-    # todo: need to check for NaN and insert something (maybe 0?)
-    if event_traffic_csv: event_traffic['vlan.id'] = event_traffic['vlan.id'].astype(int)
-    if baseline_traffic_csv: baseline_traffic['vlan.id'] = baseline_traffic['vlan.id'].astype(int)
-
-    # Define protocol names
-    protocol_map = {6: 'TCP', 17: 'UDP', 1: 'ICMP'} #todo: add more protocols here
-    if event_traffic_csv: event_traffic['protocol'] = event_traffic['ip.proto'].map(protocol_map).fillna(event_traffic['ip.proto'].astype(str))
-    if baseline_traffic_csv: baseline_traffic['protocol'] = baseline_traffic['ip.proto'].map(protocol_map).fillna(baseline_traffic['ip.proto'].astype(str))
-
-    # map the ip addresss to text labels based on hostname_file
+    if event_file:
+        from src.read_events import read_events, event_windows
     if hostname_file:
-        if event_traffic_csv: event_traffic['hostname'] = event_traffic['ip.src'].map(hostnames)
-        if event_traffic_csv: event_traffic['label'] = event_traffic['hostname'].fillna(event_traffic['ip.src'])
-        if baseline_traffic_csv: baseline_traffic['hostname'] = baseline_traffic['ip.src'].map(hostnames)
-        if baseline_traffic_csv: baseline_traffic['label'] = baseline_traffic['hostname'].fillna(baseline_traffic['ip.src'])
+        from src.read_hostnames import load_asset_map
+    event_log = timed('read_events', read_events, event_file) if event_file else None
+    hostnames = load_asset_map(hostname_file) if hostname_file else None
+    # with an event_window (e.g. '5Min') only the parts of the event capture close to an event are read
+    windows = event_windows(event_log, event_window) if event_window and event_log is not None else None
+    windows = windows or None
+
+    ### streaming mode: aggregate the captures chunk by chunk (for captures that don't fit in memory)
+    # only the time-series (cube), top talker/receiver, port and conversation metrics support this
+    # with a state_dir the event aggregates are kept on disk and only the packets added since the last run are read
+    # (jitter and lateral movement read the capture in chunks themselves)
+    # with rollups the event cube is served from the capture's stored multi-resolution rollups (built on the first
+    # run); filtered and streamed runs aggregate their own packets
+    filtered = any(f is not None for f in (vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, windows))
+    pyramid = bool(rollups and event_traffic_csv and 'cube' in needs and not filtered and not aggregated)
+    # the event packets are only read when a metric needs more than the cube (or its own pass over the capture)
+    read_event = bool(event_traffic_csv) and bool(needs & {'packets', 'flows'} or ('cube' in needs and not pyramid))
+    if aggregated:
+        from src.streaming import stream_capture
+        from src.analysis_state import append_captures
+        filters = dict(vlan_filter=vlan_filter, protocol_filter=protocol_filter, time_filter=time_filter, host_filter=host_filter, subnet_filter=subnet_filter)
+        chunksize = chunksize or 1_000_000
+        if read_event and state_dir: event_traffic = timed('append_captures event', append_captures, state_dir, event_traffic_csv, interval, hostnames, chunksize, **filters)
+        elif read_event: event_traffic = timed('stream_capture event', stream_capture, event_traffic_csv, interval, chunksize, hostnames, **filters, time_windows=windows, top_k=top_k)
+        if baseline_traffic_csv: baseline_traffic = timed('stream_capture baseline', stream_capture, baseline_traffic_csv, interval, chunksize, hostnames, **filters, top_k=top_k)
     else:
-        if event_traffic_csv: event_traffic['label'] = event_traffic['ip.src']
-        if baseline_traffic_csv: baseline_traffic['label'] = baseline_traffic['ip.src']
-
-    ### limit the data based on filters
-    if vlan_filter is not None:
-        if event_traffic_csv: event_traffic = event_traffic[event_traffic['vlan.id'].isin(vlan_filter)]
-        if baseline_traffic_csv :baseline_traffic = baseline_traffic[baseline_traffic['vlan.id'].isin(vlan_filter)]
-
-    if protocol_filter is not None:
-        if event_traffic_csv: event_traffic = event_traffic[event_traffic['ip.proto'].isin(protocol_filter)]
-        if baseline_traffic_csv: baseline_traffic = baseline_traffic[baseline_traffic['ip.proto'].isin(protocol_filter)]
-
-    if time_filter is not None:
-        start_time = pd.to_datetime(time_filter[0], unit='s')
-        end_time = pd.to_datetime(time_filter[1], unit='s')
-        if event_traffic_csv: event_traffic = event_traffic[(event_traffic['frame.time_epoch'] >= start_time) & (event_traffic['frame.time_epoch'] <= end_time)]
-        if baseline_traffic_csv: baseline_traffic = baseline_traffic[(baseline_traffic['frame.time_epoch'] >= start_time) & (baseline_traffic['frame.time_epoch'] <= end_time)]
-    
-    
+        from src.pcap_to_pandas import read_pcap_csv, label_traffic
+        from src.capture_filters import capture_filters
+
+        ### read the csv
+        # the filters are pushed down into the reader (parquet predicates for cached/merged captures, a mask per
+        # decoded chunk for pcap and csv, time windows seek through the capture's time index), so the rows they
+        # remove are never labelled
+        filters = capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter)
+        event_filters = capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, windows)
+        if read_event: event_traffic = timed('read event', read_pcap_csv, event_traffic_csv, filters=event_filters)
+        if baseline_traffic_csv: baseline_traffic = timed('read baseline', read_pcap_csv, baseline_traffic_csv, filters=filters)
+
+        ### clean up the data
+        # (timestamps, frame.len and vlan.id already come back from read_pcap_csv with fixed dtypes)
+
+        # protocol names and text labels for the ip addresses (based on hostname_file)
+        if read_event: event_traffic = timed('label event', label_traffic, event_traffic, hostnames)
+        if baseline_traffic_csv: baseline_traffic = timed('label baseline', label_traffic, baseline_traffic, hostnames)
+
+    run = {'event_log': event_log, 'top_k': top_k}
+    if read_event: run['event_traffic'] = event_traffic
+    # the metrics that read the capture in chunks themselves get its path, chunk size and filters
+    if event_traffic_csv:
+        run.update(event_capture=event_traffic_csv, chunksize=chunksize or 1_000_000,
+                   filters=dict(vlan_filter=vlan_filter, protocol_filter=protocol_filter, time_filter=time_filter, host_filter=host_filter, subnet_filter=subnet_filter, time_windows=windows))
+
+    ### aggregate the packets once per (vlan, protocol, time bin) - every time-series metric reads from this cube
+    # (in streaming mode the aggregates already hold it, with rollups it is re-binned from the stored levels)
+    if pyramid:
+        from src.rollup_pyramid import load_pyramid
+        run['event_cube'] = timed('load_pyramid event', load_pyramid, event_traffic_csv)
+    elif event_traffic_csv and 'cube' in needs:
+        from src.traffic_cube import build_cube
+        run['event_cube'] = event_traffic if aggregated else timed('build_cube event', build_cube, event_traffic, interval)
+
+    ### baseline profile: the comparison functions only need per-host, port, protocol and conversation totals
+    if baseline_profile and base_profile is None and baseline_traffic_csv:
+        base_profile = timed('build_profile', build_profile, baseline_traffic, interval)
+        timed('save_profile', save_profile, baseline_profile, base_profile)
+    if base_profile is not None: baseline_traffic = base_profile
+
+    ### flow records: the talker/receiver, port, conversation and lateral movement analyses only need per-flow totals
+    # (aggregates and profiles already hold those totals; the streamed lateral movement analysis takes the baseline's)
+    if 'flows' in needs or baseline_traffic_csv or base_profile is not None:
+        from src.flows import assemble_flows
+        if event_traffic_csv and 'flows' in needs: run['event_flows'] = event_traffic if aggregated else timed('assemble_flows event', assemble_flows, event_traffic)
+        if baseline_traffic_csv: run['baseline_flows'] = baseline_traffic if aggregated or base_profile is not None else timed('assemble_flows baseline', assemble_flows, baseline_traffic)
+        if base_profile is not None: run['baseline_flows'] = base_profile
+
+
     ### Analyze
+    for name, spec in selected.items():
+        fn, input_kind = _metric_fn(spec, aggregated)
+        if spec['baseline'] is True and 'baseline_flows' not in run:
+            print(f"skipping {name}: it compares against a baseline capture or profile")
+        elif aggregated and not spec['aggregates'] and input_kind != 'capture':
+            print(f"skipping {name}: it needs the packets or flows, not streamed aggregates")
+        elif METRIC_INPUTS[input_kind] not in run:
+            print(f"skipping {name}: it needs an event capture")
+        else:
+            with stage(name, run[METRIC_INPUTS[input_kind]]) as rec:
+                rec['output'] = fn(run)
 
-    # # Bandwidth
-    plot_bandwidth(event_traffic, graphs=['overall', 'vlan', 'protocol'], result='html', save=True, events=event_log)
+    # wait for the queued png plots
+    # (rendering on the pool overlaps the analyses above, so this is only the rendering that was left)
+    if any(spec['png'] for spec in selected.values()):
+        from src.my_plot import wait_for_plots
+        timed('wait_for_plots', wait_for_plots)
+    if dashboard:
+        from src.my_plot import finish_dashboard
+        timed('write_dashboard', finish_dashboard)
 
-    # burst detection
-    detect_bandwidth_bursts(event_traffic, save=True)
+    finish_report(report, summary)
+    print("done")
 
-    # # # packet rate
-    # plot_packet_count(event_traffic, graphs=['overall', 'vlan', 'protocol'], save=True, events=event_log)
 
-    # # # average packet size 
-    # plot_avg_packet_sizes(event_traffic, graphs=['overall', 'vlan', 'protocol'], save=True, events=event_log)
+def load_config(path):
+    """Read a run configuration (.toml or .json) whose keys are analyze()'s arguments."""
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)
+    import tomllib
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
 
-    # # # top talkers
-    # # plot_top_talkers(event_traffic, save=True)
-    # compare_top_talkers(baseline_traffic, event_traffic, save=True)
 
-    # # Top receivers
-    # # plot_top_receivers(event_traffic, save=True)
-    # compare_top_receivers(baseline_traffic, event_traffic, save=True)
+def summarize(capture, interval='1S', chunksize=1_000_000, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None):
+    # headline numbers only: one streamed pass, no plotting backend
+    from src.streaming import stream_capture, capture_summary
+    aggregates = stream_capture(capture, interval, chunksize, vlan_filter=vlan_filter, protocol_filter=protocol_filter, time_filter=time_filter,
+                                host_filter=host_filter, subnet_filter=subnet_filter)
+    if aggregates is None:
+        print('no packets')
+        return None
+    summary = capture_summary(aggregates)
+    print(json.dumps(summary, indent=2))
+    return summary
 
 
-    # # # port and protocol activity
-    # plot_port_protocol_activity(baseline_traffic, event_traffic, port='src', top_n=10, save=True)
-    # plot_port_protocol_activity(baseline_traffic, event_traffic, port='dst', top_n=10, save=True)
+def _run_options(parser):
+    # analyze() options (default None, so the config file decides unless they're given)
+    parser.add_argument('--config', help='run configuration (.toml or .json) with analyze() arguments as keys')
+    parser.add_argument('--baseline', dest='baseline_traffic_csv', help='baseline capture (csv, pcap, pcapng or parquet)')
+    parser.add_argument('--events', dest='event_file', help='event annotations csv')
+    parser.add_argument('--hostnames', dest='hostname_file', help='ip to hostname csv')
+    parser.add_argument('--interval', help="finest time bin (e.g. '1S')")
+    parser.add_argument('--vlan', dest='vlan_filter', type=int, nargs='+', help='only these vlans')
+    parser.add_argument('--protocol', dest='protocol_filter', type=int, nargs='+', help='only these ip protocol numbers')
+    parser.add_argument('--time', dest='time_filter', type=float, nargs=2, metavar=('START', 'END'), help='only this epoch time window')
+    parser.add_argument('--host', dest='host_filter', nargs='+', help='only packets from or to these addresses')
+    parser.add_argument('--subnet', dest='subnet_filter', nargs='+', help='only packets from or to these CIDR blocks')
+    parser.add_argument('--event-window', help="only read the event capture this close to the events (e.g. '5Min')")
+    parser.add_argument('--chunksize', type=int, help='stream the captures in chunks of this many packets')
+    parser.add_argument('--top-k', type=int, help='rank top talkers/receivers with heavy-hitter sketches monitoring this many hosts')
+    parser.add_argument('--rollups', action='store_const', const=True, help="serve the time series from the event capture's stored multi-resolution rollups")
+    parser.add_argument('--dashboard', help='collect every figure of the run into this html page')
+    parser.add_argument('--plot-workers', type=int, help='processes rendering png plots')
+    parser.add_argument('--state-dir', help='keep the event aggregates here and only read new packets next time')
+    parser.add_argument('--baseline-profile', help='build the baseline profile once and reuse it')
+    parser.add_argument('--report', help='write per-stage timings, memory and row counts to this json file')
+    parser.add_argument('--summary-table', dest='summary', action='store_const', const=True, help='print the per-stage table')
+    parser.add_argument('--profile', action='store_const', const=True, help='sample the call stacks and profile the slowest stage')
 
-    # # protocol entropy
-    # calculate_protocol_entropy(event_traffic, save=True)
 
-    # # jitter
-    # plot_jitter(event_traffic, interval='1Min', save=True)
+def _options(args, skip=('command', 'config', 'metric', 'event')):
+    # config file values, overridden by the options given on the command line
+    options = load_config(args.config) if args.config else {}
+    options.update({k: v for k, v in vars(args).items() if v is not None and k not in skip})
+    return options
 
-    # # new or rare converstaions
-    # rare_flows = detect_new_or_rare_conversations(baseline_traffic, event_traffic, rare_threshold=3)
-    # rare_flows.to_csv('rare_connections.csv', index=False)
-    # print(rare_flows[['ip.src', 'ip.dst', 'ip.proto', 'count_baseline', 'count_event', 'is_new', 'is_rare']])
 
-    # # latency
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze network captures')
+    commands = parser.add_subparsers(dest='command', required=True)
 
-    # # lateral movement
-    # lateral_movement_analysis(event_traffic, baseline_traffic, save=True)
+    run = commands.add_parser('analyze', help='run the selected metrics (see --config)')
+    run.add_argument('event', nargs='?', help='event capture (or event_traffic_csv in the config file)')
+    run.add_argument('--metrics', nargs='+', choices=list(METRICS), help=f'metrics to run (default: {" ".join(DEFAULT_METRICS)})')
+    _run_options(run)
 
-    print("done")
+    metric = commands.add_parser('metric', help='run a single metric')
+    metric.add_argument('metric', choices=list(METRICS))
+    metric.add_argument('event', nargs='?', help='event capture (or event_traffic_csv in the config file)')
+    _run_options(metric)
+
+    summary = commands.add_parser('summary', help='packets, bytes, time span, vlans, protocols and top talkers of a capture')
+    summary.add_argument('capture')
+    summary.add_argument('--interval', default='1S')
+    summary.add_argument('--chunksize', type=int, default=1_000_000)
+    summary.add_argument('--vlan', dest='vlan_filter', type=int, nargs='+')
+    summary.add_argument('--protocol', dest='protocol_filter', type=int, nargs='+')
+    summary.add_argument('--time', dest='time_filter', type=float, nargs=2, metavar=('START', 'END'))
+    summary.add_argument('--host', dest='host_filter', nargs='+')
+    summary.add_argument('--subnet', dest='subnet_filter', nargs='+')
+
+    export = commands.add_parser('export', help='export a pcap to csv with tshark, keeping only the packets that pass the filters')
+    export.add_argument('pcap')
+    export.add_argument('csv')
+    export.add_argument('--vlan', dest='vlan_filter', type=int, nargs='+')
+    export.add_argument('--protocol', dest='protocol_filter', type=int, nargs='+')
+    export.add_argument('--time', dest='time_filter', type=float, nargs=2, metavar=('START', 'END'))
+    export.add_argument('--host', dest='host_filter', nargs='+')
+    export.add_argument('--subnet', dest='subnet_filter', nargs='+')
 
+    index = commands.add_parser('index', help='build the time index of a pcap or csv capture (time windows then seek into it)')
+    index.add_argument('capture')
+    index.add_argument('--every-packets', type=int, default=10_000)
+    index.add_argument('--every-seconds', type=float, default=1.0)
 
-# print("converting pcap to csv...")
-# input_file = "pcaps/single/f5-honeypot-release.pcap"
-# output_file = "files/event_traffic.csv"
-# subprocess.run(["./pcap_to_csv.sh", input_file, output_file], capture_output=False, text=True)
-# print("done coverting to csv")
-
-event_traffic_csv='files/synthetic_network_model_pcap_strict.csv'
-baseline_traffic_csv='files/synthetic_event_data.csv'
-event_file='files/event_file.csv'
-hostname_file=None #'files/ip_to_hostnames.txt'
-interval='1S'
-vlan_filter=None
-protocol_filter=None
-time_filter=None
-analyze(event_traffic_csv, baseline_traffic_csv, event_file, hostname_file, interval, vlan_filter, protocol_filter, time_filter)
\ No newline at end of file
+    commands.add_parser('metrics', help='list the metrics')
+    args = parser.parse_args()
+
+    if args.command == 'metrics':
+        for name, spec in METRICS.items():
+            baseline = ' and a baseline' if spec['baseline'] is True else ' (baseline optional)' if spec['baseline'] else ''
+            print(f"{name:<24} needs {spec['needs']}{baseline}")
+    elif args.command == 'summary':
+        summarize(args.capture, args.interval, args.chunksize, args.vlan_filter, args.protocol_filter, args.time_filter, args.host_filter, args.subnet_filter)
+    elif args.command == 'index':
+        from src.time_index import load_time_index
+        time_index = load_time_index(args.capture, args.every_packets, args.every_seconds)
+        if time_index is None:
+            print(f'{args.capture} has no time index (parquet files and pcapng files with simple packet blocks)')
+        else:
+            print(f"{len(time_index)} regions, {time_index.attrs['packets']} packets, {time_index['min_time'].min()} - {time_index['max_time'].max()}")
+    elif args.command == 'export':
+        from src.capture_filters import capture_filters, tshark_export
+        tshark_export(args.pcap, args.csv, capture_filters(args.vlan_filter, args.protocol_filter, args.time_filter, args.host_filter, args.subnet_filter))
+    else:
+        options = _options(args)
+        if args.event: options['event_traffic_csv'] = args.event
+        if args.command == 'metric': options['metrics'] = [args.metric]
+        analyze(**options)
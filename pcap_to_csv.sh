@@ -4,8 +4,9 @@
 # use the 'param_list.txt' file to change what paramters we want in the csv
 
 # Check if the correct number of arguments is provided
-if [ $# -ne 2 ]; then
-  echo "Usage: $0 <input_file> <output_file>"
+# (an optional display filter keeps only the matching packets, e.g. 'vlan.id == 20 && ip.addr == 10.0.1.0/24')
+if [ $# -lt 2 ] || [ $# -gt 3 ]; then
+  echo "Usage: $0 <input_file> <output_file> [display_filter]"
   exit 1
 fi
 
@@ -15,6 +16,10 @@ while read -r line; do
 filter="$filter -e $line"
 done < "files/param_list.txt"
 
-# build the csv (from one pcap file for now) todo: build csv from multiple pcal files
-tshark -T fields $filter -E header=y -r $1 > $2
+# build the csv (from one pcap file) - to merge many pcap files use: python ingest.py <dir or glob> <output.parquet>
+if [ -n "$3" ]; then
+  tshark -T fields $filter -E header=y -r $1 -Y "$3" > $2
+else
+  tshark -T fields $filter -E header=y -r $1 > $2
+fi
 
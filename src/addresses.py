@@ -0,0 +1,58 @@
+# ip/mac addresses are stored as integers - these convert them to and from their text form
+import numpy as np
+import pandas as pd
+
+
+def ipv4_to_int(text):
+    a, b, c, d = (int(x) for x in text.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def int_to_ipv4(value):
+    value = int(value)
+    return f'{value >> 24}.{(value >> 16) & 0xff}.{(value >> 8) & 0xff}.{value & 0xff}'
+
+
+def mac_to_int(text):
+    return int(text.replace(':', '').replace('-', ''), 16)
+
+
+def int_to_mac(value):
+    return ':'.join(f'{b:02x}' for b in int(value).to_bytes(6, 'big'))
+
+
+def _parse(series, parser, dtype):
+    # parse each distinct value once; missing values become 0
+    codes, uniques = pd.factorize(series)
+    values = np.array([parser(str(u)) for u in uniques] + [0], dtype=dtype)
+    return values[codes]  # code -1 (missing) picks the trailing 0
+
+
+def parse_ipv4(series):
+    """Dotted-quad strings -> uint32 array (missing -> 0)."""
+    return _parse(series, ipv4_to_int, np.uint32)
+
+
+def parse_mac(series):
+    """aa:bb:cc:dd:ee:ff strings -> uint64 array (missing -> 0)."""
+    return _parse(series, mac_to_int, np.uint64)
+
+
+def format_ipv4(values):
+    """uint32 addresses -> categorical of dotted-quad strings (each distinct address is formatted once)."""
+    codes, uniques = pd.factorize(np.asarray(values))
+    return pd.Categorical.from_codes(codes, categories=[int_to_ipv4(u) for u in uniques])
+
+
+def pair_key(src, dst):
+    """Pack two uint32 addresses into one uint64 key (src in the high half), e.g. for src->dst peers."""
+    return (np.asarray(src, dtype=np.uint64) << np.uint64(32)) | np.asarray(dst, dtype=np.uint64)
+
+
+def format_addresses(df, columns=('ip.src', 'ip.dst')):
+    """Return a copy of a (small) result table with its integer ip columns as text, for display or csv output."""
+    df = df.copy()
+    for col in columns:
+        if col in df.columns:
+            df[col] = format_ipv4(df[col]).astype(str)
+    return df
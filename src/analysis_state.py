@@ -0,0 +1,181 @@
+# persistent analysis state: the aggregates of every capture seen so far, updated with only the new packets
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+from src.capture_cache import HAVE_PARQUET
+from src.multi_ingest import expand_captures
+from src.pcap_reader import is_pcap_file, iter_pcap
+from src.pcap_to_pandas import clean_capture, label_traffic, filter_traffic
+from src.streaming import AGGREGATE_KEYS, aggregate_chunk, merge_aggregates, merge_table
+from src.traffic_cube import merge_cubes
+
+STATE_FILE = 'state.json'
+STATE_VERSION = 1
+TABLES = ['cube'] + list(AGGREGATE_KEYS)
+HEAD_SIZE = 64 * 1024  # bytes hashed from the start of each capture to notice files that were replaced
+TEXT_BLOCK = 64 * 1024 * 1024  # bytes of a tshark text export parsed at a time
+
+
+def _head_hash(path, size):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(min(size, HEAD_SIZE)), digest_size=16).hexdigest()
+
+
+def read_tables(directory, manifest_name, names):
+    # (manifest dict, {name: DataFrame}) of a directory written by write_tables, or None if there isn't one
+    manifest = os.path.join(directory, manifest_name)
+    if not os.path.exists(manifest):
+        return None
+    with open(manifest) as f:
+        meta = json.load(f)
+    return meta, {name: pd.read_parquet(os.path.join(directory, f'{name}.parquet')) for name in names}
+
+
+def write_tables(directory, manifest_name, meta, tables):
+    # tables first, the manifest last (written to a temp file and renamed), so an interrupted save
+    # leaves the previous manifest pointing at consistent tables at worst one update behind
+    os.makedirs(directory, exist_ok=True)
+    for name, table in tables.items():
+        path = os.path.join(directory, f'{name}.parquet')
+        table.to_parquet(path + '.tmp', compression='zstd', index=False)
+        os.replace(path + '.tmp', path)
+    manifest = os.path.join(directory, manifest_name)
+    with open(manifest + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(manifest + '.tmp', manifest)
+
+
+def load_state(state_dir):
+    """
+    Load a saved analysis state.
+
+    Returns:
+        dict: the aggregates (as returned by stream_capture, so every function that accepts those accepts
+        the state) plus 'files', the ledger of how far each capture has been read. None if there is no state.
+    """
+    saved = read_tables(state_dir, STATE_FILE, TABLES)
+    if saved is None:
+        return None
+    meta, tables = saved
+    if meta['version'] != STATE_VERSION:
+        raise ValueError(f'{state_dir} was written by another version of the state format, rebuild it')
+    state = {'interval': meta['interval'], 'filters': meta['filters'], 'files': meta['files'], **tables}
+    state['cube'].attrs['interval'] = meta['interval']
+    return state
+
+
+def save_state(state_dir, state):
+    meta = {'version': STATE_VERSION, 'interval': state['interval'], 'filters': state['filters'], 'files': state['files']}
+    write_tables(state_dir, STATE_FILE, meta, {name: state[name] for name in TABLES})
+
+
+def _pcap_chunks(path, offset, chunksize):
+    # decode the records after `offset` (a record boundary from the previous append)
+    for df in iter_pcap(path, batch_size=chunksize, start=offset or None):
+        yield clean_capture(df), df.attrs['end_offset']
+
+
+def _text_chunks(path, offset):
+    # parse the whole lines after `offset`; a partial last line is left for the next append
+    with open(path, 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n').split('\t')
+        pos = max(offset, f.tell())
+        f.seek(pos)
+        carry = b''
+        while True:
+            block = f.read(TEXT_BLOCK)
+            if not block:
+                break
+            block = carry + block
+            cut = block.rfind(b'\n') + 1
+            block, carry = block[:cut], block[cut:]
+            if not block:
+                continue
+            pos += len(block)
+            yield clean_capture(pd.read_csv(io.BytesIO(block), header=None, names=header, sep='\t')), pos
+
+
+def _new_chunks(path, entry, chunksize):
+    # (cleaned packets, offset read up to) for the part of the capture that hasn't been aggregated yet
+    size = os.path.getsize(path)
+    if entry is not None:
+        if size < entry['offset'] or _head_hash(path, entry['size']) != entry['head']:
+            raise ValueError(f'{path} was replaced or truncated since it was added to the state, rebuild the state')
+        if size == entry['size']:
+            return
+    offset = entry['offset'] if entry else 0
+    chunks = _pcap_chunks(path, offset, chunksize) if is_pcap_file(path) else _text_chunks(path, offset)
+    yield from chunks
+
+
+def update_aggregates(state, new):
+    """
+    Add the aggregates of new packets to the state.
+
+    Only the cube rows of the time bins the new packets fall in are re-summed, the rest of the
+    series is left as is. The host, conversation and port tables are small and re-summed whole.
+    """
+    cube, new_cube = state['cube'], new['cube']
+    affected = cube['frame.time_epoch'].isin(new_cube['frame.time_epoch'].unique())
+    updated = merge_cubes([cube[affected], new_cube])
+    state['cube'] = pd.concat([cube[~affected], updated], ignore_index=True)
+    state['cube'].attrs['interval'] = state['interval']
+    for name, key in AGGREGATE_KEYS.items():
+        state[name] = merge_table(pd.concat([state[name], new[name]], ignore_index=True), key)
+    return state
+
+
+def append_captures(state_dir, inputs, interval='1S', hostnames=None, chunksize=1_000_000, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None):
+    """
+    Add new capture files, or the packets appended to captures already in the state, to a persistent analysis state.
+
+    The state keeps the traffic cube (time-binned series), talker/receiver totals, conversation counts and
+    port histograms, plus how far each capture has been read. Captures that haven't changed are skipped, and
+    captures that grew (e.g. a ring buffer file that is still being written) are read from where the last
+    append stopped, so keeping an incident workspace current costs time proportional to the new traffic only.
+
+    Args:
+        state_dir (str): directory the state is kept in (created on first use)
+        inputs (str | list[str]): capture files, directories or glob patterns (pcap, pcapng or tshark csv exports)
+        interval (str): finest time bin of the cube; only used when the state is created
+        hostnames (dict): asset map from load_asset_map (or an {ip: hostname} dict) for the talker table labels
+        chunksize (int): packets decoded at a time
+        vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter: see capture_filters; only used when the state is created
+
+    Returns:
+        dict: the updated state, which can be passed to the time-series metrics, the top talker/receiver
+        functions, plot_port_protocol_activity and detect_new_or_rare_conversations
+    """
+    if not HAVE_PARQUET:
+        raise ImportError('append_captures needs pyarrow to store the state (pip install pyarrow)')
+
+    state = load_state(state_dir)
+    if state is None:
+        state = {'interval': interval, 'filters': {'vlan_filter': vlan_filter, 'protocol_filter': protocol_filter,
+                 'time_filter': time_filter, 'host_filter': host_filter, 'subnet_filter': subnet_filter}, 'files': {}}
+
+    changed = False
+    for path in expand_captures(inputs):
+        key = os.path.abspath(path)
+        entry = state['files'].get(key)
+        size = os.path.getsize(path)
+        offset = entry['offset'] if entry else 0
+        new = None
+        for df, offset in _new_chunks(path, entry, chunksize):
+            # filtered before the (costlier) labelling
+            df = label_traffic(filter_traffic(df, **state['filters']), hostnames)
+            if not df.empty:
+                new = merge_aggregates([new, aggregate_chunk(df, state['interval'])])
+        if entry is not None and size == entry['size']:
+            continue
+        if new is not None:
+            state = update_aggregates(state, new) if 'cube' in state else {**state, **new}
+        state['files'][key] = {'size': size, 'offset': offset, 'head': _head_hash(path, size)}
+        changed = True
+
+    if changed and 'cube' in state:
+        save_state(state_dir, state)
+    return state
@@ -1,27 +1,59 @@
+import numpy as np
 import pandas as pd
 
+MAX_EVENT_LABELS = 50  # with more events than this only the windows are drawn, not their labels
+
+def _event_arrays(events):
+    # start, end (NaT for point events) and label of every event with a start time
+    starts = pd.to_datetime(events['start_time']).to_numpy(dtype='datetime64[ns]')
+    ends = pd.to_datetime(events['end_time']).to_numpy(dtype='datetime64[ns]')
+    labels = events['label'].astype(str).to_numpy() if 'label' in events.columns else np.full(len(events), '', dtype=object)
+    valid = ~np.isnat(starts)
+    return starts[valid], ends[valid], labels[valid]
+
 # draws the event windows onto the graph
-def add_events_to_graph(ax, events):    
-    if events is not None:
-        for _, event in events.iterrows():
-            if pd.notnull(event['end_time']):
-                ax.axvspan(event['start_time'], event['end_time'], color='red', alpha=0.2)
-                ax.text(
-                    event['start_time'],
-                    ax.get_ylim()[1] * 0.999,
-                    event['label'],
-                    color='red',
-                    fontsize=9,
-                    verticalalignment='top'
-                )
-            else:
-                ax.axvline(event['start_time'], color='red', linestyle='--', linewidth=1)
-                ax.text(
-                    event['start_time'],
-                    ax.get_ylim()[1] * 0.999,
-                    event['label'],
-                    color='red',
-                    rotation=90,
-                    verticalalignment='top',
-                    fontsize=9
-                )
\ No newline at end of file
+# (all the windows as one collection and all the point events as another, instead of an artist per event)
+def add_events_to_graph(ax, events):
+    if events is None or not len(events):
+        return
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection, PolyCollection
+    from matplotlib.transforms import blended_transform_factory
+
+    starts, ends, labels = _event_arrays(events)
+    span = ~np.isnat(ends)
+    x0, x1 = mdates.date2num(starts), mdates.date2num(np.where(span, ends, starts))
+    # x in data coordinates, y in axes coordinates (the full height whatever the y limits)
+    transform = blended_transform_factory(ax.transData, ax.transAxes)
+    if span.any():
+        boxes = [[(a, 0), (a, 1), (b, 1), (b, 0)] for a, b in zip(x0[span], x1[span])]
+        ax.add_collection(PolyCollection(boxes, facecolors='red', edgecolors='none', alpha=0.2, transform=transform), autolim=False)
+    if (~span).any():
+        lines = [[(a, 0), (a, 1)] for a in x0[~span]]
+        ax.add_collection(LineCollection(lines, colors='red', linestyles='--', linewidths=1, transform=transform), autolim=False)
+    if len(starts) <= MAX_EVENT_LABELS:
+        for x, label, is_span in zip(x0, labels, span):
+            ax.text(x, 0.999, label, color='red', fontsize=9, verticalalignment='top', rotation=0 if is_span else 90, transform=transform)
+
+def event_shapes(events, y_max=1):
+    """
+    The events as plotly layout shapes (a rectangle per window, a dashed line per point event) and annotations
+    (up to MAX_EVENT_LABELS), to be set on a figure with one update_layout call.
+
+    Returns:
+        tuple: (shapes, annotations), lists of dicts
+    """
+    starts, ends, labels = _event_arrays(events)
+    span = ~np.isnat(ends)
+    x0 = pd.DatetimeIndex(starts).strftime('%Y-%m-%d %H:%M:%S.%f').to_numpy()
+    x1 = pd.DatetimeIndex(np.where(span, ends, starts)).strftime('%Y-%m-%d %H:%M:%S.%f').to_numpy()
+    shapes = [{'type': 'rect', 'xref': 'x', 'yref': 'paper', 'x0': a, 'x1': b, 'y0': 0, 'y1': 1, 'fillcolor': 'red',
+               'opacity': 0.2, 'line': {'width': 0}, 'layer': 'below'} if is_span else
+              {'type': 'line', 'xref': 'x', 'yref': 'paper', 'x0': a, 'x1': a, 'y0': 0, 'y1': 1,
+               'line': {'color': 'red', 'width': 1, 'dash': 'dash'}}
+              for a, b, is_span in zip(x0, x1, span)]
+    annotations = []
+    if len(starts) <= MAX_EVENT_LABELS:
+        annotations = [{'x': a, 'y': y_max, 'text': label, 'showarrow': True, 'arrowhead': 2, 'arrowsize': 1, 'arrowwidth': 2,
+                        'arrowcolor': 'red'} for a, label in zip(x0, labels)]
+    return shapes, annotations
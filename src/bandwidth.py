@@ -1,10 +1,7 @@
 import pandas as pd #sudo apt install python3-pandas
-import matplotlib.pyplot as plt
 import os
-import plotly.tools as tls
-import plotly.offline as py
-import plotly.graph_objs as go
 import src.my_plot as my_plot
+from src.traffic_cube import get_cube, cube_series
 
 
 def plot_bandwidth(df, graphs='overall', result='png', interval='1Min', save=False, save_path='plots/bandwidth/', events=None, rolling_window=None):
@@ -13,6 +10,7 @@ def plot_bandwidth(df, graphs='overall', result='png', interval='1Min', save=Fal
 
     Args:
         data (pd.DataFrame | list[baseline_df, event_df] of df (pd.DataFrame): DataFrame with 'frame.time_epoch', 'frame.len', 'vlan.id', and 'ip.proto'
+            (or a traffic cube from build_cube, or the aggregates returned by stream_capture)
         graphs (str | list[string]): Choose which graphs to plot (e.g. 'overall', 'vlan', 'protocol')
         interval (str): Resample interval (e.g., '1S', '1Min', '10Min')
         save (bool): If True, saves plots as PNGs
@@ -26,14 +24,14 @@ def plot_bandwidth(df, graphs='overall', result='png', interval='1Min', save=Fal
 
     
     # Group and convert to Mbps
-    grouped = df.groupby(['vlan.id', 'protocol', pd.Grouper(key='frame.time_epoch', freq=interval)])['frame.len'].sum().reset_index()
+    grouped = cube_series(get_cube(df, interval), ['vlan.id', 'protocol', 'frame.time_epoch'])
     grouped['bandwidth'] = (grouped['frame.len'] * 8) / (pd.to_timedelta(interval).total_seconds() * 10**6)
     
     # apply rolling window
     if rolling_window:
         grouped['bandwidth'] = grouped.groupby(['vlan.id', 'protocol'])['bandwidth'].transform(lambda x: x.rolling(window=rolling_window, min_periods=1).mean())
 
-    date = df['frame.time_epoch'].iloc[0].strftime("%d %b %Y")
+    date = grouped['frame.time_epoch'].min().strftime("%d %b %Y")
     if 'overall' in graphs:
         # plots one graph showing andwidth on each vlan where each vlan is a different line on the graph
         pivot = grouped.pivot_table(index='frame.time_epoch', columns='vlan.id', values='bandwidth', aggfunc='sum').fillna(0)
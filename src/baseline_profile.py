@@ -0,0 +1,81 @@
+# baseline profile: what the comparison functions need from the baseline capture, built once and saved
+import numpy as np
+import pandas as pd
+from src.analysis_state import read_tables, write_tables
+from src.capture_cache import HAVE_PARQUET
+from src.streaming import AGGREGATE_KEYS, aggregate_chunk, is_aggregated
+from src.traffic_cube import get_cube, cube_series
+
+PROFILE_FILE = 'profile.json'
+PROFILE_VERSION = 1
+PROFILE_TABLES = list(AGGREGATE_KEYS) + ['protocols', 'vlan_stats']
+STAT_QUANTILES = [0.5, 0.95, 0.99]
+
+
+def vlan_series_stats(cube):
+    """
+    Distribution of the per-bin bytes and packets of every VLAN (bins without traffic count as 0).
+
+    Returns:
+        pd.DataFrame: one row per VLAN with the number of bins and the mean, std, p50, p95, p99 and max
+        of 'bytes' and 'packets' per bin
+    """
+    series = cube_series(cube, ['vlan.id', 'frame.time_epoch'], ['frame.len', 'packet_count'])
+    bins = pd.date_range(series['frame.time_epoch'].min(), series['frame.time_epoch'].max(), freq=cube.attrs['interval'])
+    stats = pd.DataFrame({'vlan.id': np.sort(series['vlan.id'].unique())})
+    stats['bins'] = len(bins)
+    for value, name in [('frame.len', 'bytes'), ('packet_count', 'packets')]:
+        grid = series.pivot_table(index='frame.time_epoch', columns='vlan.id', values=value, aggfunc='sum')
+        grid = grid.reindex(index=bins, columns=stats['vlan.id'], fill_value=0).fillna(0)
+        stats[f'{name}_mean'] = grid.mean().to_numpy()
+        stats[f'{name}_std'] = grid.std(ddof=0).to_numpy()
+        for q, row in zip(STAT_QUANTILES, grid.quantile(STAT_QUANTILES).to_numpy()):
+            stats[f'{name}_p{round(q * 100)}'] = row
+        stats[f'{name}_max'] = grid.max().to_numpy()
+    return stats
+
+
+def build_profile(data, interval='1Min'):
+    """
+    Reduce baseline traffic to a profile the comparison functions can use in place of the packets.
+
+    Args:
+        data (pd.DataFrame | dict): labelled baseline packets, or aggregates (stream_capture / append_captures)
+        interval (str): time bin of the per-VLAN statistics (a multiple of the aggregates' interval)
+
+    Returns:
+        dict: per-host byte totals ('talkers', 'receivers'), conversation counts ('conversations'), port and
+        protocol counts ('src_ports', 'dst_ports', 'protocols') and per-VLAN time-series statistics
+        ('vlan_stats'). compare_top_talkers, compare_top_receivers, plot_port_protocol_activity,
+        detect_new_or_rare_conversations and lateral_movement_analysis accept it as the baseline.
+    """
+    aggregates = data if is_aggregated(data) else aggregate_chunk(data, interval)
+    cube = get_cube(aggregates, interval)
+    profile = {name: aggregates[name] for name in AGGREGATE_KEYS}
+    profile['protocols'] = cube.groupby('ip.proto')[['packet_count', 'frame.len']].sum().reset_index()
+    profile['vlan_stats'] = vlan_series_stats(cube)
+    profile['interval'] = interval
+    return profile
+
+
+def is_profile(data):
+    return isinstance(data, dict) and 'vlan_stats' in data
+
+
+def save_profile(profile_dir, profile):
+    """Save a baseline profile (one zstd parquet file per table) to a directory."""
+    if not HAVE_PARQUET:
+        raise ImportError('save_profile needs pyarrow (pip install pyarrow)')
+    write_tables(profile_dir, PROFILE_FILE, {'version': PROFILE_VERSION, 'interval': profile['interval']},
+                 {name: profile[name] for name in PROFILE_TABLES})
+
+
+def load_profile(profile_dir):
+    """Load a baseline profile saved with save_profile, or return None if there is none."""
+    saved = read_tables(profile_dir, PROFILE_FILE, PROFILE_TABLES)
+    if saved is None:
+        return None
+    meta, tables = saved
+    if meta['version'] != PROFILE_VERSION:
+        raise ValueError(f'{profile_dir} was written by another version of the profile format, rebuild it')
+    return {'interval': meta['interval'], **tables}
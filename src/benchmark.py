@@ -0,0 +1,264 @@
+# benchmark harness: time and measure the memory of ingestion and of every analysis entry point on synthetic
+# captures of several sizes, and keep the results (per commit) so regressions can be found
+import os
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # plots are written to files, never shown
+from src.synthetic_capture import generate_capture
+from src.pcap_to_pandas import read_pcap_csv, label_traffic
+from src.streaming import stream_capture
+from src.traffic_cube import build_cube
+from src.flows import assemble_flows
+from src.instrumentation import peak_rss
+from src.bandwidth import plot_bandwidth
+from src.burst_detection import detect_bandwidth_bursts
+from src.packet_count import plot_packet_count
+from src.packet_size import plot_avg_packet_sizes
+from src.protocol_entropy import calculate_protocol_entropy
+from src.plot_jitter_over_time import plot_jitter
+from src.jitter import stream_jitter
+from src.top_talkers import compare_top_talkers, compare_top_receivers
+from src.unusual_ports_protocols import plot_port_protocol_activity
+from src.new_rare_conversations import detect_new_or_rare_conversations
+from src.lateral_movement_analysis import lateral_movement_analysis, stream_lateral_movement
+from src.my_plot import wait_for_plots
+
+RESULTS_FILE = 'benchmarks/results.jsonl'
+DATA_DIR = 'benchmarks/data'
+INTERVAL = '1S'
+STREAM_SIZE = 10_000_000  # captures of at least this many packets are only streamed, never read whole
+
+# analysis entry points, run on ctx = {'event', 'baseline' (labelled packets), 'event_cube', 'event_flows',
+# 'baseline_flows', 'plots' (output directory)} - the first half of the capture is the baseline, the second the event
+ENTRY_POINTS = {
+    'build_cube': lambda ctx: build_cube(ctx['event'], INTERVAL),
+    'assemble_flows': lambda ctx: assemble_flows(ctx['event']),
+    'plot_bandwidth': lambda ctx: plot_bandwidth(ctx['event_cube'], graphs=['overall', 'vlan', 'protocol'], interval=INTERVAL, save=True, save_path=f"{ctx['plots']}/bandwidth/"),
+    'detect_bandwidth_bursts': lambda ctx: detect_bandwidth_bursts(ctx['event_cube'], interval=INTERVAL, plot=False),
+    'plot_packet_count': lambda ctx: plot_packet_count(ctx['event_cube'], graphs=['overall', 'vlan', 'protocol'], interval=INTERVAL, save=True, save_path=f"{ctx['plots']}/packet_count/"),
+    'plot_avg_packet_sizes': lambda ctx: plot_avg_packet_sizes(ctx['event_cube'], graphs=['overall', 'vlan', 'protocol'], interval=INTERVAL, save=True, save_path=f"{ctx['plots']}/avg_packet_size/"),
+    'calculate_protocol_entropy': lambda ctx: calculate_protocol_entropy(ctx['event_cube'], save=True, save_path=f"{ctx['plots']}/entropy/"),
+    'plot_jitter': lambda ctx: plot_jitter(ctx['event'], save=True, save_path=f"{ctx['plots']}/jitter/"),
+    'compare_top_talkers': lambda ctx: compare_top_talkers(ctx['baseline_flows'], ctx['event_flows'], save=True, save_path=f"{ctx['plots']}/top_talkers/"),
+    'compare_top_receivers': lambda ctx: compare_top_receivers(ctx['baseline_flows'], ctx['event_flows'], save=True, save_path=f"{ctx['plots']}/top_receivers/"),
+    'plot_port_protocol_activity': lambda ctx: plot_port_protocol_activity(ctx['baseline_flows'], ctx['event_flows'], save=True, save_path=f"{ctx['plots']}/port_protocol_activity/"),
+    'detect_new_or_rare_conversations': lambda ctx: detect_new_or_rare_conversations(ctx['baseline_flows'], ctx['event_flows']),
+    'lateral_movement_analysis': lambda ctx: lateral_movement_analysis(ctx['event_flows'], ctx['baseline_flows'], save=True, save_path=f"{ctx['plots']}/lateral/"),
+}
+
+# the entry points on captures of at least STREAM_SIZE packets, where ctx holds the streamed aggregates of each half
+# instead ('event_cube', 'event_flows' and 'baseline_flows' are the aggregates too) plus 'path', 'event_windows' and
+# 'chunksize'. assemble_flows needs the packets in memory and has no streamed form.
+STREAM_ENTRY_POINTS = {
+    'build_cube': lambda ctx: stream_capture(ctx['path'], INTERVAL, ctx['chunksize'], time_windows=ctx['event_windows']),
+    **{name: ENTRY_POINTS[name] for name in ['plot_bandwidth', 'detect_bandwidth_bursts', 'plot_packet_count', 'plot_avg_packet_sizes',
+                                             'calculate_protocol_entropy', 'compare_top_talkers', 'compare_top_receivers',
+                                             'plot_port_protocol_activity', 'detect_new_or_rare_conversations']},
+    'plot_jitter': lambda ctx: plot_jitter(None, save=True, save_path=f"{ctx['plots']}/jitter/",
+                                           stats=stream_jitter(ctx['path'], chunksize=ctx['chunksize'], time_windows=ctx['event_windows'])),
+    'lateral_movement_analysis': lambda ctx: stream_lateral_movement(ctx['path'], ctx['baseline'], chunksize=ctx['chunksize'], save=True,
+                                                                     save_path=f"{ctx['plots']}/lateral/", time_windows=ctx['event_windows']),
+}
+
+
+def _rows(result):
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, dict) and isinstance(result.get('cube'), pd.DataFrame):
+        return len(result['cube'])
+    return None
+
+
+def measure(fn, memory=True):
+    """
+    Run fn() once and measure it.
+
+    Returns:
+        tuple: (result, {'seconds', 'cpu_seconds', 'peak_bytes' (tracemalloc peak above the start, or None),
+        'max_rss_bytes' (process high-water mark so far), 'rows_out', 'error'})
+    """
+    if memory:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result, error = None, None
+    try:
+        result = fn()
+        wait_for_plots()
+    except Exception as e:  # a broken entry point is recorded, not fatal
+        error = f'{type(e).__name__}: {e}'
+    stats = {'seconds': time.perf_counter() - wall, 'cpu_seconds': time.process_time() - cpu, 'peak_bytes': None}
+    if memory:
+        stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    stats['max_rss_bytes'] = peak_rss()
+    stats['rows_out'] = _rows(result)
+    stats['error'] = error
+    return result, stats
+
+
+def _timed(fn, repeat, memory):
+    # best time of `repeat` untraced runs, then one traced run for the memory peak (tracemalloc slows the run down)
+    result, best = None, None
+    for _ in range(repeat):
+        result, stats = measure(fn, memory=False)
+        if best is None or stats['seconds'] < best['seconds']:
+            best = stats
+    if memory and best['error'] is None:
+        result, traced = measure(fn, memory=True)
+        best['peak_bytes'] = traced['peak_bytes']
+    return result, best
+
+
+def git_commit():
+    """Short hash of HEAD, with '-dirty' if the working tree has changes (None outside a git checkout)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+def capture_files(packets, hosts, vlans, flows, data_dir=DATA_DIR, formats=('csv', 'pcap'), seed=0):
+    """Generate (once) the synthetic capture for a size and return {format: path}."""
+    os.makedirs(data_dir, exist_ok=True)
+    stem = f'{data_dir}/synthetic_{packets}p_{hosts}h_{vlans}v_{flows}f_s{seed}'
+    paths = {fmt: f'{stem}.{fmt}' for fmt in formats}
+    missing = {fmt: path for fmt, path in paths.items() if not os.path.exists(path)}
+    if missing:
+        generate_capture(packets, missing.get('csv'), missing.get('pcap'), hosts, vlans, flows, seed=seed)
+    return paths
+
+
+def _streamed_context(path, aggregates, chunksize):
+    # split a streamed capture at the time bin boundary closest to half of its packets and stream each half
+    counts = aggregates['cube'].groupby('frame.time_epoch')['packet_count'].sum()
+    first, last = counts.index[0], counts.index[-1] + pd.Timedelta(INTERVAL)
+    if len(counts) > 1:
+        half = counts.index[1 + int(np.abs(counts.cumsum().to_numpy()[:-1] - counts.sum() / 2).argmin())]
+    else:
+        half = first + pd.Timedelta(INTERVAL) / 2
+    ctx = {'path': path, 'chunksize': chunksize, 'event_windows': [(half, last)], 'event_rows': int(counts[counts.index >= half].sum())}
+    ctx['baseline'] = stream_capture(path, INTERVAL, chunksize, time_windows=[(first, half - pd.Timedelta(1, 'ns'))])
+    ctx['event'] = stream_capture(path, INTERVAL, chunksize, time_windows=ctx['event_windows'])
+    ctx['event_cube'] = ctx['event_flows'] = ctx['event']
+    ctx['baseline_flows'] = ctx['baseline']
+    return ctx
+
+
+def run_benchmark(sizes, hosts=200, vlans=4, flows=20_000, formats=('csv', 'pcap'), entry_points=None, repeat=1, memory=True,
+                  results_file=RESULTS_FILE, data_dir=DATA_DIR, chunksize=1_000_000, stream_size=STREAM_SIZE):
+    """
+    Benchmark ingestion and the analysis entry points on synthetic captures of each size.
+
+    Per size and format the capture is read whole (read_pcap_csv, no cache) and streamed (stream_capture); the
+    entry points run once per size on the packets of the first format. Captures of at least stream_size packets
+    are only streamed, and the entry points run on the streamed aggregates (see STREAM_ENTRY_POINTS) - the ones
+    that need every packet in memory are skipped, so large sizes measure the out-of-core path.
+
+    Args:
+        sizes (list[int]): capture sizes in packets
+        entry_points (list[str]): names from ENTRY_POINTS (default: all)
+        repeat (int): runs per stage (the fastest is kept)
+        memory (bool): also measure the allocation peak of each stage (one extra, traced run)
+        results_file (str): json lines file the results are appended to
+        stream_size (int): captures of at least this many packets are only streamed
+
+    Returns:
+        pd.DataFrame: one row per (size, format, stage)
+    """
+    names = entry_points or list(ENTRY_POINTS)
+    run = {'commit': git_commit(), 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+           'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+           'machine': platform.machine(), 'cpus': os.cpu_count()}
+    records = []
+
+    def record(packets, fmt, stage, stats, rows_in):
+        records.append(dict(run, packets=packets, hosts=hosts, vlans=vlans, flows=flows, format=fmt, stage=stage, rows_in=rows_in, **stats))
+        print(f"{packets:>12} {fmt:<5} {stage:<34} {stats['seconds']:9.3f}s" + (f"  {stats['peak_bytes'] / 2**20:9.1f} MiB" if stats['peak_bytes'] else '')
+              + (f"  {stats['error']}" if stats['error'] else ''))
+
+    for packets in sizes:
+        paths = capture_files(packets, hosts, vlans, flows, data_dir, formats)
+        streamed = packets >= stream_size
+        df, aggregates = None, None
+        for fmt, path in paths.items():
+            if not streamed:
+                ingested, stats = _timed(lambda: read_pcap_csv(path, cache=False), repeat, memory)
+                record(packets, fmt, 'read_pcap_csv', stats, packets)
+                df = ingested if df is None else df
+                del ingested
+            result, stats = _timed(lambda: stream_capture(path, INTERVAL, chunksize), repeat, memory)
+            record(packets, fmt, 'stream_capture', stats, packets)
+            aggregates = result if aggregates is None else aggregates
+            del result
+
+        if streamed:
+            if aggregates is None:
+                continue
+            print(f'{packets} packets: streaming only (stream_size={stream_size}), entry points run on the aggregates')
+            ctx, entry_fns = _streamed_context(next(iter(paths.values())), aggregates, chunksize), STREAM_ENTRY_POINTS
+        else:
+            if df is None:
+                continue
+            df = label_traffic(df)
+            half = df['frame.time_epoch'].iloc[len(df) // 2]
+            ctx = {'baseline': df[df['frame.time_epoch'] < half], 'event': df[df['frame.time_epoch'] >= half]}
+            ctx['event_rows'] = len(ctx['event'])
+            ctx['event_cube'] = build_cube(ctx['event'], INTERVAL)
+            ctx['event_flows'] = assemble_flows(ctx['event'])
+            ctx['baseline_flows'] = assemble_flows(ctx['baseline'])
+            entry_fns = ENTRY_POINTS
+        with tempfile.TemporaryDirectory() as plots:
+            ctx['plots'] = plots
+            for name in names:
+                if name not in entry_fns:
+                    print(f'skipping {name} at {packets} packets: it needs the packets in memory')
+                    continue
+                _, stats = _timed(lambda: entry_fns[name](ctx), repeat, memory)
+                record(packets, next(iter(paths)), name, stats, ctx['event_rows'])
+        del df, aggregates, ctx
+
+    if results_file:
+        os.makedirs(os.path.dirname(results_file) or '.', exist_ok=True)
+        with open(results_file, 'a') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+    return pd.DataFrame(records)
+
+
+def load_results(results_file=RESULTS_FILE):
+    """All stored benchmark results as a DataFrame."""
+    with open(results_file) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare_results(base, new, results_file=RESULTS_FILE):
+    """
+    Compare the stored results of two commits (hash prefixes; the latest run of each wins).
+
+    Returns:
+        pd.DataFrame: per (packets, format, stage) the seconds and peak bytes of both commits and new/base ratios
+        (> 1 is a regression)
+    """
+    results = load_results(results_file)
+    keys = ['packets', 'format', 'stage']
+    sides = []
+    for name, commit in (('base', base), ('new', new)):
+        rows = results[results['commit'].fillna('').str.startswith(commit)]
+        if rows.empty:
+            raise ValueError(f'no benchmark results for commit {commit}')
+        rows = rows.sort_values('timestamp').groupby(keys).last()[['seconds', 'peak_bytes']]
+        sides.append(rows.add_suffix(f'_{name}'))
+    table = sides[0].join(sides[1], how='inner')
+    table['seconds_ratio'] = table['seconds_new'] / table['seconds_base']
+    table['peak_ratio'] = table['peak_bytes_new'] / table['peak_bytes_base']
+    return table.reset_index().sort_values(keys, ignore_index=True)
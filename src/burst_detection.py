@@ -1,40 +1,179 @@
-
 import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from src.traffic_cube import get_cube, cube_series
+from src.rollup_pyramid import is_pyramid, pyramid_hosts
+from src.pcap_to_pandas import iter_pcap_csv
+from src.capture_filters import capture_filters
+from src.addresses import int_to_ipv4
+from src.capture_schema import protocol_names
+from src.my_plot import plot_job
+
+# series the bursts can be scored per
+BURST_KEYS = {'vlan': ['vlan.id'], 'vlan_protocol': ['vlan.id', 'protocol'], 'host': ['ip.src']}
+EVENT_COLUMNS = ['key', 'time_bin', 'bandwidth_mbps', 'expected_mbps', 'score']
+
+
+def bandwidth_series(df, by='vlan', interval='1Min'):
+    # Mbps per (series, time bin), ordered by series then time
+    keys = BURST_KEYS[by]
+    if by == 'host' and is_pyramid(df):
+        # a rollup pyramid keeps bytes per source host
+        traffic = pyramid_hosts(df, interval).rename(columns={'frame.time_epoch': 'time_bin'})
+    elif by == 'host':
+        # hosts aren't in the cube, so this one needs the packets (or a rollup pyramid)
+        if isinstance(df, dict) or 'packet_count' in df.columns:
+            raise ValueError("per-host bursts need the packets or a rollup pyramid, not aggregates")
+        traffic = df.groupby([df['ip.src'], df['frame.time_epoch'].dt.floor(interval).rename('time_bin')])['frame.len'].sum().reset_index()
+    else:
+        traffic = cube_series(get_cube(df, interval), keys + ['frame.time_epoch'])
+        traffic = traffic.rename(columns={'frame.time_epoch': 'time_bin'})
+    traffic['bandwidth_mbps'] = (traffic['frame.len'] * 8) / (pd.to_timedelta(interval).total_seconds() * 10**6)
+    return traffic.sort_values(keys + ['time_bin'], ignore_index=True)
+
+
+def _series_name(by, key):
+    if by == 'vlan':
+        return f'VLAN {key}'
+    if by == 'host':
+        return int_to_ipv4(key)
+    return f'VLAN {key[0]} - {key[1]}'
+
 
-def detect_bandwidth_bursts(df, interval='1Min', z_thresh=2.5, rolling_window=10, plot=True, save=False, save_path="plots/burst/"):
+def detect_bandwidth_bursts(df, interval='1Min', z_thresh=2.5, rolling_window=10, plot=True, save=False, save_path="plots/burst/", by='vlan'):
+    """
+    Flag time bins whose bandwidth is more than z_thresh rolling standard deviations from the rolling mean.
+
+    Every series is scored in one grouped rolling pass.
+
+    Args:
+        df: packets, a traffic cube, the aggregates returned by stream_capture or a rollup pyramid (by='host'
+            needs the packets or a pyramid)
+        by (str): score each 'vlan', each 'vlan_protocol' combination or each 'host' (source ip)
+
+    Returns:
+        pd.DataFrame: the series with 'rolling_avg', 'rolling_std', 'zscore' and 'is_burst'
+    """
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    df = df.copy()
-    
-    # Group by interval and VLAN
-    df['time_bin'] = df['frame.time_epoch'].dt.floor(interval)
-    traffic = df.groupby(['vlan.id', 'time_bin'])['frame.len'].sum().reset_index()
-    traffic['bandwidth_mbps'] = (traffic['frame.len'] * 8) / (pd.to_timedelta(interval).total_seconds() * 10**6)
+    # Group by interval and series (df can also be a traffic cube or the aggregates returned by stream_capture)
+    keys = BURST_KEYS[by]
+    traffic = bandwidth_series(df, by, interval)
+    rolling = traffic.groupby(keys, sort=False)['bandwidth_mbps'].rolling(rolling_window, min_periods=1)
+    traffic['rolling_avg'] = rolling.mean().droplevel(list(range(len(keys))))
+    traffic['rolling_std'] = rolling.std().droplevel(list(range(len(keys))))
+    traffic['zscore'] = (traffic['bandwidth_mbps'] - traffic['rolling_avg']) / traffic['rolling_std']
+    traffic['is_burst'] = (traffic['zscore'] > z_thresh) | (traffic['zscore'] < -1*z_thresh)
+
+    if plot:
+        for key, series in traffic.groupby(keys if len(keys) > 1 else keys[0], sort=False):
+            # every VLAN is plotted, the (many) protocol and host series only when they have a burst
+            if by != 'vlan' and not series['is_burst'].any():
+                continue
+            name = _series_name(by, key)
+            bursts = series[series['is_burst']]
+            plot_job({'lines': [(series['time_bin'].to_numpy(), series['bandwidth_mbps'].to_numpy(), {'label': 'Bandwidth (Mbps)'})],
+                      'scatter': [(bursts['time_bin'].to_numpy(), bursts['bandwidth_mbps'].to_numpy(), {'color': 'red', 'label': 'Burst', 'zorder': 5})],
+                      'title': f'Bandwidth and Bursts for {name}\nZ-threshold = {z_thresh}', 'x_label': 'Time',
+                      'y_label': 'Bandwidth (Mbps)', 'legend': True,
+                      'filename': f'{save_path}Bandwidth and Bursts for {name}.png'}, save=save)
+
+    return traffic
+
+
+def new_burst_state(alpha=0.1, z_thresh=3.5, warmup=10, method='ewma'):
+    """
+    State of the online burst detector: a few numbers per series, kept in flat arrays.
+
+    Args:
+        alpha (float): EWMA weight of the newest bin (~2/alpha bins of memory)
+        z_thresh (float): score above which a bin is a burst (either direction)
+        warmup (int): bins a series needs before it can raise a burst
+        method (str): 'ewma' scores with the EWMA standard deviation, 'mad' with the EWMA of the
+            absolute deviation (less inflated by the bursts themselves)
+    """
+    return {'alpha': alpha, 'z_thresh': z_thresh, 'warmup': warmup, 'method': method,
+            'index': {}, 'mean': np.zeros(0), 'var': np.zeros(0), 'mad': np.zeros(0), 'n': np.zeros(0, dtype=np.int64)}
+
+
+def _slots(state, keys):
+    # array slot of every series key, growing the arrays for new series
+    index = state['index']
+    slots = np.fromiter((index.setdefault(k, len(index)) for k in keys), dtype=np.int64, count=len(keys))
+    grow = len(index) - len(state['n'])
+    if grow > 0:
+        for name in ('mean', 'var', 'mad', 'n'):
+            state[name] = np.concatenate([state[name], np.zeros(grow, dtype=state[name].dtype)])
+    return slots
+
+
+def update_bursts(state, series):
+    """
+    Feed complete time bins to the online detector.
+
+    Args:
+        state (dict): from new_burst_state, updated in place
+        series (pd.DataFrame): 'key' (series id, e.g. vlan), 'time_bin' and 'bandwidth_mbps', one row per key and bin
+
+    Returns:
+        pd.DataFrame: the rows that are bursts, with the expected bandwidth and the score
+    """
+    alpha, events = state['alpha'], []
+    for time_bin, rows in series.sort_values('time_bin', kind='stable').groupby('time_bin', sort=False):
+        slots = _slots(state, rows['key'].tolist())
+        x = rows['bandwidth_mbps'].to_numpy(dtype=float)
+        mean, var, mad, n = state['mean'][slots], state['var'][slots], state['mad'][slots], state['n'][slots]
+
+        # score against the state before this bin
+        spread = np.sqrt(var) if state['method'] == 'ewma' else 1.2533 * mad
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = np.where(spread > 0, (x - mean) / spread, 0.0)
+        burst = (n >= state['warmup']) & (np.abs(score) > state['z_thresh'])
+        if burst.any():
+            events.append(pd.DataFrame(dict(zip(EVENT_COLUMNS, [rows['key'].to_numpy()[burst], time_bin, x[burst], mean[burst], score[burst]]))))
+
+        # then update it (a series' first bin initializes its mean)
+        delta = np.where(n > 0, x - mean, 0.0)
+        state['mean'][slots] = np.where(n > 0, mean + alpha * delta, x)
+        state['var'][slots] = (1 - alpha) * (var + alpha * delta ** 2)
+        state['mad'][slots] = (1 - alpha) * mad + alpha * np.abs(delta)
+        state['n'][slots] = n + 1
+
+    if not events:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    return pd.concat(events, ignore_index=True)
+
+
+def stream_bursts(pcap_csv_file_path, interval='1Min', by='vlan', chunksize=1_000_000, state=None, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None):
+    """
+    Online burst detection over a capture read in chunks (for live or very long captures).
+
+    A bin is scored once a chunk starts after it, so only the open bin is held back between chunks.
+    The capture is expected in time order.
+
+    Returns:
+        pd.DataFrame: burst events ('key' is the vlan id, (vlan id, protocol) or source ip, see BURST_KEYS)
+    """
+    state = state or new_burst_state()
+    keys = BURST_KEYS[by]
+    pending, events = None, []
+    for df in iter_pcap_csv(pcap_csv_file_path, chunksize=chunksize, filters=capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows)):
+        if by == 'vlan_protocol':
+            df = df.assign(protocol=protocol_names(df['ip.proto']).astype(str))
+        cells = df.groupby(keys + [df['frame.time_epoch'].dt.floor(interval).rename('time_bin')])['frame.len'].sum().reset_index()
+        cells = pd.concat([pending, cells], ignore_index=True).groupby(keys + ['time_bin'], sort=False)['frame.len'].sum().reset_index()
+        closed = cells['time_bin'] < df['frame.time_epoch'].min().floor(interval)
+        events.append(_score_cells(state, cells[closed], keys, interval))
+        pending = cells[~closed]
+    if pending is not None:
+        events.append(_score_cells(state, pending, keys, interval))
+    events = [e for e in events if len(e)]
+    return pd.concat(events, ignore_index=True) if events else pd.DataFrame(columns=EVENT_COLUMNS)
+
 
-    for vlan in traffic['vlan.id'].unique():
-        vlan_data = traffic[traffic['vlan.id'] == vlan].copy()
-        vlan_data['rolling_avg'] = vlan_data['bandwidth_mbps'].rolling(rolling_window, min_periods=1).mean()
-        vlan_data['rolling_std'] = vlan_data['bandwidth_mbps'].rolling(rolling_window, min_periods=1).std()
-        vlan_data['zscore'] = (vlan_data['bandwidth_mbps'] - vlan_data['rolling_avg']) / vlan_data['rolling_std']
-        vlan_data['is_burst'] = (vlan_data['zscore'] > z_thresh) | (vlan_data['zscore'] < -1*z_thresh)
-
-        if plot:
-            plt.figure(figsize=(12, 4))
-            plt.plot(vlan_data['time_bin'], vlan_data['bandwidth_mbps'], label='Bandwidth (Mbps)')
-            plt.scatter(vlan_data[vlan_data['is_burst']]['time_bin'],
-                        vlan_data[vlan_data['is_burst']]['bandwidth_mbps'],
-                        color='red', label='Burst', zorder=5)
-            plt.title(f'Bandwidth and Bursts for VLAN {vlan}\nZ-threshold = {z_thresh}')
-            plt.xlabel('Time')
-            plt.ylabel('Bandwidth (Mbps)')
-            plt.grid(True)
-            plt.legend()
-            plt.tight_layout()
-            if save:
-                plt.savefig(f'{save_path}Bandwidth and Bursts for VLAN {vlan}.png')
-                plt.close()
-            else:
-                plt.show()
+def _score_cells(state, cells, keys, interval):
+    key = list(zip(*(cells[k] for k in keys))) if len(keys) > 1 else cells[keys[0]].tolist()
+    series = pd.DataFrame({'key': key, 'time_bin': cells['time_bin'].to_numpy(),
+                           'bandwidth_mbps': cells['frame.len'].to_numpy() * 8 / (pd.to_timedelta(interval).total_seconds() * 10**6)})
+    return update_bursts(state, series)
@@ -0,0 +1,125 @@
+# columnar (parquet) cache of parsed captures so reruns skip the csv parse
+import glob
+import hashlib
+import importlib.util
+import os
+
+import pandas as pd
+from src.capture_filters import apply_filters, parquet_filters
+
+# pandas needs pyarrow for parquet (looked up, not imported - pandas imports it when it is used)
+HAVE_PARQUET = importlib.util.find_spec('pyarrow') is not None
+
+CACHE_DIR = '.pcap_cache'
+CACHE_VERSION = 2  # bump when the cleaned schema changes so old cache files are ignored
+
+SAMPLE_SIZE = 1 << 20  # bytes hashed from the start, middle and end of the source file
+# rows per parquet row group: small enough that a time window skips most of a (time-ordered) capture
+ROW_GROUP_ROWS = 262_144
+
+
+def capture_fingerprint(path):
+    """
+    Fingerprint a capture by absolute path, size, mtime and a hash of its content.
+
+    The content hash covers the first, middle and last MiB of the file so it stays cheap on multi-GB captures
+    while still catching files that were rewritten in place with the same size and mtime.
+    """
+    stat = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{CACHE_VERSION}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, stat.st_size // 2 - SAMPLE_SIZE // 2), max(0, stat.st_size - SAMPLE_SIZE)}):
+            f.seek(offset)
+            h.update(f.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def cache_file(path):
+    # the cache lives next to the source: <dir>/.pcap_cache/<name>.<fingerprint>.parquet
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIR, f'{name}.{capture_fingerprint(path)}.parquet')
+
+
+def load_cached_capture(path, filters=None):
+    """Return the cached DataFrame for a capture (only the packets passing `filters`, see capture_filters), or None if there is no valid cache entry."""
+    if not HAVE_PARQUET:
+        return None
+    cached = cache_file(path)
+    if not os.path.exists(cached):
+        return None
+    return apply_filters(pd.read_parquet(cached, filters=parquet_filters(filters)), filters)
+
+
+def iter_cached_capture(path, chunksize, filters=None):
+    """Yield the cached capture in chunks of at most `chunksize` rows, or return None if it isn't cached."""
+    if not HAVE_PARQUET:
+        return None
+    cached = cache_file(path)
+    if not os.path.exists(cached):
+        return None
+
+    return iter_parquet(cached, chunksize, filters)
+
+
+def iter_parquet(path, chunksize, filters=None):
+    # stream a parquet file in record batches instead of loading every row group at once
+    # (with filters, row groups that can't match are skipped and the rest is filtered before the pandas conversion)
+    import pyarrow.parquet as pq
+    if filters:
+        import pyarrow.dataset as ds
+        batches = ds.dataset(path, format='parquet').to_batches(filter=pq.filters_to_expression(parquet_filters(filters)), batch_size=chunksize)
+        return (apply_filters(batch.to_pandas(), filters) for batch in batches if batch.num_rows)
+    return (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+
+
+def save_cached_capture(path, df):
+    """Store a cleaned capture in the cache and remove entries left over from older versions of the file."""
+    if not HAVE_PARQUET:
+        return None
+    cached = cache_file(path)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+
+    # write to a temp file first so an interrupted run never leaves a truncated cache behind
+    tmp = f'{cached}.tmp'
+    df.to_parquet(tmp, compression='zstd', index=False, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp, cached)
+    _remove_stale(path, cached)
+    return cached
+
+
+def cache_chunks(path, chunks):
+    """
+    Pass cleaned chunks of a capture through while writing them to its cache entry, so a chunked (or filtered)
+    read also leaves the columnar copy behind. The entry is only kept if every chunk was read.
+    """
+    if not HAVE_PARQUET:
+        yield from chunks
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    cached = cache_file(path)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    tmp = f'{cached}.tmp'
+    writer = None
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression='zstd')
+            writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+            yield df
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp, cached)
+        _remove_stale(path, cached)
+
+
+def _remove_stale(path, cached):
+    name = os.path.basename(path)
+    for stale in glob.glob(os.path.join(os.path.dirname(cached), f'{glob.escape(name)}.*.parquet')):
+        if stale != cached:
+            os.remove(stale)
+    return cached
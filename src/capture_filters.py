@@ -0,0 +1,173 @@
+# vlan / protocol / time (window) / host / subnet filters, pushed down to where the capture is read: a tshark display
+# filter (-Y) when exporting, parquet predicates (row groups whose statistics can't match are skipped) for the
+# cache and merged datasets, and a vectorized mask for chunks decoded from pcap/csv before they are labelled
+import ipaddress
+import subprocess
+import numpy as np
+import pandas as pd
+from src.addresses import ipv4_to_int, int_to_ipv4
+
+
+def capture_filters(vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None):
+    """
+    Normalize the filter arguments.
+
+    Args:
+        vlan_filter (list[int]): vlan ids to keep
+        protocol_filter (list[int]): ip.proto numbers to keep
+        time_filter (tuple): (start, end) epoch seconds, both inclusive
+        host_filter (list[str]): addresses to keep packets from or to
+        subnet_filter (list[str]): CIDR blocks (e.g. '10.0.1.0/24') to keep packets from or to
+        time_windows (list[tuple]): (start, end) windows (epoch seconds or timestamps, both inclusive) to keep
+            packets from, e.g. the event windows of read_events.event_windows
+
+    Returns:
+        dict: the filters ('vlan', 'proto', 'time', 'hosts', 'subnets' as (first, last) address, 'windows'),
+        or None if there are none
+    """
+    filters = {}
+    if vlan_filter is not None:
+        filters['vlan'] = sorted(int(v) for v in vlan_filter)
+    if protocol_filter is not None:
+        filters['proto'] = sorted(int(p) for p in protocol_filter)
+    if time_filter is not None:
+        filters['time'] = (_timestamp(time_filter[0]), _timestamp(time_filter[1]))
+    if host_filter is not None:
+        filters['hosts'] = sorted(ipv4_to_int(h) if isinstance(h, str) else int(h) for h in host_filter)
+    if subnet_filter is not None:
+        networks = [ipaddress.ip_network(s, strict=False) for s in subnet_filter]
+        filters['subnets'] = [(int(n.network_address), int(n.broadcast_address)) for n in networks]
+    if time_windows is not None:
+        filters['windows'] = sorted((_timestamp(start), _timestamp(end)) for start, end in time_windows)
+    return filters or None
+
+
+def _timestamp(value):
+    # epoch seconds or anything pandas understands as a time
+    return pd.to_datetime(value, unit='s') if isinstance(value, (int, float, np.number)) else pd.Timestamp(value)
+
+
+def filter_windows(filters):
+    """The time windows the filters keep packets from (the 'windows' clipped to the 'time' range), or None if every time passes."""
+    if not filters or not {'time', 'windows'} & set(filters):
+        return None
+    windows = filters.get('windows', [filters.get('time')])
+    if 'time' in filters:
+        first, last = filters['time']
+        windows = [(max(start, first), min(end, last)) for start, end in windows]
+    return [(start, end) for start, end in windows if start <= end]
+
+
+def filter_mask(df, filters):
+    """Boolean mask of the packets (compact schema) that pass the filters."""
+    mask = np.ones(len(df), dtype=bool)
+    if 'vlan' in filters:
+        mask &= np.isin(df['vlan.id'].to_numpy(), filters['vlan'])
+    if 'proto' in filters:
+        mask &= np.isin(df['ip.proto'].to_numpy(), filters['proto'])
+    if 'time' in filters:
+        times = df['frame.time_epoch'].to_numpy()
+        mask &= (times >= filters['time'][0].to_datetime64()) & (times <= filters['time'][1].to_datetime64())
+    if 'windows' in filters:
+        times = df['frame.time_epoch'].to_numpy()
+        inside = np.zeros(len(df), dtype=bool)
+        for start, end in filters['windows']:
+            inside |= (times >= start.to_datetime64()) & (times <= end.to_datetime64())
+        mask &= inside
+    src, dst = (df[col].to_numpy() for col in ('ip.src', 'ip.dst')) if {'hosts', 'subnets'} & set(filters) else (None, None)
+    if 'hosts' in filters:
+        mask &= np.isin(src, filters['hosts']) | np.isin(dst, filters['hosts'])
+    if 'subnets' in filters:
+        inside = np.zeros(len(df), dtype=bool)
+        for first, last in filters['subnets']:
+            inside |= ((src >= first) & (src <= last)) | ((dst >= first) & (dst <= last))
+        mask &= inside
+    return mask
+
+
+def apply_filters(df, filters):
+    # the packets that pass the filters (the frame itself when there are none)
+    if not filters:
+        return df
+    mask = filter_mask(df, filters)
+    return df if mask.all() else df[mask]
+
+
+def display_filter(filters):
+    """The filters as a tshark/wireshark display filter (for tshark -Y), or None if there are none."""
+    if not filters:
+        return None
+    terms = []
+    if 'vlan' in filters:
+        terms.append(f"vlan.id in {{{' '.join(map(str, filters['vlan']))}}}")
+    if 'proto' in filters:
+        terms.append(f"ip.proto in {{{' '.join(map(str, filters['proto']))}}}")
+    if 'time' in filters:
+        start, end = (t.value / 1e9 for t in filters['time'])
+        terms.append(f'frame.time_epoch >= {start:.9f} && frame.time_epoch <= {end:.9f}')
+    if 'windows' in filters:
+        windows = [(start.value / 1e9, end.value / 1e9) for start, end in filters['windows']]
+        terms.append('(' + ' || '.join(f'(frame.time_epoch >= {a:.9f} && frame.time_epoch <= {b:.9f})' for a, b in windows) + ')')
+    if 'hosts' in filters:
+        terms.append(f"ip.addr in {{{' '.join(int_to_ipv4(h) for h in filters['hosts'])}}}")
+    if 'subnets' in filters:
+        blocks = [f'{int_to_ipv4(first)}/{33 - (last - first + 1).bit_length()}' for first, last in filters['subnets']]
+        terms.append('(' + ' || '.join(f'ip.addr == {b}' for b in blocks) + ')')
+    return ' && '.join(terms)
+
+
+def _parquet_time(value):
+    # a time bound at ns precision (pyarrow compares a pd.Timestamp as µs, which drops a packet sitting exactly on
+    # an inclusive end bound)
+    import pyarrow as pa
+    return pa.scalar(value.value, pa.timestamp('ns'))
+
+
+def parquet_filters(filters):
+    """
+    The filters as parquet predicates (disjunctive normal form, for pd.read_parquet(filters=...)).
+
+    Row groups whose min/max statistics can't match are skipped without being read, the remaining
+    rows are filtered before they are converted to pandas. Captures are stored in time order, so
+    time windows prune whole row groups. The readers still apply filter_mask to what comes back, so the
+    rows are exactly those of a packet read.
+    """
+    if not filters:
+        return None
+    common = []
+    if 'vlan' in filters:
+        common.append(('vlan.id', 'in', filters['vlan']))
+    if 'proto' in filters:
+        common.append(('ip.proto', 'in', filters['proto']))
+    if 'time' in filters:
+        common += [('frame.time_epoch', '>=', _parquet_time(filters['time'][0])), ('frame.time_epoch', '<=', _parquet_time(filters['time'][1]))]
+    # "from or to" conditions multiply out into one conjunction per column (and block)
+    alternatives = [[]]
+    if 'windows' in filters:
+        alternatives = [[('frame.time_epoch', '>=', _parquet_time(start)), ('frame.time_epoch', '<=', _parquet_time(end))]
+                        for start, end in filters['windows']]
+    if 'hosts' in filters:
+        alternatives = [a + [(col, 'in', filters['hosts'])] for a in alternatives for col in ('ip.src', 'ip.dst')]
+    if 'subnets' in filters:
+        alternatives = [a + [(col, '>=', first), (col, '<=', last)]
+                        for a in alternatives for col in ('ip.src', 'ip.dst') for first, last in filters['subnets']]
+    return [common + a for a in alternatives]
+
+
+def tshark_export(pcap_path, csv_path, filters=None, fields_file='files/param_list.txt'):
+    """
+    Export a capture with tshark (like pcap_to_csv.sh), keeping only the packets that pass the filters.
+
+    tshark evaluates the display filter while it dissects, so packets outside the filters are never written.
+    """
+    with open(fields_file) as f:
+        fields = [line.strip() for line in f if line.strip()]
+    command = ['tshark', '-r', pcap_path, '-T', 'fields', '-E', 'header=y']
+    for field in fields:
+        command += ['-e', field]
+    expression = display_filter(filters)
+    if expression:
+        command += ['-Y', expression]
+    with open(csv_path, 'w') as out:
+        subprocess.run(command, stdout=out, check=True)
+    return csv_path
@@ -0,0 +1,69 @@
+# the compact, fixed-width schema every capture is converted to
+import numpy as np
+import pandas as pd
+from src.addresses import parse_ipv4, parse_mac
+
+# frame.time_epoch is datetime64[ns] (an int64 of nanoseconds). Addresses are integers (0 = not present),
+# tcp/udp ports are folded into one src/dst pair with l4.proto saying which one they came from (0 = no ports).
+CAPTURE_DTYPES = {
+    'frame.time_epoch': 'datetime64[ns]',
+    'frame.len': 'uint32',
+    'eth.src': 'uint64',
+    'eth.dst': 'uint64',
+    'vlan.id': 'uint16',
+    'ip.src': 'uint32',
+    'ip.dst': 'uint32',
+    'ip.proto': 'uint8',
+    'ip.id': 'uint16',
+    'l4.srcport': 'uint16',
+    'l4.dstport': 'uint16',
+    'l4.proto': 'uint8',
+}
+CAPTURE_COLUMNS = list(CAPTURE_DTYPES)
+
+# Define protocol names
+protocol_map = {6: 'TCP', 17: 'UDP', 1: 'ICMP'} #todo: add more protocols here
+
+
+def _number(series):
+    # tshark writes some integer fields in hex (e.g. ip.id = 0x1f2e) and repeated fields comma separated
+    # (e.g. vlan.id = 10,20 for QinQ - keep the outer one)
+    if series.dtype == object:
+        codes, uniques = pd.factorize(series)
+        values = np.array([int(str(u).split(',')[0], 0) for u in uniques] + [0], dtype=np.int64)
+        return values[codes]
+    return series.fillna(0).to_numpy()
+
+
+def compact_capture(df):
+    """
+    Convert a tshark text export (files/param_list.txt fields) to the compact capture schema.
+
+    Strings are parsed once per distinct value, so the cost depends on the number of hosts, not packets.
+    """
+    out = pd.DataFrame({'frame.time_epoch': df['frame.time_epoch'], 'frame.len': df['frame.len']})
+    out['eth.src'] = parse_mac(df['eth.src'])
+    out['eth.dst'] = parse_mac(df['eth.dst'])
+    out['vlan.id'] = _number(df['vlan.id'])
+    out['ip.src'] = parse_ipv4(df['ip.src'])
+    out['ip.dst'] = parse_ipv4(df['ip.dst'])
+    out['ip.proto'] = _number(df['ip.proto'])
+    out['ip.id'] = _number(df['ip.id'])
+
+    tcp = df['tcp.srcport'].notna().to_numpy()
+    udp = df['udp.srcport'].notna().to_numpy() & ~tcp
+    out['l4.srcport'] = np.where(tcp, _number(df['tcp.srcport']), _number(df['udp.srcport']))
+    out['l4.dstport'] = np.where(tcp, _number(df['tcp.dstport']), _number(df['udp.dstport']))
+    out['l4.proto'] = np.select([tcp, udp], [6, 17], 0)
+    return out
+
+
+def protocol_names(proto):
+    """ip.proto numbers -> names (categorical, each distinct protocol is looked up once)."""
+    codes, uniques = pd.factorize(np.asarray(proto))
+    return pd.Categorical.from_codes(codes, categories=[protocol_map.get(int(p), str(p)) for p in uniques])
+
+
+def apply_capture_dtypes(df):
+    """Cast the columns of a cleaned capture to the fixed dtypes of the compact schema."""
+    return df.astype({col: dtype for col, dtype in CAPTURE_DTYPES.items() if col in df.columns})
@@ -0,0 +1,74 @@
+# shape-preserving downsampling of dense time series for plotting: a day at 1-second resolution is 86,400
+# points per line, a plot is ~2,000 pixels wide. Both methods return the indexes of the points to keep, so
+# the x values (datetimes) are never converted and the first and last points are always kept.
+import numpy as np
+import pandas as pd
+
+PLOT_POINTS = 2000  # points kept per line (about one per pixel of a wide plot)
+
+
+def _numeric(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        values = values.astype('datetime64[ns]').view(np.int64)
+    # missing values don't attract the selection (they are still plotted as gaps where they are kept)
+    return np.nan_to_num(values.astype(np.float64))
+
+
+def lttb(x, y, points=PLOT_POINTS):
+    """
+    Largest-Triangle-Three-Buckets: one point per bucket, the one forming the largest triangle with the point
+    kept in the previous bucket and the average of the next bucket (keeps peaks and the overall shape).
+
+    Args:
+        x (array): sorted x values (numbers or datetimes)
+        y (array): y values
+        points (int): number of points to keep
+
+    Returns:
+        np.ndarray: indexes of the kept points, ascending
+    """
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x, y = _numeric(x), _numeric(y)
+    # points - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    sums_x, sums_y = np.add.reduceat(x[:-1], edges[:-1]), np.add.reduceat(y[:-1], edges[:-1])
+    avg_x, avg_y = np.r_[sums_x / np.diff(edges), x[-1]], np.r_[sums_y / np.diff(edges), y[-1]]
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x, y, points=PLOT_POINTS):
+    """
+    The minimum and the maximum of every bucket (points / 2 buckets of equal length): no spike or dip is lost.
+
+    Returns:
+        np.ndarray: indexes of the kept points, ascending
+    """
+    n = len(y)
+    if points >= n or points < 4:
+        return np.arange(n)
+    y = _numeric(y)
+    bucket = np.arange(n) * (points // 2) // n
+    order = pd.DataFrame({'bucket': bucket, 'y': y}).groupby('bucket', sort=True)['y']
+    keep = np.r_[order.idxmin().to_numpy(), order.idxmax().to_numpy(), 0, n - 1]
+    return np.unique(keep)
+
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, points=PLOT_POINTS, method='lttb'):
+    """Indexes of the points of (x, y) to plot, with 'lttb' or 'minmax'."""
+    if method not in DOWNSAMPLERS:
+        raise ValueError(f'unknown downsampling method {method!r} (expected one of {list(DOWNSAMPLERS)})')
+    return DOWNSAMPLERS[method](x, y, points)
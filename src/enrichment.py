@@ -0,0 +1,138 @@
+# host / asset enrichment: ip addresses and CIDR blocks from the asset inventory, resolved by longest prefix match.
+# The blocks are flattened into sorted, disjoint address ranges, each pointing at the most specific entry that
+# covers it, so a lookup is one binary search per distinct address (the packets only carry categorical codes).
+import ipaddress
+import numpy as np
+import pandas as pd
+from src.addresses import int_to_ipv4
+
+SUBNET_UNKNOWN = 'unknown'  # subnet label of addresses outside every block of the inventory
+
+
+def _flatten(first, last, prefix):
+    # disjoint ranges [bounds[i], bounds[i + 1]) and the entry with the longest prefix covering each (-1: none).
+    # CIDR blocks are nested or disjoint, so painting the levels from the shortest prefix to the longest leaves
+    # every range with its longest match; the blocks of one level never overlap.
+    bounds = np.unique(np.r_[np.uint64(0), first, last + np.uint64(1)])
+    entry = np.full(len(bounds), -1, dtype=np.int64)
+    for length in np.unique(prefix):
+        level = np.flatnonzero(prefix == length)
+        level = level[np.argsort(first[level], kind='stable')]  # a block listed twice: the later row wins
+        i = np.searchsorted(first[level], bounds, 'right') - 1
+        hit = (i >= 0) & (bounds <= last[level][np.maximum(i, 0)])
+        entry[hit] = level[i[hit]]
+    return bounds, entry
+
+
+def _network(ip, row):
+    try:
+        return ipaddress.ip_network(str(ip).strip(), strict=False)
+    except ValueError as e:
+        raise ValueError(f'inventory row {row}: {ip!r} is not an address or CIDR block') from e
+
+
+def build_asset_map(table):
+    """
+    Longest-prefix-match structure of an asset inventory.
+
+    Args:
+        table (pd.DataFrame): 'ip' (an address or a CIDR block, e.g. '10.1.0.0/16'; IPv6 rows are skipped) and
+            'hostname' (the name of the host or the subnet); any other columns are asset attributes (e.g. 'site', 'owner')
+
+    Returns:
+        dict: 'entries' (the inventory with 'first' / 'last' address and 'prefix'), and the flattened ranges of
+        all entries ('all') and of the subnets only ('subnets'), each {'bounds', 'entry'}
+    """
+    networks = [_network(ip, row) for row, ip in enumerate(table['ip'])]
+    # addresses are uint32: the other families of a mixed inventory can't match anything
+    other = [row for row, n in enumerate(networks) if n.version != 4]
+    if other:
+        print(f"skipping {len(other)} non-IPv4 inventory rows (first: {table['ip'].iloc[other[0]]!r})")
+    keep = [row for row, n in enumerate(networks) if n.version == 4]
+    entries = table.iloc[keep].reset_index(drop=True).copy()
+    networks = [networks[row] for row in keep]
+    entries['first'] = np.array([int(n.network_address) for n in networks], dtype=np.uint64)
+    entries['last'] = np.array([int(n.broadcast_address) for n in networks], dtype=np.uint64)
+    entries['prefix'] = np.array([n.prefixlen for n in networks], dtype=np.uint8)
+    first, last, prefix = (entries[col].to_numpy() for col in ('first', 'last', 'prefix'))
+    subnet = np.flatnonzero(prefix < 32)
+    bounds, entry = _flatten(first[subnet], last[subnet], prefix[subnet])
+    if len(subnet):  # (an inventory of exact addresses only has no blocks: every entry stays -1)
+        entry = np.where(entry >= 0, subnet[np.maximum(entry, 0)], -1)
+    all_bounds, all_entry = _flatten(first, last, prefix)
+    return {'entries': entries, 'all': {'bounds': all_bounds, 'entry': all_entry},
+            'subnets': {'bounds': bounds, 'entry': entry}}
+
+
+def as_asset_map(hostnames):
+    """An asset map from a hostname dict ({ip or CIDR: name}), an inventory table or an asset map (None stays None)."""
+    if hostnames is None or (isinstance(hostnames, dict) and 'entries' in hostnames):
+        return hostnames
+    if isinstance(hostnames, dict):
+        hostnames = pd.DataFrame({'ip': list(hostnames), 'hostname': list(hostnames.values())})
+    return build_asset_map(hostnames)
+
+
+def _resolve(ranges, addresses):
+    # entry of every address (-1: not covered)
+    position = np.searchsorted(ranges['bounds'], np.asarray(addresses, dtype=np.uint64), 'right') - 1
+    return ranges['entry'][position]
+
+
+def _categorical(codes, names):
+    # several addresses can share a name, so the names are factorized again
+    label_codes, labels = pd.factorize(np.asarray(names, dtype=object))
+    return pd.Categorical.from_codes(label_codes[codes], categories=labels)
+
+
+def host_labels(ips, asset_map=None):
+    """
+    uint32 addresses -> categorical host labels: the hostname of an exact (/32) inventory entry, else the dotted
+    ip. Each distinct address is resolved once.
+    """
+    asset_map = as_asset_map(asset_map)
+    codes, uniques = pd.factorize(np.asarray(ips))
+    names = np.array([int_to_ipv4(ip) for ip in uniques], dtype=object)
+    if asset_map is not None and len(uniques):
+        entry = _resolve(asset_map['all'], uniques)
+        entries = asset_map['entries']
+        host = (entry >= 0) & (entries['prefix'].to_numpy()[np.maximum(entry, 0)] == 32)
+        names[host] = entries['hostname'].to_numpy()[entry[host]]
+    return _categorical(codes, names)
+
+
+def subnet_labels(ips, asset_map=None):
+    """
+    uint32 addresses -> categorical subnet labels: the name of the longest inventory block (shorter than /32)
+    containing the address (its CIDR when the block has no name), else SUBNET_UNKNOWN.
+    """
+    asset_map = as_asset_map(asset_map)
+    codes, uniques = pd.factorize(np.asarray(ips))
+    names = np.full(len(uniques), SUBNET_UNKNOWN, dtype=object)
+    if asset_map is not None and len(uniques):
+        entry = _resolve(asset_map['subnets'], uniques)
+        entries = asset_map['entries'].iloc[entry[entry >= 0]]
+        cidr = [f'{int_to_ipv4(first)}/{prefix}' for first, prefix in zip(entries['first'], entries['prefix'])]
+        names[entry >= 0] = np.where(entries['hostname'].notna() & (entries['hostname'].astype(str) != ''), entries['hostname'].astype(str), cidr)
+    return _categorical(codes, names)
+
+
+def asset_attributes(ips, asset_map, columns=None):
+    """
+    The inventory attributes (columns other than ip / hostname) of the most specific entry covering each address,
+    as categoricals (missing where no entry covers it).
+
+    Returns:
+        pd.DataFrame: one column per attribute, aligned with ips
+    """
+    asset_map = as_asset_map(asset_map)
+    entries = asset_map['entries']
+    columns = columns or [c for c in entries.columns if c not in ('ip', 'hostname', 'first', 'last', 'prefix')]
+    codes, uniques = pd.factorize(np.asarray(ips))
+    entry = _resolve(asset_map['all'], uniques)
+    out = {}
+    for column in columns:
+        values = entries[column].to_numpy(dtype=object)[np.maximum(entry, 0)]
+        values[entry < 0] = None
+        out[column] = pd.Categorical(values)[codes] if len(codes) else pd.Categorical([])
+    return pd.DataFrame(out)
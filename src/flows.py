@@ -0,0 +1,71 @@
+# flow assembly: packets -> NetFlow style records (one per 5-tuple + vlan, split by idle/active timeouts)
+import numpy as np
+import pandas as pd
+
+FLOW_KEYS = ['vlan.id', 'ip.src', 'ip.dst', 'ip.proto', 'l4.proto', 'l4.srcport', 'l4.dstport']
+
+
+def assemble_flows(df, idle_timeout='15s', active_timeout='30Min'):
+    """
+    Turn packets into flow records in one pass.
+
+    A flow is the packets with the same vlan, addresses, protocol and ports. A new record starts when a flow
+    has been idle for longer than idle_timeout, and long-lived flows are cut every active_timeout (counted from
+    the first packet after the idle gap), like a NetFlow/IPFIX exporter.
+
+    Args:
+        df (pd.DataFrame): packets (time ordered, as captured)
+        idle_timeout (str): gap that ends a flow
+        active_timeout (str): longest duration of a record
+
+    Returns:
+        pd.DataFrame: FLOW_KEYS, 'start_time' / 'end_time' (first and last packet seen), 'packets', 'bytes',
+        and 'label' / 'subnet' (of the source, if the packets are labelled). Every function that takes per-host or
+        per-conversation totals accepts it in place of the packets.
+    """
+    times = df['frame.time_epoch'].to_numpy().view(np.int64)
+    if len(times) and np.any(np.diff(times) < 0):
+        # timeouts need time order; a stable sort on the one time column keeps the capture order of ties
+        df = df.sort_values('frame.time_epoch', kind='stable')
+        times = df['frame.time_epoch'].to_numpy().view(np.int64)
+
+    # hash the flow keys instead of sorting on them
+    codes, _ = pd.MultiIndex.from_frame(df[FLOW_KEYS]).factorize()
+
+    # idle timeout: a gap longer than it starts a new segment of the flow
+    gap = pd.Series(times).groupby(codes).diff().to_numpy()
+    new_segment = ~(gap <= pd.to_timedelta(idle_timeout).value)  # also true for the first packet (gap is NaN)
+    segment = pd.Series(new_segment).groupby(codes).cumsum().to_numpy()
+
+    # active timeout: windows of active_timeout from the first packet of the segment
+    segment_id = pd.MultiIndex.from_arrays([codes, segment]).factorize()[0]
+    first = np.empty(segment_id.max() + 1 if len(segment_id) else 0, dtype=np.int64)
+    first[segment_id[::-1]] = np.arange(len(segment_id))[::-1]  # first packet of each segment (last write wins)
+    segment_start = times[first]
+    window = (times - segment_start[segment_id]) // pd.to_timedelta(active_timeout).value
+    record = pd.MultiIndex.from_arrays([segment_id, window]).factorize()[0]
+
+    # one row per record
+    columns = {key: df[key].to_numpy() for key in FLOW_KEYS}
+    columns.update({'frame.time_epoch': df['frame.time_epoch'].to_numpy(), 'frame.len': df['frame.len'].to_numpy(np.int64), 'record': record})
+    agg = {key: (key, 'first') for key in FLOW_KEYS}
+    agg.update({'start_time': ('frame.time_epoch', 'min'), 'end_time': ('frame.time_epoch', 'max'),
+                'packets': ('frame.len', 'size'), 'bytes': ('frame.len', 'sum')})
+    for column in ('label', 'subnet'):
+        if column in df.columns:
+            columns[column] = df[column].values
+            agg[column] = (column, 'first')
+    flows = pd.DataFrame(columns).groupby('record', sort=False).agg(**agg).reset_index(drop=True)
+    return flows.sort_values('start_time', kind='stable', ignore_index=True)
+
+
+def is_flows(data):
+    return isinstance(data, pd.DataFrame) and 'packets' in data.columns and 'start_time' in data.columns
+
+
+def flow_pairs(flows, interval):
+    # (time_bin, ip.src, ip.dst) of every bin a flow has packets in. A record spans at most two bins when
+    # active_timeout <= interval; longer records are counted in the bins of their first and last packet.
+    start = flows[['ip.src', 'ip.dst']].assign(time_bin=flows['start_time'].dt.floor(interval))
+    end = flows[['ip.src', 'ip.dst']].assign(time_bin=flows['end_time'].dt.floor(interval))
+    return pd.concat([start, end], ignore_index=True).drop_duplicates()
@@ -0,0 +1,223 @@
+# bounded-memory top talkers / receivers: top-k summaries of the heaviest hosts (by bytes and by packets) and
+# Count-Min sketches to estimate any host's traffic, both mergeable across chunks, files and captures.
+# A summary is not Space-Saving (no counter replacement row by row): each chunk is summed exactly per key and
+# truncated to its heaviest `capacity` keys, and the summaries of the chunks are merged with error bounds. The
+# memory is the distinct keys of one chunk while it is summed (at most CHUNK_ROWS, or the chunk size of the
+# streaming reader) and `capacity` keys per summary after that.
+import numpy as np
+import pandas as pd
+from src.flows import is_flows
+
+SKETCH_CAPACITY = 1000  # hosts kept per top-k summary
+CM_WIDTH = 4096  # counters per Count-Min row (a power of two)
+CM_DEPTH = 4
+CM_SEED = 0x5eed
+CHUNK_ROWS = 1_000_000  # packets / flows summarized at once when a whole frame is sketched
+# the keys top talkers / receivers are ranked by (see top_talkers.py)
+SKETCH_KEYS = ['ip.src', 'label', 'ip.dst']
+
+
+def top_summary(keys, weights, capacity=SKETCH_CAPACITY, labels=None):
+    """
+    Top-k summary of a batch: the exact per-key sums, truncated to the heaviest `capacity` keys (the batch's
+    distinct keys are held while they are summed).
+
+    Args:
+        keys (array): one key per row (repeated keys are summed)
+        weights (array): bytes or packets per row
+        labels (array): display label per row, carried along with the key (e.g. the hostname of an address)
+
+    Returns:
+        dict: 'table' (key, count, error[, label]), 'capacity', 'bound' (the most any key that isn't in the
+        table can weigh) and 'total'. Every key's true weight is in [count - error, count].
+    """
+    columns = {'key': np.asarray(keys), 'count': np.asarray(weights, dtype=np.int64)}
+    if labels is not None:
+        columns['label'] = np.asarray(labels)
+    table = pd.DataFrame(columns)
+    agg = {'count': 'sum', 'label': 'first'} if labels is not None else {'count': 'sum'}
+    table = table.groupby('key', sort=False).agg(agg).reset_index()
+    table['error'] = np.int64(0)
+    return _truncate(table, capacity, 0, int(table['count'].sum()))
+
+
+def _truncate(table, capacity, bound, total):
+    # keep the heaviest keys; a dropped key weighs at most its (over)count
+    table = table.sort_values('count', ascending=False, kind='stable', ignore_index=True)
+    if len(table) > capacity:
+        bound = max(bound, int(table['count'].iloc[capacity]))
+        table = table.iloc[:capacity]
+    return {'table': table, 'capacity': capacity, 'bound': int(bound), 'total': int(total)}
+
+
+def merge_top_summaries(sketches, capacity=None):
+    """
+    Merge top-k summaries (of different chunks, files or captures).
+
+    A key missing from one summary may still have weighed up to that summary's bound there, so the bound is
+    added to its count and its error. The error of every key stays below the sum of the bounds, which is at
+    most total / capacity.
+    """
+    sketches = [s for s in sketches if s is not None]
+    capacity = capacity or max(s['capacity'] for s in sketches)
+    keys = pd.Index(pd.concat([s['table']['key'] for s in sketches], ignore_index=True).unique())
+    count = np.zeros(len(keys), dtype=np.int64)
+    error = np.zeros(len(keys), dtype=np.int64)
+    labels = None
+    for s in sketches:
+        table = s['table'].set_index('key')
+        count += table['count'].reindex(keys, fill_value=s['bound']).to_numpy()
+        error += table['error'].reindex(keys, fill_value=s['bound']).to_numpy()
+        if 'label' in table.columns:
+            side = table['label'].reindex(keys)
+            labels = side if labels is None else labels.fillna(side)
+    table = pd.DataFrame({'key': keys, 'count': count, 'error': error})
+    if labels is not None:
+        table['label'] = labels.to_numpy()
+    return _truncate(table, capacity, sum(s['bound'] for s in sketches), sum(s['total'] for s in sketches))
+
+
+def _hash_rows(keys, depth, width):
+    # multiply-shift hashing of the 64-bit hash of every key, one independent function per row
+    keys = np.asarray(keys)
+    x = pd.util.hash_array(keys.astype(np.uint64) if keys.dtype.kind in 'iu' else keys)
+    rng = np.random.default_rng(CM_SEED)
+    a = rng.integers(1, 2**63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, size=depth, dtype=np.uint64)
+    shift = np.uint64(64 - int(width).bit_length() + 1)
+    return ((a[:, None] * x[None, :] + b[:, None]) >> shift).astype(np.int64)
+
+
+def count_min(keys, weights, width=CM_WIDTH, depth=CM_DEPTH):
+    """
+    Count-Min sketch of a batch: estimates any key's weight to within e / width * total (with probability
+    1 - e^-depth), never below it. Sketches with the same width and depth merge by adding their tables.
+    """
+    if width & (width - 1):
+        raise ValueError(f'the Count-Min width must be a power of two, not {width}')
+    weights = np.asarray(weights, dtype=np.float64)
+    rows = _hash_rows(keys, depth, width)
+    table = np.stack([np.bincount(row, weights, minlength=width) for row in rows]).astype(np.int64)
+    return {'table': table, 'total': int(weights.sum())}
+
+
+def merge_count_min(sketches):
+    sketches = [s for s in sketches if s is not None]
+    return {'table': sum(s['table'] for s in sketches), 'total': sum(s['total'] for s in sketches)}
+
+
+def count_min_estimate(sketch, keys):
+    """Estimated weight of each key, and the error bound (e / width * total) that holds with probability 1 - e^-depth."""
+    depth, width = sketch['table'].shape
+    rows = _hash_rows(keys, depth, width)
+    estimate = sketch['table'][np.arange(depth)[:, None], rows].min(axis=0)
+    return estimate, np.e / width * sketch['total']
+
+
+def host_sketch(data, key, capacity=SKETCH_CAPACITY, width=CM_WIDTH, depth=CM_DEPTH):
+    """
+    Heavy-hitter sketches of the traffic per `key` ('ip.src', 'ip.dst' or 'label').
+
+    Args:
+        data (pd.DataFrame): packets, flow records or a per-host table of aggregates ('talkers' / 'receivers'),
+            already in memory and summarized CHUNK_ROWS rows at a time (stream_capture sketches each chunk it
+            reads and merges them, so a capture is never held whole)
+
+    Returns:
+        dict: 'key', top-k summaries of the heaviest keys by 'bytes' and by 'packets' and Count-Min
+        sketches 'cm_bytes' / 'cm_packets' (packets are None for per-host aggregates, which only have bytes)
+    """
+    parts = []
+    for start in range(0, max(len(data), 1), CHUNK_ROWS):
+        chunk = data.iloc[start:start + CHUNK_ROWS]
+        # the chunk is reduced to one row per key before anything is sketched
+        if is_flows(chunk):
+            agg = {'bytes': ('bytes', 'sum'), 'packets': ('packets', 'sum')}
+        elif 'frame.time_epoch' in chunk.columns:
+            agg = {'bytes': ('frame.len', 'sum'), 'packets': ('frame.len', 'size')}
+        else:  # per-host aggregates only have bytes
+            agg = {'bytes': ('frame.len', 'sum')}
+        if key == 'ip.src' and 'label' in chunk.columns:  # the label names the source
+            agg['label'] = ('label', 'first')
+        grouped = chunk.groupby(key, observed=True, sort=False).agg(**agg)
+        labels = grouped['label'].astype(str).to_numpy() if 'label' in grouped.columns else None
+        keys = grouped.index.astype(str).to_numpy() if key == 'label' else grouped.index.to_numpy()
+        part = {'key': key}
+        for name in ('bytes', 'packets'):
+            if name in grouped.columns:
+                part[name] = top_summary(keys, grouped[name].to_numpy(), capacity, labels)
+                part[f'cm_{name}'] = count_min(keys, grouped[name].to_numpy(), width, depth)
+            else:
+                part[name] = part[f'cm_{name}'] = None
+        parts.append(part)
+    return merge_host_sketches(parts, capacity)
+
+
+def merge_host_sketches(sketches, capacity=None):
+    """Merge host sketches of the same key (chunks of a capture, or the baseline and the event windows)."""
+    sketches = [s for s in sketches if s is not None]
+    merged = {'key': sketches[0]['key']}
+    for name in ('bytes', 'packets'):
+        if all(s[name] is not None for s in sketches):
+            merged[name] = merge_top_summaries([s[name] for s in sketches], capacity)
+            merged[f'cm_{name}'] = merge_count_min([s[f'cm_{name}'] for s in sketches])
+        else:
+            merged[name] = merged[f'cm_{name}'] = None
+    return merged
+
+
+def host_estimates(sketch, keys):
+    """
+    Bytes (and packets) of any keys: from the top-k summary when a key is monitored, else from the
+    Count-Min sketch.
+
+    Returns:
+        pd.DataFrame: key, bytes, bytes_error[, packets, packets_error] (true value in [estimate - error, estimate])
+    """
+    keys = np.asarray(keys)
+    out = pd.DataFrame({'key': keys})
+    for name in ('bytes', 'packets'):
+        if sketch[name] is None:
+            continue
+        cm, cm_error = count_min_estimate(sketch[f'cm_{name}'], keys) if len(keys) else (np.zeros(0, dtype=np.int64), 0)
+        # a key the summary doesn't monitor weighs at most its bound, and at least the Count-Min estimate minus its error
+        upper = np.minimum(cm, sketch[name]['bound'])
+        lower = np.maximum(cm - cm_error, 0)
+        table = sketch[name]['table'].set_index('key')
+        monitored = table['count'].reindex(keys)
+        out[name] = np.where(monitored.notna(), monitored.fillna(0), upper).astype(np.int64)
+        out[f'{name}_error'] = np.where(monitored.notna(), table['error'].reindex(keys).fillna(0),
+                                        np.maximum(upper - lower, 0)).astype(np.int64)
+    return out
+
+
+def top_hosts(sketch, top_n=10, by='bytes'):
+    """
+    The top_n keys of a host sketch by 'bytes' or 'packets', with their error bounds.
+
+    Returns:
+        pd.DataFrame: key (named after the sketch's key), label (if carried), bytes / packets and their
+        errors, 'pct' (share of the total) and 'guaranteed' (the key is in the true top_n whatever the errors).
+        attrs['total'] and attrs['bound'] describe the summary.
+    """
+    summary = sketch[by]
+    table = summary['table']
+    top = table.head(top_n)
+    # a key is certainly among the top_n if its lower bound beats the upper bound of every key ranked below it
+    next_upper = max(summary['bound'], int(table['count'].iloc[top_n]) if len(table) > top_n else 0)
+    out = host_estimates(sketch, top['key'].to_numpy())
+    if 'label' in top.columns:
+        out.insert(1, 'label', top['label'].to_numpy())
+    out['pct'] = 100 * out[by] / max(summary['total'], 1)
+    out['guaranteed'] = (out[by] - out[f'{by}_error']) >= next_upper
+    out.attrs.update(total=summary['total'], bound=summary['bound'])
+    return out.rename(columns={'key': sketch['key']})
+
+
+def sketch_table(sketch, column='frame.len'):
+    # the monitored keys as a per-host table like the exact 'talkers' / 'receivers' aggregates
+    table = sketch['bytes']['table']
+    out = pd.DataFrame({sketch['key']: table['key'].to_numpy(), column: table['count'].to_numpy()})
+    if 'label' in table.columns:
+        out['label'] = table['label'].to_numpy()
+    return out
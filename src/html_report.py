@@ -0,0 +1,182 @@
+# interactive html output: series are stored as base64 float64 blobs (not json number lists), plots redraw the
+# zoomed range from the full-resolution data, and a dashboard collects every figure of a run into one page
+# (plotly.js included once, panels rendered when they scroll into view)
+import base64
+import html
+import json
+import os
+import numpy as np
+
+PANEL_HEIGHT = 450  # px
+
+# window.pcapZoom(div, load, points): on the first zoom, load(callback) hands over the full-resolution data
+# ({x: [Float64Array], traces: [{x: index into x, y: Float64Array}]}); the visible range of every trace is then
+# redrawn from it, min/max per bucket down to `points` points. A double-click (autorange) restores the overview.
+ZOOM_JS = """
+window.pcapDecode = function(text) {
+  var bytes = atob(text), buffer = new Uint8Array(bytes.length);
+  for (var i = 0; i < bytes.length; i++) buffer[i] = bytes.charCodeAt(i);
+  return new Float64Array(buffer.buffer);
+};
+window.pcapFull = function(data) {
+  return {x: data.x.map(pcapDecode), traces: data.traces.map(function(t) { return {x: t.x, y: pcapDecode(t.y)}; })};
+};
+window.pcapZoom = function(div, load, points) {
+  var overview = {x: div.data.map(function(t) { return t.x; }), y: div.data.map(function(t) { return t.y; })};
+  var full = null, waiting = null;
+  function toNumber(value) {
+    if (typeof value === 'number') return value;
+    var parts = String(value).split(' ');
+    return Date.parse(parts[0] + 'T' + (parts[1] || '00:00:00') + 'Z');
+  }
+  function bisect(x, value) {
+    var lo = 0, hi = x.length;
+    while (lo < hi) { var mid = (lo + hi) >> 1; if (x[mid] < value) lo = mid + 1; else hi = mid; }
+    return lo;
+  }
+  function visible(x, y, range) {
+    var lo = Math.max(bisect(x, toNumber(range[0])) - 1, 0), hi = Math.min(bisect(x, toNumber(range[1])) + 1, x.length);
+    var step = Math.max(1, Math.ceil((hi - lo) / (points / 2))), xs = [], ys = [];
+    for (var start = lo; start < hi; start += step) {
+      var stop = Math.min(start + step, hi), low = start, high = start;
+      for (var i = start; i < stop; i++) { if (y[i] < y[low]) low = i; if (y[i] > y[high]) high = i; }
+      (low === high ? [low] : [Math.min(low, high), Math.max(low, high)]).forEach(function(i) { xs.push(x[i]); ys.push(y[i]); });
+    }
+    return [xs, ys];
+  }
+  function redraw(range) {
+    if (!range) { Plotly.restyle(div, overview); return; }
+    var xs = [], ys = [];
+    full.traces.forEach(function(t) { var part = visible(full.x[t.x], t.y, range); xs.push(part[0]); ys.push(part[1]); });
+    Plotly.restyle(div, {x: xs, y: ys}, full.traces.map(function(_, i) { return i; }));
+  }
+  function fetch(then) {
+    if (full) return then();
+    var first = waiting === null;
+    waiting = then;
+    if (first) load(function(data) { full = data; waiting(); });
+  }
+  div.on('plotly_relayout', function(event) {
+    if (event['xaxis.autorange']) { if (full) redraw(null); return; }
+    var range = event['xaxis.range'] || (event['xaxis.range[0]'] !== undefined ? [event['xaxis.range[0]'], event['xaxis.range[1]']] : null);
+    if (range) fetch(function() { redraw(range); });
+  });
+};
+"""
+
+# the full-resolution data of a standalone page is a script next to it (a script, unlike json, also loads from file://)
+SIDECAR_JS = """
+pcapZoom(document.getElementById('{plot_id}'), function(done) {
+  window.pcapPlotData = window.pcapPlotData || {};
+  window.pcapPlotData[SIDECAR] = function(data) { done(pcapFull(data)); };
+  var script = document.createElement('script');
+  script.src = encodeURIComponent(SIDECAR);
+  document.head.appendChild(script);
+}, POINTS);
+"""
+
+# panels are drawn when they come close to the viewport and purged again when they scroll far away
+# (browsers keep only a few WebGL contexts alive)
+DASHBOARD_JS = """
+(function() {
+  function render(div) {
+    var spec = JSON.parse(document.getElementById(div.dataset.spec).textContent);
+    // series are base64 float64 blobs, category labels (bar charts) plain json lists
+    spec.data.forEach(function(t) { if (typeof t.x === 'string') t.x = pcapDecode(t.x); if (typeof t.y === 'string') t.y = pcapDecode(t.y); });
+    Plotly.newPlot(div, spec.data, spec.layout, {responsive: true}).then(function() {
+      if (spec.full) pcapZoom(div, function(done) { done(pcapFull(spec.full)); }, spec.points);
+    });
+  }
+  var panels = Array.prototype.slice.call(document.querySelectorAll('.panel'));
+  if (!('IntersectionObserver' in window)) { panels.forEach(render); return; }
+  var near = new IntersectionObserver(function(entries) {
+    entries.forEach(function(e) { if (e.isIntersecting && !e.target.dataset.drawn) { e.target.dataset.drawn = 1; render(e.target); } });
+  }, {rootMargin: '400px'});
+  var far = new IntersectionObserver(function(entries) {
+    entries.forEach(function(e) { if (!e.isIntersecting && e.target.dataset.drawn) { delete e.target.dataset.drawn; Plotly.purge(e.target); } });
+  }, {rootMargin: '3000px'});
+  panels.forEach(function(p) { near.observe(p); far.observe(p); });
+})();
+"""
+
+
+def epoch_ms(x):
+    """Datetimes as float epoch milliseconds (what plotly.js uses on a date axis), numbers as floats (see is_numeric)."""
+    x = np.asarray(x)
+    if x.dtype.kind == 'M':
+        return x.astype('datetime64[ns]').view(np.int64) / 1e6
+    return x.astype(np.float64)
+
+
+def is_numeric(x):
+    # datetimes and numbers travel as float64 blobs, anything else (category labels, strings) as json
+    return np.asarray(x).dtype.kind in 'Mbiuf'
+
+
+def _panel_series(values):
+    values = np.asarray(values)
+    return encode_array(epoch_ms(values)) if is_numeric(values) else [str(v) for v in values]
+
+
+def encode_array(values):
+    """A float64 array as a base64 string (little-endian), decoded in the page with pcapDecode."""
+    return base64.b64encode(np.ascontiguousarray(values, dtype='<f8').tobytes()).decode('ascii')
+
+
+def encode_full(full):
+    # the full-resolution data of html_figure: every distinct x array once, each trace points at its x
+    return {'x': [encode_array(x) for x in full['x']], 'traces': [{'x': i, 'y': encode_array(y)} for i, y in full['traces']]}
+
+
+def sidecar_script(name, points):
+    """post_script of a standalone page whose full-resolution data is in the `name` sidecar."""
+    return ZOOM_JS + SIDECAR_JS.replace('SIDECAR', json.dumps(name)).replace('POINTS', str(points))
+
+
+def figure_panel(f, full, points):
+    """
+    A figure from html_figure (or bar_figure) as a dashboard panel: the layout as json, the (downsampled) traces
+    and the full-resolution data as base64 blobs (category x values as json).
+    """
+    from plotly.io.json import to_json_plotly
+    data = []
+    for trace in f.data:
+        spec = trace.to_plotly_json()
+        x, y = spec.pop('x'), spec.pop('y')
+        data.append(dict(json.loads(to_json_plotly(spec)), x=_panel_series(x), y=_panel_series(y)))
+    layout = json.loads(to_json_plotly(f.layout.to_plotly_json()))
+    title = layout.get('title', {}).get('text', '')
+    return {'title': title, 'data': data, 'layout': layout, 'full': encode_full(full) if full is not None else None, 'points': points}
+
+
+def _script_json(value):
+    # json that can sit inside a <script> element
+    return json.dumps(value, separators=(',', ':')).replace('</', '<\\/')
+
+
+def write_dashboard(panels, filename, title='Capture analysis'):
+    """
+    Write the panels (see figure_panel) into one html page: a table of contents, plotly.js once and one
+    lazily rendered panel per figure.
+
+    Returns:
+        str: filename
+    """
+    from plotly.offline import get_plotlyjs
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    tmp = f'{filename}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as out:
+        out.write(f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{html.escape(title)}</title>\n')
+        out.write('<style>body {font-family: sans-serif; margin: 0 2em;} '
+                  f'.panel {{height: {PANEL_HEIGHT}px; margin: 1em 0; border-bottom: 1px solid #ddd;}}</style>\n')
+        out.write(f'<script type="text/javascript">{get_plotlyjs()}</script>\n')
+        out.write(f'<script type="text/javascript">{ZOOM_JS}</script>\n</head>\n<body>\n<h1>{html.escape(title)}</h1>\n<ol>\n')
+        for i, panel in enumerate(panels):
+            out.write(f'<li><a href="#panel-{i}">{html.escape(panel["title"] or f"Figure {i + 1}")}</a></li>\n')
+        out.write('</ol>\n')
+        for i, panel in enumerate(panels):
+            out.write(f'<div class="panel" id="panel-{i}" data-spec="spec-{i}"></div>\n')
+            out.write(f'<script type="application/json" id="spec-{i}">{_script_json(panel)}</script>\n')
+        out.write(f'<script type="text/javascript">{DASHBOARD_JS}</script>\n</body>\n</html>\n')
+    os.replace(tmp, filename)
+    return filename
@@ -0,0 +1,214 @@
+# per-stage instrumentation of a run: wall/cpu time, peak rss, rows in and out and group cardinalities,
+# written as a json report (plus an optional summary table and a sampling profile of the slowest stage)
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from collections import Counter
+from contextlib import contextmanager
+import pandas as pd
+
+# key columns whose distinct values are reported for a stage's output...
+GROUP_COLUMNS = ['vlan.id', 'ip.proto', 'protocol', 'ip.src', 'ip.dst', 'label', 'subnet', 'time_bin', 'frame.time_epoch']
+# ...when it has at most this many rows (counting the distinct values of a packet table costs as much as a groupby)
+CARDINALITY_ROWS = 1_000_000
+TOP_FRAMES = 25
+
+_report = None  # the run being recorded (None = instrumentation off, stages cost nothing)
+
+
+def start_report(profile=False, sample_interval=0.005):
+    """
+    Start recording stages (see stage and timed) until finish_report().
+
+    Args:
+        profile (bool): sample the call stack every sample_interval seconds while a stage runs, so the slowest
+            stage can be profiled without knowing in advance which one it is
+    """
+    global _report
+    _report = {'stages': [], 'stack': [], 'started': time.time(), 'wall': time.perf_counter(), 'cpu': time.process_time(),
+               'samples': {}, 'sample_interval': sample_interval, 'sampler': None, 'stop': threading.Event()}
+    if profile:
+        sampler = threading.Thread(target=_sample, args=(_report, threading.main_thread().ident), daemon=True)
+        _report['sampler'] = sampler
+        sampler.start()
+    return _report
+
+
+def _reset_peak_rss():
+    # linux can reset the rss high-water mark, which gives a peak per stage (elsewhere it is the peak of the process)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes (since the last per-stage reset, on linux)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024  # bytes on macOS, KiB elsewhere
+
+
+def _rows(data):
+    if isinstance(data, pd.DataFrame):
+        return len(data)
+    if isinstance(data, dict) and isinstance(data.get('cube'), pd.DataFrame):
+        return len(data['cube'])  # aggregates / profiles: the traffic cube
+    return None
+
+
+def _groups(data):
+    # distinct values of the key columns (tables of aggregates / profiles: their sizes)
+    if isinstance(data, dict):
+        return {name: len(table) for name, table in data.items() if isinstance(table, pd.DataFrame)}
+    if not isinstance(data, pd.DataFrame) or len(data) > CARDINALITY_ROWS:
+        return None
+    columns = [c for c in GROUP_COLUMNS if c in data.columns]
+    index = [n for n in data.index.names if n in GROUP_COLUMNS]
+    groups = {c: int(data[c].nunique()) for c in columns}
+    groups.update({n: int(data.index.get_level_values(n).nunique()) for n in index})
+    return groups
+
+
+@contextmanager
+def stage(name, data=None):
+    """
+    Record one stage of the run (stages can be nested).
+
+    Yields a dict the caller can put the stage's output in (rec['output'] = result) to record its rows and groups.
+    """
+    if _report is None:
+        yield {}
+        return
+    rec = {'name': name, 'depth': len(_report['stack']), 'rows_in': data}
+    parent = _report['stack'][-1] if _report['stack'] else _report
+    _report['stack'].append(rec)
+    # the peak reached so far (by the parent, before this stage) is carried up before the reset clears it
+    parent['child_peak'] = max(parent.get('child_peak', 0), peak_rss())
+    rec['per_stage_rss'] = _reset_peak_rss()
+    rss_before = peak_rss()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield rec
+    except Exception as e:
+        rec['error'] = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        rec['wall_seconds'] = time.perf_counter() - wall
+        rec['cpu_seconds'] = time.process_time() - cpu
+        # a nested stage resets the high-water mark, so its peak is carried up to the parent (or the report)
+        rec['peak_rss_bytes'] = max(peak_rss(), rec.pop('child_peak', 0))
+        rec['rss_before_bytes'] = rss_before
+        parent['child_peak'] = max(parent.get('child_peak', 0), rec['peak_rss_bytes'])
+        _report['stack'].pop()
+        output = rec.pop('output', None)
+        rec['rows_in'] = _rows_in(rec['rows_in'])
+        rec['rows_out'] = _rows(output)
+        rec['groups'] = _groups(output)
+        _report['stages'].append(rec)
+
+
+def _rows_in(data):
+    # one input or several (e.g. baseline and event); None when none of them is a table
+    parts = [r for r in (_rows(d) for d in (data if isinstance(data, (list, tuple)) else [data])) if r is not None]
+    return sum(parts) if parts else None
+
+
+def timed(name, fn, *args, **kwargs):
+    """Call fn(*args, **kwargs) as a stage: the table arguments are its input, the return value its output."""
+    if _report is None:
+        return fn(*args, **kwargs)
+    with stage(name, list(args) + list(kwargs.values())) as rec:
+        result = rec['output'] = fn(*args, **kwargs)
+    return result
+
+
+def _sample(report, thread_id):
+    # sampling profiler: the main thread's stack (outermost first) tagged with the innermost running stage
+    while not report['stop'].wait(report['sample_interval']):
+        try:
+            name = report['stack'][-1]['name']
+        except IndexError:  # no stage running
+            continue
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        report['samples'].setdefault(name, Counter())[tuple(reversed(stack))] += 1
+
+
+def _profile(samples, interval, folded_path=None):
+    # self / cumulative sample counts per function, and the stacks in the collapsed (flame graph) format
+    total = sum(samples.values())
+    own, cumulative = Counter(), Counter()
+    for stack, count in samples.items():
+        own[stack[-1]] += count
+        for frame in set(stack):
+            cumulative[frame] += count
+    if folded_path:
+        with open(folded_path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+    def top(counter):
+        return [{'frame': frame, 'samples': n, 'pct': round(100 * n / total, 1)} for frame, n in counter.most_common(TOP_FRAMES)]
+    return {'samples': total, 'sample_interval': interval, 'self': top(own), 'cumulative': top(cumulative), 'folded': folded_path}
+
+
+def finish_report(path=None, summary=False):
+    """
+    Stop recording and build the report.
+
+    Args:
+        path (str): json file to write the report to
+        summary (bool): also print the stages as a table (slowest first)
+
+    Returns:
+        dict: 'started', 'wall_seconds', 'cpu_seconds', 'stages' (name, depth, wall_seconds, cpu_seconds,
+        peak_rss_bytes, rows_in, rows_out, groups, ...) and 'profile' (of the slowest stage, when sampled)
+    """
+    global _report
+    report, _report = _report, None
+    if report is None:
+        return None
+    if report['sampler'] is not None:
+        report['stop'].set()
+        report['sampler'].join()
+
+    out = {'started': report['started'], 'wall_seconds': time.perf_counter() - report['wall'],
+           'cpu_seconds': time.process_time() - report['cpu'], 'peak_rss_bytes': max(peak_rss(), report.get('child_peak', 0)), 'stages': report['stages']}
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if report['samples']:
+        # the slowest stage that was sampled directly (a parent stage's time is mostly its children's)
+        slowest = max((s for s in report['stages'] if s['name'] in report['samples']), key=lambda s: s['wall_seconds'])
+        folded = f'{os.path.splitext(path)[0]}.folded' if path else None
+        out['profile'] = dict(stage=slowest['name'], **_profile(report['samples'][slowest['name']], report['sample_interval'], folded))
+
+    if path:
+        with open(path, 'w') as f:
+            json.dump(out, f, indent=2, default=str)
+    if summary:
+        print(summary_table(out).to_string(index=False))
+    return out
+
+
+def summary_table(report):
+    """The stages of a report as a table, slowest first."""
+    table = pd.DataFrame(report['stages'], columns=['name', 'depth', 'wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'rows_in', 'rows_out', 'groups'])
+    table['peak_rss_mib'] = (table.pop('peak_rss_bytes') / 2**20).round(1)
+    table['share_pct'] = (100 * table['wall_seconds'] / report['wall_seconds']).round(1)
+    table['groups'] = table['groups'].map(lambda g: ', '.join(f'{k}={v}' for k, v in g.items()) if g else '')
+    return table.sort_values('wall_seconds', ascending=False, ignore_index=True)
@@ -0,0 +1,136 @@
+# inter-arrival times and jitter per flow, VLAN or subnet, for time-ordered captures
+import numpy as np
+import pandas as pd
+from src.addresses import int_to_ipv4
+from src.pcap_to_pandas import iter_pcap_csv
+from src.capture_filters import capture_filters
+
+# deltas are taken between consecutive packets with the same key...
+JITTER_KEYS = {'flow': ['ip.src', 'ip.dst', 'vlan.id'], 'vlan': ['vlan.id'], 'subnet': ['subnet']}
+# ...and their distribution is reported per these keys and time bin
+REPORT_KEYS = {'flow': ['vlan.id'], 'vlan': ['vlan.id'], 'subnet': ['subnet']}
+JITTER_QUANTILES = [0.5, 0.95, 0.99]
+
+
+def _keyed(df, by, prefix):
+    # the key columns (plus the report keys) for every packet; subnet = source address masked to the prefix
+    cols = {'vlan.id': df['vlan.id'].to_numpy()}
+    if by == 'flow':
+        cols.update({'ip.src': df['ip.src'].to_numpy(), 'ip.dst': df['ip.dst'].to_numpy()})
+    if by == 'subnet':
+        mask = np.uint32((0xffffffff << (32 - prefix)) & 0xffffffff)
+        cols['subnet'] = df['ip.src'].to_numpy() & mask
+    return pd.DataFrame(cols)
+
+
+def new_jitter_state(by='flow', prefix=24):
+    """Per-key state for inter_arrivals on consecutive chunks: the keys and their last time and delta, as flat arrays."""
+    return {'by': by, 'prefix': prefix, 'keys': None, 'last_time': np.zeros(0, dtype=np.int64), 'last_delta': np.zeros(0)}
+
+
+def inter_arrivals(df, by='flow', prefix=24, state=None):
+    """
+    Inter-arrival time and jitter (change of the inter-arrival time, RFC 3550 style) of every packet.
+
+    Packets are grouped by hashing their keys, so time-ordered captures need no multi-key sort.
+
+    Args:
+        df (pd.DataFrame): packets in time order
+        by (str): 'flow' (src, dst, vlan), 'vlan' or 'subnet' (source subnet)
+        prefix (int): subnet prefix length for by='subnet'
+        state (dict): from new_jitter_state, to continue flows across chunks (updated in place)
+
+    Returns:
+        pd.DataFrame: the report keys (REPORT_KEYS), 'frame.time_epoch', 'inter_arrival' and 'jitter' (seconds)
+    """
+    keys = JITTER_KEYS[by]
+    keyed = _keyed(df, by, prefix)
+    times = df['frame.time_epoch'].to_numpy().view(np.int64)
+    codes, uniques = pd.MultiIndex.from_frame(keyed[keys]).factorize()
+
+    # keys seen in earlier chunks start from their saved time and delta (as one leading pseudo packet each)
+    slots = state['keys'].get_indexer(uniques) if state is not None and state['keys'] is not None else np.full(len(uniques), -1)
+    known = np.flatnonzero(slots >= 0)
+    all_codes = np.concatenate([known, codes])
+    all_times = pd.Series(np.concatenate([state['last_time'][slots[known]] if len(known) else np.zeros(0, dtype=np.int64), times]))
+
+    delta = all_times.groupby(all_codes).diff()
+    if len(known):
+        delta.iloc[:len(known)] = state['last_delta'][slots[known]]
+    jitter = delta.groupby(all_codes).diff().abs()
+    delta, jitter = delta.to_numpy()[len(known):], jitter.to_numpy()[len(known):]
+
+    if state is not None:
+        # last packet of every key in this chunk (the last write of a repeated index wins)
+        last = np.empty(len(uniques), dtype=np.int64)
+        last[codes] = np.arange(len(codes))
+        new = slots < 0
+        state['last_time'][slots[~new]] = times[last[~new]]
+        state['last_delta'][slots[~new]] = delta[last[~new]]
+        state['keys'] = uniques[new] if state['keys'] is None else state['keys'].append(uniques[new])
+        state['last_time'] = np.concatenate([state['last_time'], times[last[new]]])
+        state['last_delta'] = np.concatenate([state['last_delta'], delta[last[new]]])
+
+    out = keyed[REPORT_KEYS[by]].copy()
+    out['frame.time_epoch'] = df['frame.time_epoch'].to_numpy()
+    out['inter_arrival'] = delta / 1e9
+    out['jitter'] = jitter / 1e9
+    return out
+
+
+def jitter_stats(deltas, by='flow', interval='1Min'):
+    """
+    Distribution of the inter-arrival times and jitter per report key and time bin.
+
+    Returns:
+        pd.DataFrame: the report keys, 'time_bin', 'packets', and count/mean/std/p50/p95/p99/max of
+        'inter_arrival' and 'jitter' (seconds)
+    """
+    keys = REPORT_KEYS[by] + ['time_bin']
+    deltas = deltas.assign(time_bin=deltas['frame.time_epoch'].dt.floor(interval))
+    grouped = deltas.groupby(keys)
+    stats = grouped.size().rename('packets').to_frame()
+    for col in ('inter_arrival', 'jitter'):
+        g = grouped[col]
+        stats[f'{col}_count'] = g.count()
+        stats[f'{col}_mean'] = g.mean()
+        stats[f'{col}_std'] = g.std(ddof=0)
+        for q in JITTER_QUANTILES:
+            stats[f'{col}_p{round(q * 100)}'] = g.quantile(q)
+        stats[f'{col}_max'] = g.max()
+    return stats.reset_index()
+
+
+def compute_jitter(df, by='flow', interval='1Min', prefix=24):
+    """Inter-arrival and jitter statistics per bin for a capture in memory (see inter_arrivals and jitter_stats)."""
+    if not df['frame.time_epoch'].is_monotonic_increasing:
+        # deltas need time order; a stable sort on the one time column keeps the capture order of ties
+        df = df.sort_values('frame.time_epoch', kind='stable')
+    return jitter_stats(inter_arrivals(df, by, prefix), by, interval)
+
+
+def stream_jitter(pcap_csv_file_path, by='flow', interval='1Min', prefix=24, chunksize=1_000_000, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None):
+    """
+    compute_jitter over a capture read in chunks.
+
+    Per key only the last packet time and inter-arrival time are kept (new_jitter_state), and the deltas of a
+    time bin are reduced to statistics once the chunks have moved past it. The capture is expected in time order.
+    """
+    state = new_jitter_state(by, prefix)
+    pending, done = None, []
+    for df in iter_pcap_csv(pcap_csv_file_path, chunksize=chunksize, filters=capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows)):
+        deltas = pd.concat([pending, inter_arrivals(df, by, prefix, state)], ignore_index=True)
+        closed = deltas['frame.time_epoch'] < df['frame.time_epoch'].min().floor(interval)
+        if closed.any():
+            done.append(jitter_stats(deltas[closed], by, interval))
+        pending = deltas[~closed]
+    if pending is not None and len(pending):
+        done.append(jitter_stats(pending, by, interval))
+    if not done:
+        return pd.DataFrame()
+    return pd.concat(done, ignore_index=True).sort_values(REPORT_KEYS[by] + ['time_bin'], ignore_index=True)
+
+
+def report_name(by, key, prefix=24):
+    # display name of a report key
+    return f'{int_to_ipv4(key)}/{prefix}' if by == 'subnet' else f'VLAN {key}'
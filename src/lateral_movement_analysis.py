@@ -1,65 +1,158 @@
-
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+from src.addresses import pair_key, int_to_ipv4
+from src.streaming import conversation_counts
+from src.flows import is_flows
+from src.my_plot import plot_job
+from src.pcap_to_pandas import iter_pcap_csv
+from src.capture_filters import capture_filters
+from src.distinct_counts import distinct_sketch, merge_distinct, distinct_counts, EXACT_ROWS
+
+FANOUT_QUANTILE = 0.90  # fan-out above this quantile of all (time bin, source) pairs is flagged
+PORTSPREAD_TARGETS = 5  # a source using one destination port on more targets than this (todo: change this value based on data?)
+PORTSCAN_PORTS = 20  # a source probing more destination ports than this in one time bin
+CHUNK_ROWS = 1_000_000  # packets / flow records sketched at once
 
-def lateral_movement_analysis(event_traffic, baseline_traffic=None, interval='10Min', save=False, save_path='plots/lateral/'):
-    if save:
-        os.makedirs(save_path, exist_ok=True)
 
-    event_traffic = event_traffic.copy()
-    
-    event_traffic['time_bin'] = event_traffic['frame.time_epoch'].dt.floor(interval)
+def _targets(data, interval):
+    # (time_bin, ip.src, ip.dst, l4.proto, dst_port) of the packets, or of every bin a flow record has packets in
+    # (a record is counted in the bins of its first and last packet, see flow_pairs)
+    columns = ['ip.src', 'ip.dst', 'l4.proto', 'l4.dstport']
+    if is_flows(data):
+        parts = [data[columns].assign(time_bin=data[col].dt.floor(interval)) for col in ('start_time', 'end_time')]
+        targets = pd.concat(parts, ignore_index=True)
+    else:
+        targets = data[columns].assign(time_bin=data['frame.time_epoch'].dt.floor(interval))
+    return targets.rename(columns={'l4.dstport': 'dst_port'})
+
+
+def lateral_sketches(data, interval='10Min', exact=False, known_peers=None):
+    """
+    Distinct-count sketches of a chunk of packets or flow records (see distinct_counts).
+
+    Returns:
+        dict: 'fanout' (destinations per time bin and source), 'port_spread' (destinations per time bin, source
+        and destination port - its groups are also the ports a source probes, see lateral_alerts) and, with
+        known_peers (sorted pair_key of the baseline's src->dst pairs), 'new_peers' (new destinations per source)
+    """
+    targets = _targets(data, interval)
+    ports = targets[targets['l4.proto'] > 0]  # only tcp/udp packets have ports
+    sketches = {
+        'fanout': distinct_sketch(targets, ['time_bin', 'ip.src'], 'ip.dst', exact),
+        'port_spread': distinct_sketch(ports, ['time_bin', 'ip.src', 'dst_port'], 'ip.dst', exact),
+    }
+    if known_peers is not None:
+        new_peer = ~np.isin(pair_key(targets['ip.src'], targets['ip.dst']), known_peers)
+        sketches['new_peers'] = distinct_sketch(targets[new_peer], ['ip.src'], 'ip.dst', exact)
+    return sketches
 
+
+def merge_lateral_sketches(parts):
+    """Merge the sketches of several chunks (or captures)."""
+    parts = [p for p in parts if p is not None]
+    return {name: merge_distinct([p[name] for p in parts]) for name in parts[0]}
+
+
+def _known_peers(baseline_traffic):
+    # src->dst peers packed into one uint64 key
+    # (the baseline can be the packets, aggregates or a baseline profile - its conversation keys are enough)
+    if baseline_traffic is None:
+        return None
+    if isinstance(baseline_traffic, dict):
+        baseline_traffic = conversation_counts(baseline_traffic)
+    return np.unique(pair_key(baseline_traffic['ip.src'], baseline_traffic['ip.dst']))
+
+
+def lateral_alerts(sketches, save=False, save_path='plots/lateral/'):
+    """Fan-out, port-spread, port-scan and new-peer alerts from merged sketches (see lateral_movement_analysis)."""
     # 1. Fan-out analysis
-    fanout = event_traffic.groupby(['time_bin', 'ip.src'])['ip.dst'].nunique().reset_index()
-    fanout.rename(columns={'ip.dst': 'unique_dsts'}, inplace=True)
+    fanout = distinct_counts(sketches['fanout'], 'unique_dsts').sort_values(['ip.src', 'time_bin'], ignore_index=True)
 
     # Flag sources with high fan-out (e.g., 90th percentile)
-    threshold = fanout['unique_dsts'].quantile(0.90)
+    threshold = fanout['unique_dsts'].quantile(FANOUT_QUANTILE)
     fanout['fanout_alert'] = fanout['unique_dsts'] > threshold
 
-    # 2. Port-target mapping (per source)
-    port_target_mapping = event_traffic.copy()
-    port_target_mapping['dst_port'] = port_target_mapping['tcp.dstport'].fillna(port_target_mapping['udp.dstport'])
-
-    # Count how many distinct IPs each source hits per port
-    port_targets = port_target_mapping.groupby(['ip.src', 'dst_port'])['ip.dst'].nunique().reset_index()
-    port_targets.rename(columns={'ip.dst': 'num_targets'}, inplace=True)
+    # 2. Port-target mapping (per source): how many distinct IPs each source hits per port, over all time bins
+    port_targets = distinct_counts(merge_distinct([sketches['port_spread']], ['ip.src', 'dst_port']), 'num_targets')
 
     # Flag if a port is used across many targets (e.g., 5+)
-    port_targets['portspread_alert'] = port_targets['num_targets'] > 5 # todo: change this value based on data?
+    port_targets['portspread_alert'] = port_targets['num_targets'] > PORTSPREAD_TARGETS
+
+    # 3. Port scans: how many distinct destination ports each source probes per time bin
+    # (the port_spread sketch has one group per port, so they are counted exactly without a sketch of their own)
+    port_scans = (sketches['port_spread']['table'].groupby(['time_bin', 'ip.src'], observed=True)['dst_port']
+                  .nunique().reset_index(name='num_ports'))
+    port_scans['portscan_alert'] = port_scans['num_ports'] > PORTSCAN_PORTS
 
-    # 3. New peer detection
+    # 4. New peer detection
     new_peers = pd.DataFrame()
-    if baseline_traffic is not None:
-        baseline_traffic['peer'] = baseline_traffic['ip.src'] + '->' + baseline_traffic['ip.dst']
-        event_traffic['peer'] = event_traffic['ip.src'] + '->' + event_traffic['ip.dst']
-        known_peers = set(baseline_traffic['peer'].unique())
-        event_traffic['new_peer'] = ~event_traffic['peer'].isin(known_peers)
-        new_peers = event_traffic[event_traffic['new_peer']].groupby('ip.src')['ip.dst'].nunique().reset_index()
-        new_peers.rename(columns={'ip.dst': 'new_unique_dsts'}, inplace=True)
-
-    for ip in fanout['ip.src'].unique():
-        ip_data = fanout[fanout['ip.src'] == ip]
-        if ip_data['fanout_alert'].any():
-            plt.figure(figsize=(12, 4))
-            plt.plot(ip_data['time_bin'], ip_data['unique_dsts'], label='Unique Destinations')
-            plt.axhline(y=threshold, color='red', linestyle='--', label='Fan-Out Threshold')
-            plt.title(f'Fan-Out Over Time for {ip}')
-            plt.xlabel('Time')
-            plt.ylabel('# Unique Destinations')
-            plt.legend()
-            plt.grid(True)
-            plt.tight_layout()
-            if save:
-                plt.savefig(f'{save_path}Fan-Out Over Time for {ip}).png')
-                plt.close()
-            else:
-                plt.show()
+    if 'new_peers' in sketches:
+        new_peers = distinct_counts(sketches['new_peers'], 'new_unique_dsts')
+        new_peers = new_peers[new_peers['new_unique_dsts'] > 0]
+
+    alerts = fanout[fanout['fanout_alert']]
+    for ip, ip_data in fanout[fanout['ip.src'].isin(alerts['ip.src'].unique())].groupby('ip.src'):
+        plot_job({'lines': [(ip_data['time_bin'].to_numpy(), ip_data['unique_dsts'].to_numpy(), {'label': 'Unique Destinations'})],
+                  'hlines': [(threshold, {'color': 'red', 'linestyle': '--', 'label': 'Fan-Out Threshold'})],
+                  'title': f'Fan-Out Over Time for {int_to_ipv4(ip)}', 'x_label': 'Time', 'y_label': '# Unique Destinations',
+                  'legend': True, 'filename': f'{save_path}Fan-Out Over Time for {int_to_ipv4(ip)}).png'}, save=save)
 
     return {
-        'fanout_alerts': fanout[fanout['fanout_alert']],
-        'portscan_alerts': portscan_summary[portscan_summary['portscan_alert']],
-        'new_peer_alerts': new_peers if not new_peers.empty else None
+        'fanout_alerts': alerts.reset_index(drop=True),
+        'portspread_alerts': port_targets[port_targets['portspread_alert']].reset_index(drop=True),
+        'portscan_alerts': port_scans[port_scans['portscan_alert']].reset_index(drop=True),
+        'new_peer_alerts': new_peers.reset_index(drop=True) if not new_peers.empty else None
     }
+
+
+def lateral_movement_analysis(event_traffic, baseline_traffic=None, interval='10Min', save=False, save_path='plots/lateral/', exact=None):
+    """
+    Fan-out, port-spread, port-scan and new-peer alerts for the event traffic.
+
+    Distinct destinations are counted with HyperLogLog sketches per source and time bin (and per source, port
+    and time bin), built CHUNK_ROWS rows at a time and merged, so a host scanning hundreds of thousands of
+    destinations on one port keeps at most 2**HLL_PRECISION register rows (see src/distinct_counts.py).
+
+    Args:
+        event_traffic (pd.DataFrame): packets or flow records (see assemble_flows)
+        baseline_traffic: packets, flow records, aggregates or a baseline profile; its src->dst pairs are the known peers
+        exact (bool): count exactly (True) or with sketches (False); by default exactly up to EXACT_ROWS rows
+
+    Returns:
+        dict: 'fanout_alerts', 'portspread_alerts', 'portscan_alerts' and 'new_peer_alerts' (None without new
+        peers or a baseline)
+    """
+    if save:
+        os.makedirs(save_path, exist_ok=True)
+    exact = len(event_traffic) <= EXACT_ROWS if exact is None else exact
+    known_peers = _known_peers(baseline_traffic)
+
+    merged = None
+    for start in range(0, max(len(event_traffic), 1), CHUNK_ROWS):
+        part = lateral_sketches(event_traffic.iloc[start:start + CHUNK_ROWS], interval, exact, known_peers)
+        merged = part if merged is None else merge_lateral_sketches([merged, part])
+    return lateral_alerts(merged, save, save_path)
+
+
+def stream_lateral_movement(pcap_csv_file_path, baseline_traffic=None, interval='10Min', chunksize=1_000_000, exact=False,
+                            save=False, save_path='plots/lateral/', vlan_filter=None, protocol_filter=None, time_filter=None,
+                            host_filter=None, subnet_filter=None, time_windows=None):
+    """
+    lateral_movement_analysis over a capture read in chunks: only the sketches are kept between chunks.
+    """
+    if save:
+        os.makedirs(save_path, exist_ok=True)
+    known_peers = _known_peers(baseline_traffic)
+    merged = None
+    for df in iter_pcap_csv(pcap_csv_file_path, chunksize=chunksize, filters=capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows)):
+        part = lateral_sketches(df, interval, exact, known_peers)
+        merged = part if merged is None else merge_lateral_sketches([merged, part])
+    if merged is None:
+        merged = lateral_sketches(_empty_targets(), interval, exact, known_peers)
+    return lateral_alerts(merged, save, save_path)
+
+
+def _empty_targets():
+    return pd.DataFrame({'ip.src': pd.Series(dtype='uint32'), 'ip.dst': pd.Series(dtype='uint32'), 'l4.proto': pd.Series(dtype='uint8'),
+                         'l4.dstport': pd.Series(dtype='uint16'), 'frame.time_epoch': pd.Series(dtype='datetime64[ns]')})
@@ -0,0 +1,179 @@
+# convert many captures (and large single captures) in parallel and merge them in time order
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from src.pcap_reader import is_pcap_file, iter_pcap
+from src.capture_schema import CAPTURE_COLUMNS
+from src.pcap_to_pandas import clean_capture
+from src.capture_cache import ROW_GROUP_ROWS
+
+CAPTURE_EXTENSIONS = ('.pcap', '.pcapng', '.cap', '.csv', '.tsv')
+SPLIT_SIZE = 256 * 1024 * 1024  # files bigger than this are decoded as several byte ranges in parallel
+
+
+def expand_captures(inputs):
+    """Expand directories and glob patterns into a sorted list of capture files."""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += [os.path.join(item, f) for f in os.listdir(item) if f.lower().endswith(CAPTURE_EXTENSIONS)]
+        else:
+            paths += glob.glob(item)
+    return sorted(set(paths))
+
+
+def plan_jobs(paths, split_size=SPLIT_SIZE):
+    # one job per file, or one per byte range for files larger than split_size
+    jobs = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if size <= split_size:
+            jobs.append((path, None))
+            continue
+        cuts = list(range(0, size, split_size)) + [size]
+        jobs += [(path, (start, stop)) for start, stop in zip(cuts, cuts[1:])]
+    return jobs
+
+
+def _read_csv_range(path, byte_range):
+    # tshark exports one packet per line, so a byte range is snapped to the next line starts
+    with open(path, 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n').split('\t')
+        header_end = f.tell()
+        start, stop = byte_range
+        if start > header_end:
+            f.seek(start - 1)
+            f.readline()  # finish the line that straddles the start
+        begin = max(f.tell(), header_end)
+        if stop < os.path.getsize(path):
+            f.seek(stop - 1)
+            f.readline()
+            stop = f.tell()
+        f.seek(begin)
+        data = f.read(max(0, stop - begin))
+    if not data:
+        return pd.DataFrame(columns=header)
+    return pd.read_csv(io.BytesIO(data), header=None, names=header, sep='\t')
+
+
+def decode_job(job):
+    """Decode one file (or one byte range of a file) into a cleaned, time-ordered DataFrame."""
+    path, byte_range = job
+    if is_pcap_file(path):
+        batches = list(iter_pcap(path, byte_range=byte_range))
+        df = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=CAPTURE_COLUMNS)
+    elif byte_range:
+        df = _read_csv_range(path, byte_range)
+    else:
+        df = pd.read_csv(path, header=0, sep='\t')
+    df = clean_capture(df)
+    return df.sort_values('frame.time_epoch', kind='stable', ignore_index=True)
+
+
+def iter_time_ordered(parts, rows=ROW_GROUP_ROWS):
+    """
+    k-way merge of time-ordered DataFrames, yielded as blocks in time order.
+
+    Each step takes the next `rows` rows of every part, cuts them all at the earliest of their last timestamps
+    and stable-sorts just that slice, so at most k * rows rows are reordered at a time. Ties stay in part order,
+    as with a stable sort of the concatenated parts.
+    """
+    parts = [p for p in parts if len(p)]
+    times = [p['frame.time_epoch'].to_numpy().view(np.int64) for p in parts]
+    cursors = [0] * len(parts)
+    while True:
+        active = [i for i, t in enumerate(times) if cursors[i] < len(t)]
+        if not active:
+            return
+        cutoff = min(times[i][min(cursors[i] + rows, len(times[i])) - 1] for i in active)
+        block = []
+        for i in active:
+            stop = int(np.searchsorted(times[i], cutoff, side='right'))
+            if stop > cursors[i]:
+                block.append(parts[i].iloc[cursors[i]:stop])
+                cursors[i] = stop
+        block = pd.concat(block, ignore_index=True)
+        order = np.argsort(block['frame.time_epoch'].to_numpy().view(np.int64), kind='stable')
+        yield block.take(order).reset_index(drop=True)
+
+
+def merge_time_ordered(parts):
+    """
+    k-way merge of time-ordered DataFrames (see iter_time_ordered).
+
+    The merged frame is a second copy of the parts, so this needs about twice the size of the capture in memory;
+    ingest_captures(output=...) writes the blocks straight to parquet instead.
+    """
+    blocks = list(iter_time_ordered(parts))
+    if not blocks:
+        return pd.DataFrame(columns=CAPTURE_COLUMNS)
+    return pd.concat(blocks, ignore_index=True)
+
+
+def write_time_ordered(parts, output):
+    """
+    Merge time-ordered DataFrames into a parquet file one block at a time, without building the merged frame.
+
+    Returns:
+        int: number of packets written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    tmp = f'{output}.tmp'
+    writer = None
+    written = 0
+    try:
+        for block in iter_time_ordered(parts):
+            table = pa.Table.from_pandas(block, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression='zstd')
+            # time-ordered row groups let time-window filters skip most of the file (see capture_filters)
+            writer.write_table(table.cast(writer.schema), row_group_size=ROW_GROUP_ROWS)
+            written += len(block)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame(columns=CAPTURE_COLUMNS).to_parquet(output, index=False)
+    else:
+        os.replace(tmp, output)
+    return written
+
+
+def ingest_captures(inputs, output=None, workers=None, split_size=SPLIT_SIZE):
+    """
+    Decode a directory, glob or list of captures on a process pool and merge them into one time-ordered dataset.
+
+    With an output file the merge is streamed to parquet, so only the decoded parts are held in memory; without
+    one the merged frame is built and returned (about twice the capture size, see merge_time_ordered).
+
+    Args:
+        inputs (str | list[str]): capture files, directories or glob patterns (pcap, pcapng or tshark csv exports)
+        output (str): optional .parquet file to write the merged dataset to (it can be passed to read_pcap_csv)
+        workers (int): processes to use (default: one per core)
+        split_size (int): files larger than this many bytes are split into ranges decoded in parallel
+
+    Returns:
+        pd.DataFrame | int: cleaned packets from every input, ordered by 'frame.time_epoch', or the number of
+        packets written when `output` is given
+    """
+    paths = expand_captures(inputs)
+    if not paths:
+        raise ValueError(f'no capture files found in {inputs}')
+
+    jobs = plan_jobs(paths, split_size)
+    if workers == 1 or len(jobs) == 1:
+        parts = [decode_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(decode_job, jobs))
+
+    if output:
+        return write_time_ordered(parts, output)
+    return merge_time_ordered(parts)
@@ -1,123 +1,265 @@
+import json
+import os
+import numpy as np
 import pandas as pd #sudo apt install python3-pandas
-import matplotlib.pyplot as plt
-import matplotlib.axes as ax
+from concurrent.futures import ProcessPoolExecutor
+from src import annotate_graph
 from src.annotate_graph import *
-import plotly.offline as py
-import plotly.graph_objs as go
-import plotly.express as px
-
-# draws the event windows onto the graph
-def add_events_to_graph(fig, y_max=1, events=None):    
-    if events is None: return
-
-    if type(fig) == ax.Axes:
-        for _, event in events.iterrows():
-            if pd.notnull(event['end_time']):
-                fig.axvspan(event['start_time'], event['end_time'], color='red', alpha=0.2)
-                fig.text(
-                    event['start_time'],
-                    fig.get_ylim()[1] * 0.999,
-                    event['label'],
-                    color='red',
-                    fontsize=9,
-                    verticalalignment='top'
-                )
-            else:
-                fig.axvline(event['start_time'], color='red', linestyle='--', linewidth=1)
-                fig.text(
-                    event['start_time'],
-                    fig.get_ylim()[1] * 0.999,
-                    event['label'],
-                    color='red',
-                    rotation=90,
-                    verticalalignment='top',
-                    fontsize=9
-                )
-    if type(fig) == go.Figure:
-        for _, event in events.iterrows():
-            if pd.notnull(event['end_time']):
-                fig.add_vline(x=event['start_time'])
-                fig.add_annotation(
-                    x=event['start_time'],
-                    y=y_max,
-                    text=event['label'],
-                    showarrow=True,
-                    arrowhead=2,
-                    arrowsize=1,
-                    arrowwidth=2,
-                    arrowcolor="red"
-                )
-            else:
-                fig.add_vline(x=event['start_time'])
-                fig.add_annotation(
-                    x=event['start_time'],
-                    y=y_max,
-                    text=event['label'],
-                    showarrow=True,
-                    arrowhead=2,
-                    arrowsize=1,
-                    arrowwidth=2,
-                    arrowcolor="red"
-                )
+from src.downsample import downsample, PLOT_POINTS
+from src.html_report import epoch_ms, encode_full, sidecar_script, figure_panel, write_dashboard
 
+# matplotlib and plotly are imported by the functions that draw with them, so importing this module
+# (and the metrics built on it) doesn't load a plotting backend that the run never uses
 
+# png rendering: plots are described as jobs (dicts of arrays + labels) and drawn by render_job, either
+# inline or on a process pool started with start_renderer(). Each process keeps one figure per size and
+# clears it between jobs instead of building a new figure every time.
+_pool = None
+_pending = []
+_templates = {}
+_dashboard = None  # figures collected for one html page (see start_dashboard)
+
+# draws the event windows onto the graph (matplotlib axes or plotly figure), as batched collections / shapes
+def add_events_to_graph(fig, y_max=1, events=None):
+    if events is None or not len(events): return
+
+    if hasattr(fig, 'axvspan'):  # matplotlib axes
+        annotate_graph.add_events_to_graph(fig, events)
+    else:  # plotly figure: one layout update for all the shapes and labels
+        shapes, annotations = event_shapes(events, y_max)
+        fig.update_layout(shapes=list(fig.layout.shapes) + shapes, annotations=list(fig.layout.annotations) + annotations)
+
+
+
+def start_renderer(workers=None):
+    """Render png plots on a process pool (Agg backend) until wait_for_plots() is called (inline on a single core)."""
+    global _pool
+    workers = workers or os.cpu_count() or 1
+    if _pool is None and workers > 1:
+        import matplotlib
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=matplotlib.use, initargs=('Agg',))
+    return _pool
+
+def wait_for_plots():
+    """Wait for every queued plot, re-raise the first rendering error and stop the pool."""
+    global _pool
+    try:
+        for future in _pending:
+            future.result()
+    finally:
+        _pending.clear()
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def _template(size):
+    # one reusable (not pyplot managed) figure per size in each process
+    if size not in _templates:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=size)
+        _templates[size] = (fig, fig.add_subplot())
+    fig, axes = _templates[size]
+    axes.clear()
+    return fig, axes
+
+def draw_job(job, axes):
+    # job: {'lines': [(x, y, kwargs)], 'scatter': [(x, y, kwargs)], 'hlines': [(y, kwargs)], 'title', 'x_label', 'y_label',
+    #       'legend' (None, True or a legend title), 'grid', 'events', 'ylim',
+    #       'bars': [(categories, heights, kwargs)] - series grouped side by side per category, kwargs 'error' draws
+    #       how far below each bar the true value can be}
+    for x, y, kwargs in job.get('lines', []):
+        axes.plot(x, y, **kwargs)
+    for x, y, kwargs in job.get('scatter', []):
+        axes.scatter(x, y, **kwargs)
+    _draw_bars(job.get('bars', []), axes)
+    for y, kwargs in job.get('hlines', []):
+        axes.axhline(y=y, **kwargs)
+    if job.get('ylim'):
+        axes.set_ylim(*job['ylim'])
+    axes.set_title(job['title'])
+    axes.set_xlabel(job['x_label'])
+    axes.set_ylabel(job['y_label'])
+    if job.get('grid', True):
+        axes.grid(True)
+    if job.get('legend'):
+        axes.legend(title=None if job['legend'] is True else job['legend'])
+    add_events_to_graph(axes, events=job.get('events'))
+
+def _draw_bars(bars, axes):
+    if not bars:
+        return
+    labels = [str(v) for v in bars[0][0]]
+    x = np.arange(len(labels))
+    width = 0.7 / len(bars) if len(bars) > 1 else 0.5
+    for i, (_, heights, kwargs) in enumerate(bars):
+        kwargs = dict(kwargs)
+        error = kwargs.pop('error', None)
+        offset = (i - (len(bars) - 1) / 2) * width
+        axes.bar(x + offset, heights, width, **kwargs)
+        if error is not None:  # the sketches overestimate: the true value lies between value - error and value
+            axes.errorbar(x + offset, heights, yerr=[error, np.zeros(len(error))], fmt='none', ecolor='black', capsize=3)
+    axes.set_xticks(x)
+    axes.set_xticklabels(labels, rotation=45, ha='right')
+
+def render_job(job):
+    fig, axes = _template(job.get('size', (12, 4)))
+    draw_job(job, axes)
+    fig.tight_layout()
+    fig.savefig(job['filename'])
+    return job['filename']
+
+def plot_job(job, save=True):
+    """Render a plot job to job['filename'] (queued if the renderer is running) or show it (and add it to the dashboard)."""
+    if _dashboard is not None:
+        _add_panel(*job_figure(job))
+    if not save:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(figsize=job.get('size', (12, 4)))
+        draw_job(job, axes)
+        fig.tight_layout()
+        plt.show()
+    elif _pool is not None:
+        _pending.append(_pool.submit(render_job, job))
+    else:
+        render_job(job)
+
+def pivot_job(pivot, title, x_label, y_label, size=(12,4), events=None, legend=True, filename=None):
+    # one line per pivot column (what pivot.plot() draws)
+    x = pivot.index.to_numpy()
+    lines = [(x, pivot[col].to_numpy(), {'label': str(col)}) for col in pivot.columns]
+    return {'lines': lines, 'title': title, 'x_label': x_label, 'y_label': y_label, 'size': size, 'events': events,
+            'legend': legend, 'filename': filename}
+
+def html_figure(lines, title, x_label, y_label, events=None, markers=None, hlines=None, legend=None, points=PLOT_POINTS, method='lttb'):
+    """
+    A WebGL (Scattergl) figure with every line downsampled to `points` points.
+
+    Args:
+        lines (list[tuple]): (x, y, name) per line, x sorted (lines sharing one x array share it in the full data)
+        markers (list[tuple]): (x, y, name) per series drawn as points
+        hlines (list[tuple]): (y, kwargs) horizontal lines (matplotlib-style 'color' and 'linestyle')
+        method (str): 'lttb' or 'minmax' (see downsample)
+
+    Returns:
+        tuple: the plotly figure and the full-resolution data ({'x': [float64 arrays], 'traces': [(x index, y)]}),
+        or None when no series had to be downsampled
+    """
+    import plotly.graph_objs as go
+    f = go.Figure()
+    xs, traces, downsampled, y_max = {}, [], False, None
+    for mode, series in (('lines', lines), ('markers', markers or [])):
+        for x, y, name in series:
+            x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+            keep = downsample(x, y, points, method)
+            downsampled |= len(keep) < len(y)
+            f.add_trace(go.Scattergl(x=x[keep], y=y[keep], mode=mode, name=str(name)))
+            traces.append((xs.setdefault(id(x), (len(xs), x))[0], y))
+            if len(y) and not np.isnan(y).all():
+                y_max = np.nanmax(y) if y_max is None else max(y_max, np.nanmax(y))
+    for y, kwargs in hlines or []:
+        f.add_hline(y=y, line_color=kwargs.get('color'), line_dash='dash' if kwargs.get('linestyle') == '--' else 'solid')
+    f.update_layout(title={'text': title.replace('\n', '<br>'), 'x': 0.5, 'xanchor': 'center'},
+                    xaxis_title=x_label,
+                    yaxis_title=y_label,
+                    showlegend=len(f.data) > 1 if legend is None else bool(legend))
+    if any(x.dtype.kind == 'M' for _, x in xs.values()):
+        f.update_xaxes(type='date')
+    add_events_to_graph(f, y_max=1 if y_max is None else y_max, events=events)
+    full = {'x': [epoch_ms(x) for _, x in xs.values()], 'traces': traces} if downsampled else None
+    return f, full
+
+def bar_figure(bars, title, x_label, y_label, legend=None, ylim=None):
+    """
+    A plotly bar chart of plot job bars ((categories, heights, kwargs) per series, grouped side by side; kwargs
+    'label' names a series, 'color' colors it and 'error' draws how far below each bar the true value can be).
+
+    Returns:
+        tuple: the plotly figure and None (bars are never downsampled)
+    """
+    import plotly.graph_objs as go
+    f = go.Figure()
+    for labels, heights, kwargs in bars:
+        error = kwargs.get('error')
+        error_y = None if error is None else {'type': 'data', 'symmetric': False, 'array': np.zeros(len(error)),
+                                              'arrayminus': np.asarray(error, dtype=np.float64)}
+        f.add_trace(go.Bar(x=[str(v) for v in labels], y=np.asarray(heights, dtype=np.float64), name=str(kwargs.get('label', y_label)),
+                           marker_color=kwargs.get('color'), error_y=error_y))
+    f.update_layout(barmode='group', title={'text': title.replace('\n', '<br>'), 'x': 0.5, 'xanchor': 'center'},
+                    xaxis_title=x_label, yaxis_title=y_label,
+                    showlegend=len(f.data) > 1 if legend is None else bool(legend))
+    if ylim:
+        f.update_yaxes(range=list(ylim))
+    return f, None
+
+def job_figure(job, points=PLOT_POINTS):
+    # the html_figure (bar_figure for bar charts) of a png plot job
+    if job.get('bars'):
+        return bar_figure(job['bars'], job['title'], job['x_label'], job['y_label'], job.get('legend'), job.get('ylim'))
+    def named(series):
+        return [(x, y, kwargs.get('label', job['y_label'])) for x, y, kwargs in series]
+    return html_figure(named(job.get('lines', [])), job['title'], job['x_label'], job['y_label'], events=job.get('events'),
+                       markers=named(job.get('scatter', [])), hlines=job.get('hlines'), legend=job.get('legend'), points=points)
+
+def write_html(f, full, filename, points=PLOT_POINTS):
+    """
+    Write a figure from html_figure to `filename` (.html). The full-resolution data goes to a `.data.js` sidecar
+    next to it (float64 arrays, base64) that the page only loads when the plot is zoomed.
+    """
+    if not filename.endswith('.html'):
+        filename = f'{filename}.html'
+    script = None
+    if full is not None:
+        sidecar = f'{filename[:-len(".html")]}.data.js'
+        name = os.path.basename(sidecar)
+        with open(sidecar, 'w') as out:
+            out.write(f'window.pcapPlotData[{json.dumps(name)}]({json.dumps(encode_full(full))});\n')
+        script = sidecar_script(name, points)
+    f.write_html(filename, include_plotlyjs=True, post_script=script, auto_open=False)
+    return filename
+
+def start_dashboard(filename='plots/dashboard.html', title='Capture analysis'):
+    """Collect every figure of the run (html plots and png plot jobs) into one page, written by finish_dashboard()."""
+    global _dashboard
+    _dashboard = {'filename': filename, 'title': title, 'panels': []}
+
+def finish_dashboard():
+    """Write the collected figures to the dashboard page and stop collecting. Returns its filename."""
+    global _dashboard
+    if _dashboard is None:
+        return None
+    dashboard, _dashboard = _dashboard, None
+    return write_dashboard(dashboard['panels'], dashboard['filename'], dashboard['title'])
+
+def _add_panel(f, full, points=PLOT_POINTS):
+    _dashboard['panels'].append(figure_panel(f, full, points))
 
 def plot_line(x, y, title, x_label, y_label, result='png', size=(12,4), save=True, save_path=None, events=None):
     filename = f'{save_path}{title.replace("\n", " - ")}'
 
     if result == 'png':
-        # save the png using matplotlib 
-        fig, ax = plt.subplots(figsize=size)
-        ax.plot(x,y)
-        plt.title(title)
-        plt.xlabel(x_label)
-        plt.ylabel(y_label)
-        plt.grid(True)
-        plt.tight_layout()
-
-        add_events_to_graph(ax, events)
-
-        if save:
-            plt.savefig(f'{filename}.png')
-            plt.close()
-        else:
-            plt.show()
+        plot_job({'lines': [(np.asarray(x), np.asarray(y), {})], 'title': title, 'x_label': x_label, 'y_label': y_label,
+                  'size': size, 'events': events, 'filename': f'{filename}.png'}, save=save)
 
     elif result == 'html':
-        # save fig as html to view in webbrowser later
-        f = go.Figure()
-        f.add_trace(go.Line(x=x, y=y))
-        f.update_layout(title={'text': title, 'x': 0.5, 'xanchor': 'center'}, 
-                        xaxis_title=x_label, 
-                        yaxis_title=y_label)
-        add_events_to_graph(f, y_max= y.max(), events=events)
-        py.plot(f, filename=f'{filename}.html', auto_open=False)
-
-def plot_pivot(pivot, title, x_label, y_label, result='png', size=(12,4), save=True, save_path=None, events=None):
+        # save fig as html to view in webbrowser later (downsampled, full resolution loaded on zoom)
+        f, full = html_figure([(x, y, y_label)], title, x_label, y_label, events=events)
+        if _dashboard is not None:
+            _add_panel(f, full)
+        else:
+            write_html(f, full, filename)
+
+def plot_pivot(pivot, title, x_label, y_label, result='png', size=(12,4), save=True, save_path=None, events=None, legend=True):
     filename = f'{save_path}{title.replace("\n", " - ")}'
 
     if result == 'png':
-        # save the png using matplotlib 
-        ax = pivot.plot(figsize=size)
-        plt.title(title)
-        plt.xlabel(x_label)
-        plt.ylabel(y_label)
-        plt.grid(True)
-        plt.tight_layout()
-
-        add_events_to_graph(ax, events)
-
-        if save:
-            plt.savefig(f'{filename}.png')
-            plt.close()
-        else:
-            plt.show()
+        plot_job(pivot_job(pivot, title, x_label, y_label, size=size, events=events, legend=legend, filename=f'{filename}.png'), save=save)
 
     elif result == 'html':
-        # save fig as html to interact with
-        f = px.line(pivot, x=pivot.index, y=pivot.columns)
-        add_events_to_graph(f, y_max=pivot.max().max(), events=events)
-        f.update_layout(title={'text': title, 'x': 0.5, 'xanchor': 'center'}, 
-                        xaxis_title=x_label, 
-                        yaxis_title=y_label)
-        py.plot(f, filename=f'{filename}', auto_open=False)
\ No newline at end of file
+        # save fig as html to interact with (one downsampled WebGL line per column)
+        x = pivot.index.to_numpy()
+        f, full = html_figure([(x, pivot[col].to_numpy(), col) for col in pivot.columns], title, x_label, y_label,
+                              events=events, legend=legend)
+        if _dashboard is not None:
+            _add_panel(f, full)
+        else:
+            write_html(f, full, filename)
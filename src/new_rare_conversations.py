@@ -1,14 +1,12 @@
 import pandas as pd
+from src.streaming import conversation_counts
 
 def detect_new_or_rare_conversations(df_baseline, df_event, rare_threshold=3):
     # need to look at the data and change the threshold base on what we see
     
-    def get_conversations(df):
-        conv = df.groupby(['ip.src', 'ip.dst', 'ip.proto']).size().reset_index(name='count')
-        return conv
-
-    base_convs = get_conversations(df_baseline)
-    event_convs = get_conversations(df_event)
+    # either frame can be the packets or the aggregates returned by stream_capture (the baseline also a baseline profile)
+    base_convs = conversation_counts(df_baseline)
+    event_convs = conversation_counts(df_event)
 
     # Merge on flow key
     merged = pd.merge(
@@ -1,25 +1,12 @@
 import pandas as pd #sudo apt install python3-pandas
-import matplotlib.pyplot as plt
 import os
-from src.annotate_graph import *
+from src.traffic_cube import get_cube, cube_series
+from src.my_plot import plot_job, pivot_job
 
 def plot_packet_count_trace(df, title, x_label='Time', y_label='Mbps', save=False, save_path=None, events=None):
-    fig, ax = plt.subplots(figsize=(12, 4))
-    ax.plot(df['frame.time_epoch'], df['packet_count'])
-    plt.title(title)
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.grid(True)
-    plt.tight_layout()
-
-    add_events_to_graph(ax, events)
-
-    if save:
-        filename = f'{save_path}{title.replace("\n","-")}.png'
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
+    plot_job({'lines': [(df['frame.time_epoch'].to_numpy(), df['packet_count'].to_numpy(), {})],
+              'title': title, 'x_label': x_label, 'y_label': y_label, 'events': events,
+              'filename': f'{save_path}{title.replace("\n","-")}.png'}, save=save)
 
 def plot_packet_count(data, graphs='overall', interval='1Min', save=False, save_path='plots/packet_count/', events=None, rolling_window=None):
     """
@@ -27,6 +14,7 @@ def plot_packet_count(data, graphs='overall', interval='1Min', save=False, save_
 
     Args:
         data (pd.DataFrame | list[baseline_df, event_df] of df (pd.DataFrame): DataFrame with 'frame.time_epoch', 'frame.len', 'vlan.id', and 'ip.proto'
+            (or a traffic cube from build_cube, or the aggregates returned by stream_capture)
         graphs (str | list[string]): Choose which graphs to plot (e.g. 'overall', 'vlan', 'protocol')
         interval (str): Resample interval (e.g., '1S', '1Min', '10Min')
         save (bool): If True, saves plots as PNGs
@@ -41,17 +29,15 @@ def plot_packet_count(data, graphs='overall', interval='1Min', save=False, save_
     if isinstance(data, list) and len(data) == 2:
         baseline, event = data
         names= ['Baseline', 'Event']
-    elif isinstance(data, pd.DataFrame):
+    elif isinstance(data, (pd.DataFrame, dict)):
         data = [data]
         names = ['Data']
     else:
-        raise ValueError("First arg must be a DataFrame, or list containing two DataFrames")
+        raise ValueError("First arg must be a DataFrame (or aggregates), or list containing two of them")
     
     for x in range(len(data)):
-        df = data[x].copy()
-
         # Group and count packets
-        grouped = df.groupby(['vlan.id', 'protocol', pd.Grouper(key='frame.time_epoch', freq=interval)]).size().reset_index(name='packet_count')
+        grouped = cube_series(get_cube(data[x], interval), ['vlan.id', 'protocol', 'frame.time_epoch'], 'packet_count')
         
         # apply rolling window
         if rolling_window:
@@ -61,18 +47,10 @@ def plot_packet_count(data, graphs='overall', interval='1Min', save=False, save_
             pivot = grouped.pivot_table(index='frame.time_epoch', columns='vlan.id', values='packet_count').fillna(0)
 
             # Plot
-            ax = pivot.plot(figsize=(14, 6), title=f'Total Packets per VLAN\n({names[x]} - All Protocols - {interval})')
-            plt.xlabel('Time')
-            plt.ylabel('Packets')
-            plt.legend(title='VLAN ID')
-            plt.tight_layout()
-
-            add_events_to_graph(ax, events)
-            if save:
-                plt.savefig(f'{save_path}Total Packets per VLAN ({names[x]} - All Protocols - {interval}).png')
-                plt.close()
-            else:
-                plt.show()
+            job = pivot_job(pivot, f'Total Packets per VLAN\n({names[x]} - All Protocols - {interval})', 'Time', 'Packets',
+                            size=(14, 6), events=events, legend='VLAN ID',
+                            filename=f'{save_path}Total Packets per VLAN ({names[x]} - All Protocols - {interval}).png')
+            plot_job(dict(job, grid=False), save=save)
         if 'vlan' in graphs:
             # Get unique VLANs
             vlan_ids = grouped['vlan.id'].unique()
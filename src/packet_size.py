@@ -1,24 +1,12 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-from src.annotate_graph import *
+from src.traffic_cube import get_cube, size_stats
+from src.my_plot import plot_job, pivot_job
 
 def plot_avg_packet_size(df, title, x_label='Time', y_label='Avg Packet Size (Bytes)', save=False, save_path=None, events=None):
-    fig, ax = plt.subplots(figsize=(12, 4))
-    ax.plot(df['frame.time_epoch'], df['avg_packet_size'])
-    plt.title(title)
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.grid(True)
-    plt.tight_layout()
-    add_events_to_graph(ax, events)
-
-    if save:
-        filename = f"{save_path}{title.replace('\n', '-')}.png"
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
+    plot_job({'lines': [(df['frame.time_epoch'].to_numpy(), df['avg_packet_size'].to_numpy(), {})],
+              'title': title, 'x_label': x_label, 'y_label': y_label, 'events': events,
+              'filename': f"{save_path}{title.replace('\n', '-')}.png"}, save=save)
 
 
 def plot_avg_packet_sizes(data, graphs='overall', interval='1Min', save=False, save_path='plots/avg_packet_size/', events=None, rolling_window=None):
@@ -26,7 +14,7 @@ def plot_avg_packet_sizes(data, graphs='overall', interval='1Min', save=False, s
     Plot average packet size (bytes) per time interval.
 
     Args:
-        df (pd.DataFrame): DataFrame with 'frame.time_epoch', 'frame.len', 'vlan.id', and 'ip.proto'
+        df (pd.DataFrame): DataFrame with 'frame.time_epoch', 'frame.len', 'vlan.id', and 'ip.proto' (or a traffic cube from build_cube, or the aggregates returned by stream_capture)
         graphs (str): 'overall', 'vlan', or 'protocol'
         interval (str): Time bucket size
         save (bool): Save PNGs
@@ -41,22 +29,15 @@ def plot_avg_packet_sizes(data, graphs='overall', interval='1Min', save=False, s
     # determine if data is one DataFrame or two
     if isinstance(data, list) and len(data) == 2:
         names= ['Baseline', 'Event']
-    elif isinstance(data, pd.DataFrame):
+    elif isinstance(data, (pd.DataFrame, dict)):
         data = [data]
         names = ['Data']
     else:
-        raise ValueError("First arg must be a DataFrame, or list containing two DataFrames")
+        raise ValueError("First arg must be a DataFrame (or aggregates), or list containing two of them")
     
     for x in range(len(data)):
-        df = data[x].copy()
-
-        # Compute total bytes and count of packets
-        bytes_grouped = df.groupby(['vlan.id', 'ip.proto', pd.Grouper(key='frame.time_epoch', freq=interval)])['frame.len'].sum().reset_index(name='total_bytes')
-        count_grouped = df.groupby(['vlan.id', 'ip.proto', pd.Grouper(key='frame.time_epoch', freq=interval)]).size().reset_index(name='packet_count')
-
-        # Merge and calculate average
-        merged = pd.merge(bytes_grouped, count_grouped, on=['vlan.id', 'ip.proto', 'frame.time_epoch'])
-        merged['avg_packet_size'] = merged['total_bytes'] / merged['packet_count']
+        # total bytes and count of packets -> average packet size, all from one pass over the packets
+        merged = size_stats(get_cube(data[x], interval), ['vlan.id', 'ip.proto', 'frame.time_epoch'])
 
         # Apply smoothing
         if rolling_window:
@@ -66,18 +47,10 @@ def plot_avg_packet_sizes(data, graphs='overall', interval='1Min', save=False, s
 
         if 'overall' in graphs:
             pivot = merged.pivot_table(index='frame.time_epoch', columns='vlan.id', values='avg_packet_size').fillna(0)
-            ax = pivot.plot(figsize=(12, 4), title=f'Average Packet Size per VLAN\n({names[x]} - {interval})')
-            plt.xlabel('Time')
-            plt.ylabel('Avg Packet Size (Bytes)')
-            plt.legend(title='VLAN ID')
-            plt.tight_layout()
-            add_events_to_graph(ax, events)
-
-            if save:
-                plt.savefig(f"{save_path}Average Packet Size for VLAN - ({names[x]} - {interval}).png")
-                plt.close()
-            else:
-                plt.show()
+            job = pivot_job(pivot, f'Average Packet Size per VLAN\n({names[x]} - {interval})', 'Time', 'Avg Packet Size (Bytes)',
+                            events=events, legend='VLAN ID',
+                            filename=f"{save_path}Average Packet Size for VLAN - ({names[x]} - {interval}).png")
+            plot_job(dict(job, grid=False), save=save)
 
         if 'vlan' in graphs:
             for vlan in merged['vlan.id'].unique():
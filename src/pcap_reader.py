@@ -0,0 +1,361 @@
+# read pcap / pcapng files straight into pandas (no tshark round trip)
+import mmap
+import struct
+from array import array
+
+import numpy as np
+import pandas as pd
+from src.capture_schema import CAPTURE_COLUMNS, CAPTURE_DTYPES
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),  # little endian, microseconds
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),  # big endian, microseconds
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),  # little endian, nanoseconds
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),  # big endian, nanoseconds
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+LINKTYPE_ETHERNET = 1
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+# bytes of each frame we need to decode eth + 2 vlan tags + ipv4 (with options) + tcp/udp ports
+SNAP_LEN = 96
+
+# used to find record boundaries when a file is split into byte ranges
+MAX_SNAPLEN = 262144
+RESYNC_RECORDS = 8
+PCAPNG_BLOCK_TYPES = {0x0A0D0D0A, 1, 2, 3, 4, 5, 6, 7, 9, 10, 0x0BAD, 0x40000BAD}
+
+
+def is_pcap_file(path):
+    """Return True if the file starts with a pcap or pcapng magic number."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return magic in PCAP_MAGIC or magic == PCAPNG_MAGIC
+
+
+def _walk_pcap(buf, endian, start=24, stop=None):
+    # record headers chain through incl_len, so finding them is the only sequential step
+    linktype = struct.unpack_from(endian + 'I', buf, 20)[0]
+    unpack = struct.Struct(endian + 'I').unpack_from
+    positions = array('q')
+    pos, end = start, len(buf)
+    stop = end if stop is None else stop
+    while pos < stop and pos + 16 <= end:
+        incl = unpack(buf, pos + 8)[0]
+        if pos + 16 + incl > end:
+            break  # truncated last record (e.g. a capture that is still being written)
+        positions.append(pos)
+        pos += 16 + incl
+    return np.frombuffer(positions, dtype=np.int64), linktype
+
+
+def _resync_pcap(buf, endian, resolution, pos):
+    # find the first record header at or after pos: a chain of RESYNC_RECORDS headers has to look valid
+    header = struct.Struct(endian + 'IIII').unpack_from
+    snaplen = struct.unpack_from(endian + 'I', buf, 16)[0] or MAX_SNAPLEN
+    frac_limit = round(1 / resolution)
+    end = len(buf)
+    for candidate in range(max(pos, 24), end - 15):
+        p, prev_sec, valid = candidate, None, True
+        for _ in range(RESYNC_RECORDS):
+            if p == end:
+                break
+            if p + 16 > end:
+                valid = False
+                break
+            sec, frac, incl, orig = header(buf, p)
+            if incl > min(snaplen, MAX_SNAPLEN) or incl > orig or frac >= frac_limit or (prev_sec is not None and abs(sec - prev_sec) > 86400):
+                valid = False
+                break
+            p, prev_sec = p + 16 + incl, sec
+        if valid and p <= end:
+            return candidate
+    return end
+
+
+def _walk_pcapng(buf, start=0, stop=None):
+    # collect enhanced/simple packet blocks and the interface description blocks they refer to
+    endian = '<' if buf[8:12] == b'\x4d\x3c\x2b\x1a' else '>'
+    unpack = struct.Struct(endian + 'II').unpack_from
+    epb, spb = array('q'), array('q')
+    interfaces = []  # (linktype, ts resolution) per interface id, in file order
+    if start > 0:
+        # a range in the middle of the file still needs the interfaces described at the start of it
+        interfaces = _walk_pcapng(buf, 0, _first_packet_block(buf, endian))[2]
+    pos, end = start, len(buf)
+    stop = end if stop is None else stop
+    while pos < stop and pos + 12 <= end:
+        block_type, block_len = unpack(buf, pos)
+        if block_len < 12 or pos + block_len > end:
+            break
+        if block_type == 6:
+            epb.append(pos)
+        elif block_type == 3:
+            spb.append(pos)
+        elif block_type == 1 and start == 0:
+            linktype = struct.unpack_from(endian + 'H', buf, pos + 8)[0]
+            interfaces.append((linktype, _if_tsresol(buf, pos, block_len, endian)))
+        elif block_type == 0x0A0D0D0A and buf[pos + 8:pos + 12] != buf[8:12]:
+            raise ValueError('pcapng sections with mixed byte order are not supported')
+        pos += block_len
+    return np.frombuffer(epb, dtype=np.int64), np.frombuffer(spb, dtype=np.int64), interfaces, endian
+
+
+def _first_packet_block(buf, endian):
+    unpack = struct.Struct(endian + 'II').unpack_from
+    pos, end = 0, len(buf)
+    while pos + 12 <= end:
+        block_type, block_len = unpack(buf, pos)
+        if block_type in (3, 6) or block_len < 12:
+            break
+        pos += block_len
+    return pos
+
+
+def _resync_pcapng(buf, pos):
+    # find the first block at or after pos: blocks are 4-byte aligned and repeat their length at the end
+    endian = '<' if buf[8:12] == b'\x4d\x3c\x2b\x1a' else '>'
+    unpack = struct.Struct(endian + 'I').unpack_from
+    end = len(buf)
+    for candidate in range((pos + 3) // 4 * 4, end - 11, 4):
+        p, valid = candidate, True
+        for _ in range(RESYNC_RECORDS):
+            if p == end:
+                break
+            if p + 12 > end:
+                valid = False
+                break
+            block_type, block_len = unpack(buf, p)[0], unpack(buf, p + 4)[0]
+            if (block_type not in PCAPNG_BLOCK_TYPES or block_len < 12 or block_len % 4 or p + block_len > end
+                    or unpack(buf, p + block_len - 4)[0] != block_len):
+                valid = False
+                break
+            p += block_len
+        if valid:
+            return candidate
+    return end
+
+
+def _if_tsresol(buf, pos, block_len, endian):
+    # walk the IDB options looking for if_tsresol (code 9), default is microseconds
+    opt, end = pos + 16, pos + block_len - 4
+    while opt + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', buf, opt)
+        if code == 0:
+            break
+        if code == 9:
+            value = buf[opt + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        opt += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def _gather_u32(data, positions, offset, endian):
+    # read one uint32 field from a fixed offset of every record header
+    idx = positions[:, None] + offset + np.arange(4)
+    return data[idx].copy().view(endian + 'u4').ravel().astype(np.int64)
+
+
+def _snap(data, starts, caplen):
+    # copy the first SNAP_LEN bytes of every frame into a (n, SNAP_LEN) array, zero padded
+    cols = np.arange(SNAP_LEN)
+    idx = starts[:, None] + cols
+    np.minimum(idx, len(data) - 1, out=idx)
+    frames = data[idx]
+    frames[cols >= caplen[:, None]] = 0
+    return frames
+
+
+def _be(frames, rows, off, nbytes):
+    # big endian integer starting at a per-row byte offset
+    value = np.zeros(len(rows), dtype=np.int64)
+    for i in range(nbytes):
+        value = (value << 8) | frames[rows, np.minimum(off + i, SNAP_LEN - 1)]
+    return value
+
+
+def _decode_frames(frames, caplen, ethernet):
+    """Vectorized decode of Ethernet/802.1Q/IPv4/TCP/UDP headers for a batch of frames."""
+    n = len(frames)
+    rows = np.arange(n)
+    zero = np.zeros(n, dtype=np.int64)
+    cols = {}
+
+    cols['eth.dst'] = np.where(ethernet, _be(frames, rows, zero, 6), -1)
+    cols['eth.src'] = np.where(ethernet, _be(frames, rows, zero + 6, 6), -1)
+
+    # up to two vlan tags (802.1Q / QinQ) - tshark style: report the outer tag
+    ethertype = np.where(ethernet, _be(frames, rows, zero + 12, 2), -1)
+    l3 = zero + 14
+    vlan = np.full(n, -1, dtype=np.int64)
+    for _ in range(2):
+        tagged = np.isin(ethertype, ETHERTYPE_VLAN) & (caplen >= l3 + 4)
+        tag = _be(frames, rows, l3, 2) & 0x0fff
+        vlan = np.where(tagged & (vlan < 0), tag, vlan)
+        ethertype = np.where(tagged, _be(frames, rows, l3 + 2, 2), ethertype)
+        l3 = np.where(tagged, l3 + 4, l3)
+    cols['vlan.id'] = vlan
+
+    # ipv4
+    version_ihl = frames[rows, l3].astype(np.int64)
+    ihl = (version_ihl & 0x0f) * 4
+    ipv4 = (ethertype == ETHERTYPE_IPV4) & (version_ihl >> 4 == 4) & (ihl >= 20) & (caplen >= l3 + 20)
+    proto = frames[rows, np.minimum(l3 + 9, SNAP_LEN - 1)].astype(np.int64)
+    cols['ip.proto'] = np.where(ipv4, proto, -1)
+    cols['ip.id'] = np.where(ipv4, _be(frames, rows, l3 + 4, 2), -1)
+    cols['ip.src'] = np.where(ipv4, _be(frames, rows, l3 + 12, 4), -1)
+    cols['ip.dst'] = np.where(ipv4, _be(frames, rows, l3 + 16, 4), -1)
+
+    # tcp/udp ports are only present in the first fragment
+    l4 = l3 + ihl
+    first_fragment = (_be(frames, rows, l3 + 6, 2) & 0x1fff) == 0
+    has_ports = ipv4 & first_fragment & (caplen >= l4 + 4) & (l4 + 4 <= SNAP_LEN) & np.isin(proto, (6, 17))
+    cols['l4.proto'] = np.where(has_ports, proto, -1)
+    cols['l4.srcport'] = np.where(has_ports, _be(frames, rows, l4, 2), -1)
+    cols['l4.dstport'] = np.where(has_ports, _be(frames, rows, l4 + 2, 2), -1)
+
+    return cols
+
+
+def _to_frame(time_epoch, frame_len, cols):
+    # fields that aren't present (-1) are stored as 0, see src/capture_schema.py
+    df = pd.DataFrame({'frame.time_epoch': time_epoch, 'frame.len': frame_len.astype(CAPTURE_DTYPES['frame.len'])})
+    for name in CAPTURE_COLUMNS[2:]:
+        df[name] = np.maximum(cols[name], 0).astype(CAPTURE_DTYPES[name])
+    return df
+
+
+def _pcap_batches(data, buf, batch_size, byte_range=None, start=None):
+    endian, resolution = PCAP_MAGIC[bytes(buf[:4])]
+    if start:
+        positions, linktype = _walk_pcap(buf, endian, start, byte_range[1] if byte_range else None)
+    elif byte_range:
+        positions, linktype = _walk_pcap(buf, endian, _resync_pcap(buf, endian, resolution, byte_range[0]), byte_range[1])
+    else:
+        positions, linktype = _walk_pcap(buf, endian)
+    for start in range(0, len(positions), batch_size):
+        pos = positions[start:start + batch_size]
+        sec = _gather_u32(data, pos, 0, endian)
+        frac = _gather_u32(data, pos, 4, endian)
+        caplen = _gather_u32(data, pos, 8, endian)
+        frame_len = _gather_u32(data, pos, 12, endian)
+        ethernet = np.full(len(pos), linktype == LINKTYPE_ETHERNET)
+        yield sec + frac * resolution, frame_len, pos + 16, caplen, ethernet, pos + 16 + caplen
+
+
+def _pcapng_batches(data, buf, batch_size, byte_range=None, start=None):
+    if start:
+        epb, spb, interfaces, endian = _walk_pcapng(buf, start, byte_range[1] if byte_range else None)
+    elif byte_range:
+        epb, spb, interfaces, endian = _walk_pcapng(buf, _resync_pcapng(buf, byte_range[0]) if byte_range[0] else 0, byte_range[1])
+    else:
+        epb, spb, interfaces, endian = _walk_pcapng(buf)
+    if not interfaces:
+        return
+    linktypes = np.array([i[0] for i in interfaces])
+    resolutions = np.array([i[1] for i in interfaces])
+
+    for start in range(0, len(epb), batch_size):
+        pos = epb[start:start + batch_size]
+        iface = np.minimum(_gather_u32(data, pos, 8, endian), len(interfaces) - 1)
+        ts = (_gather_u32(data, pos, 12, endian) << 32) | _gather_u32(data, pos, 16, endian)
+        caplen = _gather_u32(data, pos, 20, endian)
+        frame_len = _gather_u32(data, pos, 24, endian)
+        ethernet = linktypes[iface] == LINKTYPE_ETHERNET
+        yield ts * resolutions[iface], frame_len, pos + 28, caplen, ethernet, pos + _gather_u32(data, pos, 4, endian)
+
+    # simple packet blocks carry no timestamp and always belong to interface 0
+    for start in range(0, len(spb), batch_size):
+        pos = spb[start:start + batch_size]
+        frame_len = _gather_u32(data, pos, 8, endian)
+        block_len = _gather_u32(data, pos, 4, endian)
+        caplen = np.minimum(frame_len, block_len - 16)
+        ethernet = np.full(len(pos), linktypes[0] == LINKTYPE_ETHERNET)
+        yield np.full(len(pos), np.nan), frame_len, pos + 12, caplen, ethernet, pos + block_len
+
+
+def iter_pcap(path, batch_size=65536, byte_range=None, start=None):
+    """
+    Decode a pcap or pcapng file in batches of packets.
+
+    Args:
+        path (str): pcap or pcapng file
+        batch_size (int): packets decoded per vectorized batch (bounds the temporary memory used)
+        byte_range (tuple[int, int]): only decode the records whose header starts in [start, stop).
+            Record boundaries are found by checking a chain of headers, so a file can be split into
+            independent ranges at arbitrary byte offsets.
+        start (int): continue from this record boundary (the 'end_offset' of a previous read), e.g. to
+            pick up the packets appended to a capture that is still being written. With a byte_range as
+            well, the records from `start` that begin before byte_range[1] are decoded (no resync needed,
+            used to read the regions of a time index)
+
+    Yields:
+        pd.DataFrame: one frame per batch in the compact capture schema (CAPTURE_COLUMNS), with
+        'frame.time_epoch' still in epoch seconds. df.attrs['end_offset'] is the byte offset just past
+        the last record of the batch. A truncated record at the end of the file is left for the next read.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = np.frombuffer(buf, dtype=np.uint8)
+
+    batches = _pcapng_batches if bytes(buf[:4]) == PCAPNG_MAGIC else _pcap_batches
+    for time_epoch, frame_len, starts, caplen, ethernet, ends in batches(data, buf, batch_size, byte_range, start):
+        frames = _snap(data, starts, caplen)
+        cols = _decode_frames(frames, caplen, ethernet)
+        df = _to_frame(time_epoch, frame_len, cols)
+        df.attrs['end_offset'] = int(ends.max())
+        yield df
+
+
+def iter_record_times(path, batch_size=1_000_000):
+    """
+    Timestamps and byte offsets of the records of a pcap or pcapng file, without decoding the packets.
+
+    Yields:
+        tuple: (times as int64 epoch nanoseconds, record offsets, offset just past the last record) per batch
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = np.frombuffer(buf, dtype=np.uint8)
+
+    if bytes(buf[:4]) == PCAPNG_MAGIC:
+        epb, spb, interfaces, endian = _walk_pcapng(buf)
+        if len(spb):
+            raise ValueError('simple packet blocks carry no timestamp')
+        if not interfaces:
+            return
+        # ticks -> ns, exactly for the usual decimal resolutions
+        scale = np.array([i[1] for i in interfaces]) * 1e9
+        whole = np.where(scale >= 1, np.round(scale), 0).astype(np.int64)
+        for start in range(0, len(epb), batch_size):
+            pos = epb[start:start + batch_size]
+            iface = np.minimum(_gather_u32(data, pos, 8, endian), len(interfaces) - 1)
+            ts = (_gather_u32(data, pos, 12, endian) << 32) | _gather_u32(data, pos, 16, endian)
+            exact = np.isclose(scale[iface], whole[iface])
+            ns = np.where(exact, ts * whole[iface], (ts * scale[iface]).astype(np.int64))
+            yield ns, pos, int((pos + _gather_u32(data, pos, 4, endian)).max())
+        return
+
+    endian, resolution = PCAP_MAGIC[bytes(buf[:4])]
+    positions, _ = _walk_pcap(buf, endian)
+    for start in range(0, len(positions), batch_size):
+        pos = positions[start:start + batch_size]
+        ns = _gather_u32(data, pos, 0, endian) * 1_000_000_000 + _gather_u32(data, pos, 4, endian) * round(resolution * 1e9)
+        yield ns, pos, int((pos + 16 + _gather_u32(data, pos, 8, endian)).max())
+
+
+def read_pcap(path, batch_size=65536):
+    """
+    Read a pcap or pcapng file into a DataFrame with the fields tshark exports with
+    files/param_list.txt (in the compact capture schema), so it can be used in place of
+    pcap_to_csv.sh + pd.read_csv.
+
+    The file is memory mapped and the headers are decoded in vectorized batches.
+    Only Ethernet link types are decoded; other frames keep their time and length.
+    """
+    batches = list(iter_pcap(path, batch_size))
+    if not batches:
+        return pd.DataFrame(columns=CAPTURE_COLUMNS)
+    return pd.concat(batches, ignore_index=True)
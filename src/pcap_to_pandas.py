@@ -1,26 +1,127 @@
 # read pcap into pandas
+import numpy as np
 import pandas as pd #sudo apt install python3-pandas
+from src.pcap_reader import is_pcap_file, read_pcap, iter_pcap
+from src.capture_cache import load_cached_capture, save_cached_capture, iter_cached_capture, iter_parquet, cache_chunks
+from src.capture_filters import capture_filters, apply_filters, parquet_filters, filter_windows
+from src.time_index import load_time_index, iter_time_windows
+from src.capture_schema import apply_capture_dtypes, compact_capture, protocol_map, protocol_names, CAPTURE_COLUMNS
+from src.enrichment import as_asset_map, host_labels, subnet_labels
 
 # ingest pcap into pandas
 # analysis (magic)
 
-print("Reading csv file into Pandas...")
-
-def read_pcap_csv(pcap_csv_file_path):
-    # read the csv
-    df = pd.read_csv(pcap_csv_file_path, header=0, sep="\t")
+def clean_capture(df):
+    # tshark text export -> compact schema (integer addresses, one src/dst port pair), see src/capture_schema.py
+    # (the pcap reader already produces it)
+    if 'tcp.srcport' in df.columns:
+        df = compact_capture(df)
 
     # clean the data
     df['frame.time_epoch'] = pd.to_datetime(df['frame.time_epoch'], unit='s')
-    df['frame.len'] = df['frame.len'].astype(int)
 
     # df.set_index('frame.time_epoch', inplace=True)
 
-    # # add vlans - todo: remove
-    df['vlan.id'] = 1
-    df.iloc[1::2].loc[:,'vlan.id']=2
-    ####
+    # fixed dtypes, so a fresh parse and a cache hit return the same frame
+    # (untagged frames have no vlan.id and end up on vlan 0)
+    return apply_capture_dtypes(df)
+
+def read_pcap_csv(pcap_csv_file_path, cache=True, filters=None):
+    # filters (see capture_filters) are applied while reading: parquet predicates for the cache and merged
+    # captures, and per decoded chunk (before anything else is done with the rows) for pcap and csv files
+
+    # merged captures written by ingest_captures are already cleaned
+    if pcap_csv_file_path.endswith('.parquet'):
+        return apply_filters(pd.read_parquet(pcap_csv_file_path, filters=parquet_filters(filters)), filters)
+
+    # reuse the parsed capture from a previous run if the file hasn't changed
+    if cache:
+        df = load_cached_capture(pcap_csv_file_path, filters)
+        if df is not None:
+            return df
+
+    if filters:
+        # a time window seeks to the regions of the capture that overlap it (see time_index), anything else is
+        # decoded in chunks keeping only the matching rows (the cache entry is still written for the whole capture)
+        chunks = _window_chunks(pcap_csv_file_path, filters, 1_000_000, cache)
+        if chunks is None:
+            chunks = _decoded_chunks(pcap_csv_file_path, 1_000_000)
+            if cache:
+                chunks = cache_chunks(pcap_csv_file_path, chunks)
+        parts = [apply_filters(df, filters) for df in chunks]
+        return pd.concat(parts, ignore_index=True) if parts else apply_capture_dtypes(pd.DataFrame(columns=CAPTURE_COLUMNS))
+
+    # read the csv (or decode the pcap/pcapng directly, skipping the tshark export)
+    if is_pcap_file(pcap_csv_file_path):
+        df = read_pcap(pcap_csv_file_path)
+    else:
+        df = pd.read_csv(pcap_csv_file_path, header=0, sep="\t")
+
+    df = clean_capture(df)
+
+    if cache:
+        save_cached_capture(pcap_csv_file_path, df)
 
     return df
 
+def iter_pcap_csv(pcap_csv_file_path, chunksize=1_000_000, cache=True, filters=None):
+    """
+    Read a capture in chunks of at most `chunksize` packets, so captures larger than RAM can be processed.
+
+    Each chunk is cleaned the same way as read_pcap_csv, and only the packets passing `filters` (see
+    capture_filters) are kept: cached and parquet captures skip the row groups that can't match, and a time
+    window only reads the regions of a pcap/csv that overlap it (see time_index). An existing cache entry is read;
+    without one the chunks of a full read are written to a new entry as they are decoded.
+    """
+    if pcap_csv_file_path.endswith('.parquet'):
+        yield from iter_parquet(pcap_csv_file_path, chunksize, filters)
+        return
+
+    chunks = iter_cached_capture(pcap_csv_file_path, chunksize, filters) if cache else None
+    if chunks is not None:
+        yield from chunks
+        return
+
+    chunks = _window_chunks(pcap_csv_file_path, filters, chunksize, cache)
+    if chunks is None:
+        chunks = _decoded_chunks(pcap_csv_file_path, chunksize)
+        if cache:
+            chunks = cache_chunks(pcap_csv_file_path, chunks)
+    for df in chunks:
+        df = apply_filters(df, filters)
+        if len(df):
+            yield df
+
+def _decoded_chunks(pcap_csv_file_path, chunksize):
+    # cleaned chunks of a pcap/pcapng file or tshark csv export
+    if is_pcap_file(pcap_csv_file_path):
+        chunks = iter_pcap(pcap_csv_file_path, batch_size=chunksize)
+    else:
+        chunks = pd.read_csv(pcap_csv_file_path, header=0, sep="\t", chunksize=chunksize)
+    for df in chunks:
+        yield clean_capture(df)
+
+def _window_chunks(pcap_csv_file_path, filters, chunksize, save_index=True):
+    # cleaned chunks of the regions of a pcap/csv that overlap the filters' time windows
+    # (None without a time filter, or for captures that can't be indexed)
+    windows = filter_windows(filters)
+    index = load_time_index(pcap_csv_file_path, save=save_index) if windows is not None else None
+    if index is None:
+        return None
+    return (clean_capture(df) for df in iter_time_windows(pcap_csv_file_path, windows, chunksize, index))
+
+def label_traffic(df, hostnames=None):
+    # protocol names
+    df['protocol'] = protocol_names(df['ip.proto'])
+
+    # map the ip addresss to text labels based on the hostname file, and to the inventory subnet they belong to
+    # (longest prefix match, once per distinct address - see src/enrichment.py)
+    asset_map = as_asset_map(hostnames)
+    df['label'] = host_labels(df['ip.src'], asset_map)
+    df['subnet'] = subnet_labels(df['ip.src'], asset_map)
+    return df
 
+def filter_traffic(df, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None):
+    ### limit the data based on filters
+    # (the readers take the same filters, see capture_filters, and apply them before the rows are labelled)
+    return apply_filters(df, capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows))
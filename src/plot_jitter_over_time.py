@@ -1,43 +1,28 @@
-
 import pandas as pd
-import matplotlib.pyplot as plt
-import os 
-
-def plot_jitter(df, interval='1Min', save=False, save_path='plots/jitter/'):
-    # this isn't working properly. It's measuring jitter between [ip.src, ip,dst, vlan.id] packets - not all outobund packets on a vlan
-    # I could measure jitter on a vlan, but that doesn't consider bi-directional traffic
-    # can I measure jitter between packets from the same subnet?
-    # example subnet filtering: df['ip.src'].apply(lambda x: x[0:6]=='10.0.1')
+import os
+from src.my_plot import plot_job
+from src.jitter import compute_jitter, report_name, REPORT_KEYS
 
-    
-    df = df.copy()
+def plot_jitter(df, interval='1Min', save=False, save_path='plots/jitter/', by='flow', prefix=24, stats=None):
+    # by='flow' measures jitter between packets of the same [ip.src, ip.dst, vlan.id] flow (averaged per vlan),
+    # by='vlan' between all packets on a vlan and by='subnet' between packets from the same source subnet
+    # (stats from compute_jitter / stream_jitter can be passed instead of the packets)
 
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    # Sort and calculate inter-arrival deltas
-    df = df.sort_values(['ip.src', 'ip.dst', 'vlan.id', 'frame.time_epoch'])
-    df['time_diff'] = df.groupby(['ip.src', 'ip.dst', 'vlan.id'])['frame.time_epoch'].diff().dt.total_seconds()
-    df['jitter'] = df.groupby(['ip.src', 'ip.dst', 'vlan.id'])['time_diff'].diff().abs()
-
-    # Resample jitter per VLAN over time
-    df['time_bin'] = df['frame.time_epoch'].dt.floor(interval)
-    jitter_over_time = df.groupby(['vlan.id', 'time_bin'])['jitter'].mean().reset_index()
+    # inter-arrival deltas and their distribution per bin
+    if stats is None:
+        stats = compute_jitter(df, by, interval, prefix)
+    key = REPORT_KEYS[by][0]
 
     # Plot
-    for vlan in jitter_over_time['vlan.id'].unique():
-        vlan_data = jitter_over_time[jitter_over_time['vlan.id'] == vlan]
-        plt.figure(figsize=(12, 4))
-        plt.plot(vlan_data['time_bin'], vlan_data['jitter'], marker='o')
-        plt.title(f'Jitter Over Time for VLAN {vlan}')
-        plt.xlabel('Time')
-        plt.ylabel('Average Jitter (seconds)')
-        plt.grid(True)
-        plt.tight_layout()
-        if save:
-            filename = f'{save_path}Jitter Over Time for VLAN {vlan}.png'
-            plt.savefig(filename)
-            plt.close()
-        else:
-            plt.show()
-
+    for value in stats[key].unique():
+        data = stats[stats[key] == value]
+        name = report_name(by, value, prefix)
+        plot_job({'lines': [(data['time_bin'].to_numpy(), data['jitter_mean'].to_numpy(), {'marker': 'o', 'label': 'mean'}),
+                            (data['time_bin'].to_numpy(), data['jitter_p95'].to_numpy(), {'linestyle': '--', 'label': 'p95'})],
+                  'title': f'Jitter Over Time for {name}', 'x_label': 'Time', 'y_label': 'Jitter (seconds)', 'legend': True,
+                  'filename': f'{save_path}Jitter Over Time for {name.replace("/", "_")}.png'}, save=save)
+
+    return stats
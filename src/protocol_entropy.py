@@ -1,37 +1,123 @@
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
+from src.traffic_cube import get_cube, cube_series
+from src.pcap_to_pandas import iter_pcap_csv
+from src.capture_filters import capture_filters
+from src.my_plot import plot_job
 
-def calculate_protocol_entropy(df, interval='5Min', save=False, save_path='plots/entropy/'):
-    
+# entropy dimension -> packet column whose distribution is measured (per vlan and time bin)
+ENTROPY_FIELDS = {
+    'protocol': 'ip.proto',
+    'dst_port': 'l4.dstport',
+    'dst_ip': 'ip.dst',
+    'packet_size': 'frame.len',
+}
+ENTROPY_TITLES = {'protocol': 'Protocol', 'dst_port': 'Destination Port', 'dst_ip': 'Destination IP', 'packet_size': 'Packet Size'}
+ENTROPY_KEYS = ['vlan.id', 'frame.time_epoch']
+
+
+def entropy_from_counts(counts, keys=ENTROPY_KEYS, value='count'):
+    """
+    Shannon entropy (bits) of every group of a count table at once.
+
+    Args:
+        counts (pd.DataFrame): one row per (keys..., value of the measured field) with its count
+        keys (list[str]): the groups to compute the entropy of
+
+    Returns:
+        pd.DataFrame: one row per group with 'entropy'
+    """
+    p = counts[value] / counts.groupby(keys)[value].transform('sum')
+    terms = counts[keys].assign(entropy=-p * np.log2(p))
+    return terms.groupby(keys)['entropy'].sum().reset_index()
+
+
+def entropy_counts(df, dimension='protocol', interval='5Min'):
+    # packets per (vlan, time bin, value of the field); ports only exist for tcp/udp packets
+    field = ENTROPY_FIELDS[dimension]
+    if dimension == 'dst_port':
+        df = df[df['l4.proto'] > 0]
+    cells = pd.DataFrame({
+        'vlan.id': df['vlan.id'].to_numpy(),
+        'frame.time_epoch': df['frame.time_epoch'].dt.floor(interval).to_numpy(),
+        field: df[field].to_numpy(),
+    })
+    return cells.groupby(ENTROPY_KEYS + [field], sort=False).size().reset_index(name='count')
+
+
+def calculate_entropy(df, dimension='protocol', interval='5Min', save=False, save_path='plots/entropy/'):
+    """
+    Entropy of the protocol, destination port, destination ip or packet size distribution per VLAN and time bin.
+
+    Args:
+        df (pd.DataFrame): packets (for 'protocol' also a traffic cube or the aggregates returned by stream_capture)
+        dimension (str): one of ENTROPY_FIELDS
+        interval (str): time bin
+        save (bool): save one png per VLAN (otherwise show it)
+
+    Returns:
+        pd.DataFrame: 'vlan.id', 'time_bin' and 'entropy'
+    """
     if save:
         os.makedirs(save_path, exist_ok=True)
-    
-    df = df.copy()
 
-    df['time_bin'] = df['frame.time_epoch'].dt.floor(interval)
+    if dimension == 'protocol':
+        # the protocol distribution is already in the cube
+        counts = cube_series(get_cube(df, interval), ENTROPY_KEYS + ['ip.proto'], 'packet_count').rename(columns={'packet_count': 'count'})
+    elif isinstance(df, dict) or 'packet_count' in df.columns:
+        raise ValueError(f"{dimension} entropy needs the packets (aggregates only hold the protocol distribution), see stream_entropy")
+    else:
+        counts = entropy_counts(df, dimension, interval)
 
-    entropy_records = []
+    entropy_df = entropy_from_counts(counts).rename(columns={'frame.time_epoch': 'time_bin'})
+    plot_entropy(entropy_df, dimension, save=save, save_path=save_path)
+    return entropy_df
 
-    for (vlan, time), group in df.groupby(['vlan.id', 'time_bin']):
-        proto_counts = group['ip.proto'].value_counts(normalize=True)
-        entropy = -np.sum(proto_counts * np.log2(proto_counts))
-        entropy_records.append({'vlan.id': vlan, 'time_bin': time, 'entropy': entropy})
-
-    entropy_df = pd.DataFrame(entropy_records)
 
+def plot_entropy(entropy_df, dimension='protocol', save=False, save_path='plots/entropy/'):
+    title = ENTROPY_TITLES[dimension]
     for vlan in entropy_df['vlan.id'].unique():
         vlan_data = entropy_df[entropy_df['vlan.id'] == vlan]
-        plt.figure(figsize=(12, 4))
-        plt.plot(vlan_data['time_bin'], vlan_data['entropy'], marker='o')
-        plt.title(f'Protocol Entropy Over Time for VLAN {vlan}')
-        plt.xlabel('Time')
-        plt.ylabel('Entropy (bits)')
-        plt.grid(True)
-        plt.tight_layout()
-        if save:
-            plt.savefig(f'{save_path}Protocol Entropy Over Time for VLAN {vlan}.png')
-            plt.close()
-        else:
-            plt.show()
+        plot_job({'lines': [(vlan_data['time_bin'].to_numpy(), vlan_data['entropy'].to_numpy(), {'marker': 'o'})],
+                  'title': f'{title} Entropy Over Time for VLAN {vlan}', 'x_label': 'Time', 'y_label': 'Entropy (bits)',
+                  'filename': f'{save_path}{title} Entropy Over Time for VLAN {vlan}.png'}, save=save)
+
+
+def calculate_protocol_entropy(df, interval='5Min', save=False, save_path='plots/entropy/'):
+    # df can be the packets, a traffic cube or the aggregates returned by stream_capture
+    return calculate_entropy(df, 'protocol', interval, save=save, save_path=save_path)
+
+
+def stream_entropy(pcap_csv_file_path, dimensions=tuple(ENTROPY_FIELDS), interval='1S', chunksize=1_000_000, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None):
+    """
+    Entropy per VLAN and time bin for several dimensions, reading the capture in chunks.
+
+    Counts are only kept for the time bins that can still receive packets: once a chunk starts after a
+    bin, that bin's entropy is final and its counts are dropped. Memory therefore depends on the chunk size
+    and the number of distinct values per bin, not on the length of the capture, so 1 second entropy over
+    day-long captures is practical. The capture is expected in time order (as captured, or ingest_captures output).
+
+    Returns:
+        dict: dimension -> pd.DataFrame with 'vlan.id', 'time_bin' and 'entropy'
+    """
+    pending = {dim: None for dim in dimensions}
+    done = {dim: [] for dim in dimensions}
+
+    for df in iter_pcap_csv(pcap_csv_file_path, chunksize=chunksize, filters=capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows)):
+        first_bin = df['frame.time_epoch'].min().floor(interval)
+        for dim in dimensions:
+            counts = pd.concat([pending[dim], entropy_counts(df, dim, interval)], ignore_index=True)
+            field = ENTROPY_FIELDS[dim]
+            counts = counts.groupby(ENTROPY_KEYS + [field], sort=False)['count'].sum().reset_index()
+            closed = counts['frame.time_epoch'] < first_bin
+            if closed.any():
+                done[dim].append(entropy_from_counts(counts[closed]))
+            pending[dim] = counts[~closed]
+
+    results = {}
+    for dim in dimensions:
+        parts = done[dim] + ([entropy_from_counts(pending[dim])] if pending[dim] is not None and len(pending[dim]) else [])
+        entropy_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ENTROPY_KEYS + ['entropy'])
+        results[dim] = entropy_df.rename(columns={'frame.time_epoch': 'time_bin'}).sort_values(['vlan.id', 'time_bin'], ignore_index=True)
+    return results
@@ -1,8 +1,127 @@
+import numpy as np
 import pandas as pd
 
+EVENT_PAD = '5Min'  # length of the windows before and after an event (see event_window_stats)
+PHASES = ['before', 'during', 'after']
+
 # load event file
+# the events are indexed by their window (a pd.IntervalIndex closed on both ends; events without an end_time are
+# points in time), which tag_events / join_events / event_window_stats match against in one vectorized step
 def read_events(event_file):
     events = pd.read_csv(event_file, parse_dates=['start_time', 'end_time'], keep_default_na=False, date_format='%Y-%m-%d %H:%M:%S')
     events['start_time'] = pd.to_datetime(events['start_time'], unit='s', errors='coerce')
     events['end_time'] = pd.to_datetime(events['end_time'], unit='s', errors='coerce')
-    return events
\ No newline at end of file
+    events.index = event_index(events)
+    return events
+
+def event_index(events):
+    """IntervalIndex of the event windows, closed on both ends (an event without an end_time is a point)."""
+    starts = pd.to_datetime(events['start_time'])
+    return pd.IntervalIndex.from_arrays(starts, pd.to_datetime(events['end_time']).fillna(starts), closed='both', name='window')
+
+def _bounds(events):
+    # start and end of every event window as datetime64[ns] arrays (NaT for events without a start)
+    index = events.index if isinstance(events.index, pd.IntervalIndex) else event_index(events)
+    return index.left.to_numpy(dtype='datetime64[ns]'), index.right.to_numpy(dtype='datetime64[ns]')
+
+def _sort_times(times):
+    times = np.asarray(times, dtype='datetime64[ns]')
+    order = np.argsort(times, kind='stable')  # NaT sorts last and falls in no window
+    return order, times[order]
+
+def _match(order, ordered, starts, ends, open_start=False, open_end=False):
+    # (row, window) pairs of the times inside each window: with the times sorted, every window is a contiguous
+    # range of them found with two binary searches, so the cost is the sort plus the number of matches
+    lo = np.searchsorted(ordered, starts, 'right' if open_start else 'left')
+    hi = np.searchsorted(ordered, ends, 'left' if open_end else 'right')
+    lengths = np.maximum(hi - lo, 0)
+    window = np.repeat(np.arange(len(starts)), lengths)
+    position = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(lo, lengths)
+    return order[position], window
+
+def tag_events(times, events, interval=None):
+    """
+    Match packet times (or time bins) to every event window they fall in, for all events at once.
+
+    Args:
+        times (array): timestamps, e.g. frame.time_epoch or the time bins of a cube
+        events (pd.DataFrame): events from read_events (or any frame with start_time / end_time)
+        interval (str): the times are the starts of bins this long: a bin is tagged with every event it overlaps
+
+    Returns:
+        pd.DataFrame: 'row' (position in times) and 'event' (position in events), one row per match, by event
+    """
+    starts, ends = _bounds(events)
+    open_start = interval is not None
+    if open_start:  # the bin [t, t + interval) overlaps [start, end] when start - interval < t <= end
+        starts = starts - pd.to_timedelta(interval).to_timedelta64()
+    rows, event = _match(*_sort_times(times), starts, ends, open_start=open_start)
+    return pd.DataFrame({'row': rows, 'event': event})
+
+def join_events(df, events, time_column='frame.time_epoch', interval=None):
+    """
+    The rows of df that fall in event windows, once per event, with the 'event' position and the 'event_label'.
+
+    Args:
+        df (pd.DataFrame): packets, flow records or time bins
+        interval (str): df[time_column] are bins of this length (see tag_events)
+    """
+    tags = tag_events(df[time_column], events, interval)
+    labels = events['label'].to_numpy() if 'label' in events.columns else tags['event'].to_numpy()
+    return df.iloc[tags['row'].to_numpy()].reset_index(drop=True).assign(event=tags['event'].to_numpy(),
+                                                                          event_label=labels[tags['event'].to_numpy()])
+
+def event_window_stats(df, events, columns, time_column='frame.time_epoch', pad=EVENT_PAD, stats=('mean', 'max', 'sum', 'count')):
+    """
+    Statistics of any metric before, during and after every event, in one pass over the data.
+
+    The windows are [start - pad, start), [start, end] and (end, end + pad]; the 'during' window of an event
+    without an end_time is the instant itself.
+
+    Args:
+        df (pd.DataFrame): packets, flow records or a per-bin metric (e.g. bandwidth per time bin)
+        columns (list[str]): the metric columns
+        stats (tuple): aggregations (any pandas groupby aggregation name)
+
+    Returns:
+        pd.DataFrame: one row per (event, phase) with 'event', 'label', 'start_time', 'end_time', 'phase' and a
+        '<column>_<stat>' column per metric and statistic
+    """
+    pad = pd.to_timedelta(pad).to_timedelta64()
+    starts, ends = _bounds(events)
+    order, ordered = _sort_times(df[time_column])
+    phases = [_match(order, ordered, starts - pad, starts, open_end=True),
+              _match(order, ordered, starts, ends),
+              _match(order, ordered, ends, ends + pad, open_start=True)]
+    rows = np.concatenate([r for r, _ in phases])
+    matched = df[columns].iloc[rows].reset_index(drop=True)
+    matched['event'] = np.concatenate([w for _, w in phases])
+    matched['phase'] = np.repeat(np.arange(len(PHASES)), [len(r) for r, _ in phases])
+    table = matched.groupby(['event', 'phase'])[columns].agg(list(stats))
+    table.columns = [f'{column}_{stat}' for column, stat in table.columns]
+    # empty windows still get a row (count 0)
+    table = table.reindex(pd.MultiIndex.from_product([range(len(events)), range(len(PHASES))], names=['event', 'phase'])).reset_index()
+    for column in table.columns:
+        if column.endswith(('_count', '_size')):
+            table[column] = table[column].fillna(0).astype(np.int64)
+    position = table['event'].to_numpy()
+    table.insert(1, 'label', events['label'].to_numpy()[position] if 'label' in events.columns else position)
+    table.insert(2, 'start_time', starts[position])
+    table.insert(3, 'end_time', events['end_time'].to_numpy(dtype='datetime64[ns]')[position])
+    table['phase'] = np.array(PHASES)[table['phase'].to_numpy()]
+    return table
+
+# time windows around the events, for reading only those parts of a capture (see capture_filters / time_index)
+def event_windows(events, pad='5Min'):
+    pad = pd.to_timedelta(pad)
+    starts = events['start_time']
+    ends = events['end_time'].fillna(starts)  # events without an end are points in time
+    windows = sorted((start - pad, end + pad) for start, end in zip(starts, ends) if pd.notnull(start))
+    # overlapping windows are merged, so each region of the capture is read once
+    merged = []
+    for start, end in windows:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -1,5 +1,9 @@
 import pandas as pd
+from src.enrichment import build_asset_map
 
-def load_ip_hostname_mapping(filepath):
+# the 'ip' column holds addresses or CIDR blocks (a block's hostname names the subnet); other columns are asset
+# attributes. Returns the asset map (a dict of 'entries', 'all' and 'subnets', not {ip: hostname}) that
+# label_traffic resolves addresses with by longest prefix match (see src/enrichment.py)
+def load_asset_map(filepath):
     df_map = pd.read_csv(filepath, header=0)
-    return dict(zip(df_map['ip'], df_map['hostname']))
\ No newline at end of file
+    return build_asset_map(df_map)
@@ -0,0 +1,136 @@
+# multi-resolution rollups of a capture: the traffic cube (per vlan/protocol) at 1s, 10s, 1min, 10min and 1h
+# and the bytes/packets per source host from 1min up, persisted next to the capture cache. Any interval that is a
+# multiple of a stored level is served by re-binning the coarsest level that divides it, without the packets.
+import glob
+import os
+import shutil
+import pandas as pd
+from src.capture_cache import CACHE_DIR, HAVE_PARQUET, capture_fingerprint
+from src.traffic_cube import build_cube, merge_cubes, rollup_cube
+
+PYRAMID_LEVELS = ['1s', '10s', '1min', '10min', '1h']
+# per-host tables grow with hosts x bins, so they start at a coarser level
+HOST_LEVELS = ['1min', '10min', '1h']
+HOST_KEYS = ['ip.src', 'frame.time_epoch']
+HOST_VALUES = ['frame.len', 'packet_count']
+
+
+def pyramid_dir(path):
+    # <dir>/.pcap_cache/<name>.<fingerprint>.rollup/ (a folder, so the capture cache's stale-file cleanup skips it)
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIR, f'{name}.{capture_fingerprint(path)}.rollup')
+
+
+def _host_table(df, interval):
+    cells = pd.DataFrame({'ip.src': df['ip.src'].to_numpy(), 'frame.time_epoch': df['frame.time_epoch'].dt.floor(interval).to_numpy(),
+                          'frame.len': df['frame.len'].to_numpy(dtype='int64'), 'packet_count': 1})
+    return _sum_hosts(cells, interval)
+
+
+def _sum_hosts(cells, interval):
+    table = cells.groupby(HOST_KEYS, sort=False)[HOST_VALUES].sum().reset_index()
+    table.attrs['interval'] = interval
+    return table
+
+
+def _roll(table, interval, tables):
+    # the next level up, from the level below it
+    if tables == 'cubes':
+        return rollup_cube(table, interval)
+    return _sum_hosts(table.assign(**{'frame.time_epoch': table['frame.time_epoch'].dt.floor(interval)}), interval)
+
+
+def build_pyramid(chunks, levels=PYRAMID_LEVELS, host_levels=HOST_LEVELS):
+    """
+    Aggregate packets (a frame or an iterable of chunks) once at the finest level and roll every coarser level
+    up from the one below it.
+
+    Returns:
+        dict: 'levels' / 'host_levels' (intervals, finest first), 'cubes' and 'hosts' ({interval: table})
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    cubes, hosts = [], []
+    for df in chunks:
+        cubes.append(build_cube(df, levels[0]))
+        hosts.append(_host_table(df, host_levels[0]))
+    if not cubes:
+        return None
+    pyramid = {'levels': list(levels), 'host_levels': list(host_levels), 'cubes': {}, 'hosts': {}, 'dir': None}
+    pyramid['cubes'][levels[0]] = merge_cubes(cubes)
+    pyramid['hosts'][host_levels[0]] = _sum_hosts(pd.concat(hosts, ignore_index=True), host_levels[0])
+    for name, names in (('cubes', levels), ('hosts', host_levels)):
+        for finer, coarser in zip(names, names[1:]):
+            pyramid[name][coarser] = _roll(pyramid[name][finer], coarser, name)
+    return pyramid
+
+
+def save_pyramid(path, pyramid):
+    """Store every level of a capture's pyramid (parquet, one file per table and level) and drop older versions."""
+    if not HAVE_PARQUET:
+        return None
+    target = pyramid_dir(path)
+    tmp = f'{target}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in ('cubes', 'hosts'):
+        for level, table in pyramid[name].items():
+            table.to_parquet(os.path.join(tmp, f'{name}-{level}.parquet'), index=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    for stale in glob.glob(os.path.join(os.path.dirname(target), f'{glob.escape(os.path.basename(path))}.*.rollup')):
+        if stale != target:
+            shutil.rmtree(stale, ignore_errors=True)
+    pyramid['dir'] = target
+    return target
+
+
+def load_pyramid(path, chunksize=1_000_000, levels=PYRAMID_LEVELS, host_levels=HOST_LEVELS, save=True):
+    """
+    The rollup pyramid of a capture: the stored one (its levels are read when first used), or built from the
+    capture in chunks and saved on first use.
+    """
+    target = pyramid_dir(path)
+    if HAVE_PARQUET and all(os.path.exists(os.path.join(target, f'{name}-{level}.parquet'))
+                            for name, names in (('cubes', levels), ('hosts', host_levels)) for level in names):
+        return {'levels': list(levels), 'host_levels': list(host_levels), 'cubes': {}, 'hosts': {}, 'dir': target}
+    from src.pcap_to_pandas import iter_pcap_csv
+    pyramid = build_pyramid(iter_pcap_csv(path, chunksize=chunksize), levels, host_levels)
+    if save and pyramid is not None:
+        save_pyramid(path, pyramid)
+    return pyramid
+
+
+def is_pyramid(data):
+    return isinstance(data, dict) and 'cubes' in data and 'levels' in data
+
+
+def _level(levels, interval):
+    # the coarsest stored level that divides the interval
+    wanted = pd.to_timedelta(interval)
+    fits = [level for level in levels if wanted >= pd.to_timedelta(level) and wanted % pd.to_timedelta(level) == pd.Timedelta(0)]
+    if not fits:
+        raise ValueError(f'no stored level ({", ".join(levels)}) divides the interval {interval}')
+    return max(fits, key=pd.to_timedelta)
+
+
+def _table(pyramid, name, level):
+    tables = pyramid[name]
+    if level not in tables:
+        table = pd.read_parquet(os.path.join(pyramid['dir'], f'{name}-{level}.parquet'))
+        table.attrs['interval'] = level
+        tables[level] = table
+    return tables[level]
+
+
+def pyramid_cube(pyramid, interval):
+    """The traffic cube for `interval` (see build_cube), re-binned from the nearest stored level."""
+    level = _level(pyramid['levels'], interval)
+    return rollup_cube(_table(pyramid, 'cubes', level), interval)
+
+
+def pyramid_hosts(pyramid, interval):
+    """Bytes ('frame.len') and 'packet_count' per source host and time bin for `interval`."""
+    level = _level(pyramid['host_levels'], interval)
+    table = _table(pyramid, 'hosts', level)
+    return table if pd.to_timedelta(level) == pd.to_timedelta(interval) else _roll(table, interval, 'hosts')
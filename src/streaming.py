@@ -0,0 +1,165 @@
+# out-of-core analysis: aggregate a capture chunk by chunk instead of loading every packet
+import pandas as pd
+from src.pcap_to_pandas import iter_pcap_csv, label_traffic
+from src.capture_filters import capture_filters
+from src.traffic_cube import build_cube, merge_cubes
+from src.flows import is_flows
+from src.heavy_hitters import SKETCH_KEYS, host_sketch, merge_host_sketches, sketch_table
+
+# group keys of each partial aggregate
+TALKER_KEYS = ['ip.src']
+RECEIVER_KEYS = ['ip.dst']
+CONVERSATION_KEYS = ['ip.src', 'ip.dst', 'ip.proto']
+SRC_PORT_KEYS = ['l4.proto', 'l4.srcport']
+DST_PORT_KEYS = ['l4.proto', 'l4.dstport']
+AGGREGATE_KEYS = {'talkers': TALKER_KEYS, 'receivers': RECEIVER_KEYS, 'conversations': CONVERSATION_KEYS,
+                  'src_ports': SRC_PORT_KEYS, 'dst_ports': DST_PORT_KEYS}
+# per-source display labels, carried along (not summed) in the host tables
+LABEL_COLUMNS = ['label', 'subnet']
+
+
+def aggregate_chunk(df, interval='1Min', top_k=None):
+    """
+    Reduce a chunk of packets to the partial aggregates the metrics need.
+
+    Args:
+        top_k (int): keep the hosts in heavy-hitter sketches monitoring this many hosts (see heavy_hitters)
+            instead of exact per-host tables, so scans and many external addresses don't grow the aggregates
+
+    Returns:
+        dict: 'cube' (the traffic cube, see build_cube), 'talkers' (bytes per source),
+        'receivers' (bytes per destination), 'conversations' (packets per src/dst/proto) and
+        'src_ports' / 'dst_ports' (packets per tcp/udp port). With top_k, 'heavy_hitters' holds the host
+        sketches per SKETCH_KEYS and 'talkers' / 'receivers' only the hosts they monitor.
+    """
+    ports = df[df['l4.proto'] > 0]
+    aggregates = {
+        'cube': build_cube(df, interval),
+        'conversations': df.groupby(CONVERSATION_KEYS).size().reset_index(name='count'),
+        'src_ports': ports.groupby(SRC_PORT_KEYS).size().reset_index(name='count'),
+        'dst_ports': ports.groupby(DST_PORT_KEYS).size().reset_index(name='count'),
+        'interval': interval,
+    }
+    if top_k:
+        aggregates['heavy_hitters'] = {key: host_sketch(df, key, top_k) for key in SKETCH_KEYS}
+        aggregates['talkers'] = sketch_table(aggregates['heavy_hitters']['ip.src'])
+        aggregates['receivers'] = sketch_table(aggregates['heavy_hitters']['ip.dst'])
+    else:
+        labels = {column: (column, 'first') for column in LABEL_COLUMNS if column in df.columns}
+        aggregates['talkers'] = df.groupby(TALKER_KEYS).agg(**{'frame.len': ('frame.len', 'sum')}, **labels).reset_index()
+        aggregates['receivers'] = df.groupby(RECEIVER_KEYS)['frame.len'].sum().reset_index()
+    return aggregates
+
+
+def merge_aggregates(parts):
+    """Merge partial aggregates (e.g. from several chunks or files) by re-summing each table."""
+    parts = [p for p in parts if p is not None]
+    merged = {'interval': parts[0]['interval'], 'cube': merge_cubes([p['cube'] for p in parts])}
+    sketched = all('heavy_hitters' in p for p in parts)
+    for name, key in AGGREGATE_KEYS.items():
+        if sketched and name in ('talkers', 'receivers'):
+            continue
+        merged[name] = merge_table(pd.concat([p[name] for p in parts], ignore_index=True), key)
+    if sketched:
+        # the sketches merge, and the host tables are what the merged sketches monitor
+        merged['heavy_hitters'] = {key: merge_host_sketches([p['heavy_hitters'][key] for p in parts]) for key in SKETCH_KEYS}
+        merged['talkers'] = sketch_table(merged['heavy_hitters']['ip.src'])
+        merged['receivers'] = sketch_table(merged['heavy_hitters']['ip.dst'])
+    return merged
+
+
+def merge_table(table, key):
+    # sum the counters, carry the display labels along
+    return table.groupby(key, sort=False, observed=True).agg({col: 'first' if col in LABEL_COLUMNS else 'sum' for col in table.columns if col not in key}).reset_index()
+
+
+def stream_capture(pcap_csv_file_path, interval='1Min', chunksize=1_000_000, hostnames=None, vlan_filter=None, protocol_filter=None, time_filter=None, host_filter=None, subnet_filter=None, time_windows=None, top_k=None):
+    """
+    Read a capture in bounded chunks and return the merged aggregates for it.
+
+    Peak memory depends on `chunksize` and the number of groups (VLANs x protocols x time bins, hosts,
+    conversations), not on the number of packets. The result can be passed to the time-series metrics
+    (bandwidth, bursts, packet count, packet size, protocol entropy), the top talker/receiver functions
+    and detect_new_or_rare_conversations in place of a DataFrame. The filters are pushed down into the reader
+    (a time filter or time_windows only read the regions of the capture that overlap them, see time_index).
+    With top_k the hosts are kept in fixed-size heavy-hitter sketches (see aggregate_chunk).
+    """
+    merged = None
+    filters = capture_filters(vlan_filter, protocol_filter, time_filter, host_filter, subnet_filter, time_windows)
+    for df in iter_pcap_csv(pcap_csv_file_path, chunksize=chunksize, filters=filters):
+        df = label_traffic(df, hostnames)
+        merged = merge_aggregates([merged, aggregate_chunk(df, interval, top_k)])
+    return merged
+
+
+def is_aggregated(data):
+    # aggregates are dicts of tables, raw captures are DataFrames
+    return isinstance(data, dict)
+
+
+def bytes_by(data, key):
+    # total bytes per host, from raw packets, flow records or the talker/receiver aggregates
+    if is_aggregated(data):
+        data = data['receivers'] if key == 'ip.dst' else data['talkers']
+    totals = data.groupby(key, observed=True)['bytes' if is_flows(data) else 'frame.len'].sum()
+    if isinstance(totals.index, pd.CategoricalIndex):
+        # labels of different captures have different categories, plain strings merge cleanly
+        totals.index = totals.index.astype(str)
+    return totals
+
+
+def conversation_counts(data):
+    # packets per src/dst/proto conversation, from raw packets, flow records or aggregates
+    if is_aggregated(data):
+        return data['conversations'].copy()
+    if is_flows(data):
+        return data.groupby(CONVERSATION_KEYS)['packets'].sum().reset_index(name='count')
+    return data.groupby(CONVERSATION_KEYS).size().reset_index(name='count')
+
+
+def port_counts(data, port='src'):
+    # packets per tcp/udp port number (tcp and udp counted together), from raw packets, flow records or aggregates
+    key = 'l4.dstport' if port == 'dst' else 'l4.srcport'
+    if is_aggregated(data):
+        return data[f'{port}_ports'].groupby(key)['count'].sum().rename(None)
+    if is_flows(data):
+        return data[data['l4.proto'] > 0].groupby(key)['packets'].sum().rename(None)
+    # TCP and UDP ports share one column (l4.proto is 0 when the packet has no ports)
+    return data.loc[data['l4.proto'] > 0, key].value_counts().rename(None)
+
+
+def protocol_counts(data):
+    # packets per ip.proto, from raw packets, flow records, aggregates (the cube) or a baseline profile
+    if is_aggregated(data):
+        table = data['protocols'] if 'protocols' in data else data['cube']
+        return table.groupby('ip.proto')['packet_count'].sum().rename(None)
+    if is_flows(data):
+        return data.groupby('ip.proto')['packets'].sum().rename(None)
+    return data['ip.proto'].value_counts().rename(None)
+
+
+def capture_summary(data, top_n=5):
+    """
+    Headline numbers of a capture from its aggregates (stream_capture / append_captures).
+
+    Returns:
+        dict: 'packets', 'bytes', 'start' / 'end' (first and last time bin), 'seconds', 'avg_mbps',
+        'vlans' (bytes per vlan), 'protocols' (packets per protocol) and 'top_talkers' (bytes of the top_n sources)
+    """
+    cube = data['cube']
+    if cube.empty:
+        return {'packets': 0, 'bytes': 0}
+    start, end = cube['frame.time_epoch'].min(), cube['frame.time_epoch'].max() + pd.to_timedelta(cube.attrs.get('interval', data['interval']))
+    seconds = (end - start).total_seconds()
+    talkers = data['talkers'].nlargest(top_n, 'frame.len')
+    return {
+        'packets': int(cube['packet_count'].sum()),
+        'bytes': int(cube['frame.len'].sum()),
+        'start': str(start),
+        'end': str(end),
+        'seconds': seconds,
+        'avg_mbps': cube['frame.len'].sum() * 8 / (seconds * 10**6),
+        'vlans': {int(v): int(b) for v, b in cube.groupby('vlan.id')['frame.len'].sum().items()},
+        'protocols': {str(p): int(n) for p, n in cube.groupby('protocol')['packet_count'].sum().sort_values(ascending=False).items()},
+        'top_talkers': {str(label): int(b) for label, b in zip(talkers['label'], talkers['frame.len'])},
+    }
@@ -0,0 +1,186 @@
+# synthetic captures of any size (for testing and benchmarks), written as tshark csv exports and/or pcap files
+import numpy as np
+import pandas as pd
+from src.addresses import format_ipv4, int_to_mac
+from src.capture_schema import CAPTURE_DTYPES
+
+CHUNK_PACKETS = 1_000_000  # packets generated (and written) at a time
+SNAP = 58  # bytes of each frame written to the pcap (eth + vlan tag + ipv4 + 20 bytes of l4 header)
+
+WELL_KNOWN_TCP = [80, 443, 22, 445, 3389, 25, 389, 8080, 135, 139]
+WELL_KNOWN_UDP = [53, 123, 161, 514, 67, 137, 1900, 5353]
+
+# one pcap record: 16 byte record header + the first SNAP bytes of the frame (all big endian except the record header)
+PCAP_RECORD = np.dtype([
+    ('ts_sec', '<u4'), ('ts_usec', '<u4'), ('incl_len', '<u4'), ('orig_len', '<u4'),
+    ('dst_hi', '>u2'), ('dst_lo', '>u4'), ('src_hi', '>u2'), ('src_lo', '>u4'),
+    ('tpid', '>u2'), ('tci', '>u2'), ('ethertype', '>u2'),
+    ('ver_ihl', 'u1'), ('tos', 'u1'), ('ip_len', '>u2'), ('ip_id', '>u2'), ('frag', '>u2'),
+    ('ttl', 'u1'), ('proto', 'u1'), ('csum', '>u2'), ('ip_src', '>u4'), ('ip_dst', '>u4'),
+    ('sport', '>u2'), ('dport', '>u2'), ('l4_rest', 'V16'),
+])
+
+
+def _network(hosts, vlans, flows, rng):
+    # hosts spread over the vlans, each vlan its own /16 (10.<n>.<k // 254>.<k % 254 + 1>), and flows between
+    # them with zipf-like popularity
+    if vlans > 254 or -(-hosts // vlans) > 254 * 256:
+        raise ValueError(f'{hosts} hosts over {vlans} vlans: at most 254 vlans of {254 * 256} hosts each')
+    vlan_ids = np.arange(1, vlans + 1, dtype=np.int64) * 10
+    host_vlan = np.arange(hosts) % vlans
+    k = np.arange(hosts) // vlans
+    host_ip = (10 << 24) | ((host_vlan + 1) << 16) | ((k // 254) << 8) | (k % 254 + 1)
+    host_mac = 0x001100000000 | ((host_vlan + 1) << 24) | k
+
+    src = rng.integers(0, hosts, flows)
+    # most traffic stays within the vlan, some crosses to servers elsewhere
+    local = rng.random(flows) < 0.7
+    same_vlan = host_vlan[src] + vlans * rng.integers(0, max(1, hosts // vlans), flows)
+    dst = np.where(local & (same_vlan < hosts), same_vlan, rng.integers(0, hosts, flows))
+    dst = np.where(dst == src, (dst + 1) % hosts, dst)
+
+    proto = rng.choice([6, 17, 1], size=flows, p=[0.7, 0.25, 0.05])
+    dport = np.where(proto == 6, rng.choice(WELL_KNOWN_TCP, flows), rng.choice(WELL_KNOWN_UDP, flows))
+    dport = np.where(rng.random(flows) < 0.1, rng.integers(1024, 65536, flows), dport)  # some high ports
+    sport = rng.integers(32768, 61000, flows)
+    weight = 1.0 / np.arange(1, flows + 1) ** 1.1
+    return {'vlan_ids': vlan_ids, 'host_vlan': host_vlan, 'host_ip': host_ip, 'host_mac': host_mac, 'src': src, 'dst': dst,
+            'proto': proto, 'sport': sport, 'dport': dport, 'weight': weight / weight.sum()}
+
+
+def _sizes(proto, rng):
+    # tcp: acks or mostly full segments, udp: small requests with some large responses, icmp: pings
+    n = len(proto)
+    tcp = np.where(rng.random(n) < 0.4, 66, np.clip(rng.lognormal(6.8, 0.6, n), 66, 1514))
+    udp = np.where(rng.random(n) < 0.8, rng.integers(80, 600, n), rng.integers(600, 1400, n))
+    return np.select([proto == 6, proto == 17], [tcp, udp], 98).astype(np.int64)
+
+
+def generate_packets(packets, hosts=200, vlans=4, flows=20_000, pps=10_000, start=1_748_274_859.0, seed=0, chunk_packets=CHUNK_PACKETS):
+    """
+    Generate a synthetic capture in chunks (so the size is only limited by disk).
+
+    Packets arrive as a Poisson process of `pps` packets per second and pick a flow by zipf-like popularity
+    (a few heavy flows, a long tail). Replies (40%) swap the addresses and ports.
+
+    Yields:
+        pd.DataFrame: chunks in the compact capture schema, in time order
+    """
+    rng = np.random.default_rng(seed)
+    net = _network(hosts, vlans, flows, rng)
+    now = start
+    for first in range(0, packets, chunk_packets):
+        n = min(chunk_packets, packets - first)
+        times = now + np.cumsum(rng.exponential(1.0 / pps, n))
+        now = times[-1]
+
+        flow = rng.choice(flows, size=n, p=net['weight'])
+        reply = rng.random(n) < 0.4
+        src = np.where(reply, net['dst'][flow], net['src'][flow])
+        dst = np.where(reply, net['src'][flow], net['dst'][flow])
+        proto = net['proto'][flow]
+        ports = proto != 1
+        sport = np.where(reply, net['dport'][flow], net['sport'][flow])
+        dport = np.where(reply, net['sport'][flow], net['dport'][flow])
+
+        df = pd.DataFrame({
+            'frame.time_epoch': pd.to_datetime(times, unit='s'),
+            'frame.len': _sizes(proto, rng),
+            'eth.src': net['host_mac'][src],
+            'eth.dst': net['host_mac'][dst],
+            'vlan.id': net['vlan_ids'][net['host_vlan'][net['src'][flow]]],
+            'ip.src': net['host_ip'][src],
+            'ip.dst': net['host_ip'][dst],
+            'ip.proto': proto,
+            'ip.id': rng.integers(0, 65536, n),
+            'l4.srcport': np.where(ports, sport, 0),
+            'l4.dstport': np.where(ports, dport, 0),
+            'l4.proto': np.where(ports, proto, 0),
+        })
+        yield df.astype(CAPTURE_DTYPES)
+
+
+def _format_mac(values):
+    # each distinct mac is formatted once
+    codes, uniques = pd.factorize(np.asarray(values))
+    return pd.Categorical.from_codes(codes, categories=[int_to_mac(u) for u in uniques])
+
+
+def _text_chunk(df):
+    # compact schema -> the columns tshark exports with files/param_list.txt
+    tcp, udp = df['l4.proto'] == 6, df['l4.proto'] == 17
+    out = pd.DataFrame({
+        'frame.time_epoch': df['frame.time_epoch'].to_numpy().view(np.int64) / 1e9,
+        'frame.len': df['frame.len'],
+        'eth.src': _format_mac(df['eth.src']),
+        'eth.dst': _format_mac(df['eth.dst']),
+        'vlan.id': df['vlan.id'],
+        'ip.src': format_ipv4(df['ip.src']),
+        'ip.dst': format_ipv4(df['ip.dst']),
+        'ip.proto': df['ip.proto'],
+        'ip.id': df['ip.id'],
+    })
+    for name, mask in (('tcp', tcp), ('udp', udp)):
+        out[f'{name}.srcport'] = df['l4.srcport'].where(mask).astype('Int64')
+        out[f'{name}.dstport'] = df['l4.dstport'].where(mask).astype('Int64')
+    return out
+
+
+def _pcap_chunk(df):
+    records = np.zeros(len(df), dtype=PCAP_RECORD)
+    ns = df['frame.time_epoch'].to_numpy().view(np.int64)
+    records['ts_sec'] = ns // 1_000_000_000
+    records['ts_usec'] = ns % 1_000_000_000 // 1000
+    records['incl_len'] = SNAP
+    records['orig_len'] = df['frame.len']
+    for side, col in (('dst', 'eth.dst'), ('src', 'eth.src')):
+        mac = df[col].to_numpy()
+        records[f'{side}_hi'] = mac >> np.uint64(32)
+        records[f'{side}_lo'] = mac & np.uint64(0xffffffff)
+    records['tpid'] = 0x8100
+    records['tci'] = df['vlan.id']
+    records['ethertype'] = 0x0800
+    records['ver_ihl'] = 0x45
+    records['ip_len'] = df['frame.len'].to_numpy() - 18
+    records['ip_id'] = df['ip.id']
+    records['ttl'] = 64
+    records['proto'] = df['ip.proto']
+    records['ip_src'] = df['ip.src']
+    records['ip_dst'] = df['ip.dst']
+    icmp = df['ip.proto'].to_numpy() == 1
+    records['sport'] = np.where(icmp, 0x0800, df['l4.srcport'])  # icmp echo request type/code
+    records['dport'] = df['l4.dstport']
+    return records.tobytes()
+
+
+def write_capture(chunks, csv_path=None, pcap_path=None):
+    """
+    Write generated chunks as a tshark csv export and/or a pcap file (frames are truncated to the headers,
+    with the original length kept, like a capture taken with a snap length).
+
+    Returns:
+        int: packets written
+    """
+    total = 0
+    csv_file = open(csv_path, 'w', newline='') if csv_path else None
+    pcap_file = open(pcap_path, 'wb') if pcap_path else None
+    try:
+        if pcap_file:
+            pcap_file.write(np.array([0xa1b2c3d4], '<u4').tobytes() + np.array([2, 4], '<u2').tobytes()
+                            + np.array([0, 0, 65535, 1], '<u4').tobytes())
+        for df in chunks:
+            if csv_file:
+                _text_chunk(df).to_csv(csv_file, sep='\t', index=False, header=total == 0, float_format='%.6f')
+            if pcap_file:
+                pcap_file.write(_pcap_chunk(df))
+            total += len(df)
+    finally:
+        for f in (csv_file, pcap_file):
+            if f:
+                f.close()
+    return total
+
+
+def generate_capture(packets, csv_path=None, pcap_path=None, hosts=200, vlans=4, flows=20_000, pps=10_000, seed=0):
+    """Generate a synthetic capture with `packets` packets and write it to csv_path and/or pcap_path (see generate_packets)."""
+    return write_capture(generate_packets(packets, hosts, vlans, flows, pps, seed=seed), csv_path, pcap_path)
@@ -0,0 +1,187 @@
+# sparse time index of a capture: the byte offset of a record every INDEX_PACKETS packets and at the start of
+# every INDEX_SECONDS, with the time range of the packets in each region between two entries, so a time-window
+# query seeks to the regions that overlap it instead of decoding the whole file (pcap/pcapng and tshark csv)
+import glob
+import io
+import os
+import numpy as np
+import pandas as pd
+from src.capture_cache import CACHE_DIR, capture_fingerprint
+from src.pcap_reader import is_pcap_file, iter_pcap, iter_record_times
+
+INDEX_PACKETS = 10_000
+INDEX_SECONDS = 1.0
+BLOCK_SIZE = 32 * 1024 * 1024  # bytes of a csv export scanned at once
+# index times are exact (or float) epoch ns, decoded times go through float seconds: windows are widened by this
+SLACK = pd.Timedelta('1ms')
+
+
+def index_file(path):
+    # kept with the capture cache: <dir>/.pcap_cache/<name>.<fingerprint>.tidx.npz
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, CACHE_DIR, f'{name}.{capture_fingerprint(path)}.tidx.npz')
+
+
+def _csv_times(path, block_size=BLOCK_SIZE):
+    # (times, line offsets, end) per block of a tshark export: one packet per line, blocks end on a line break
+    with open(path, 'rb') as f:
+        column = f.readline().decode().rstrip('\r\n').split('\t').index('frame.time_epoch')
+        offset, rest = f.tell(), b''
+        while True:
+            block = f.read(block_size)
+            data = rest + block
+            if not data:
+                return
+            cut = data.rfind(b'\n') + 1 if block else len(data)  # the last line may have no line break
+            if cut == 0:
+                rest = data
+                continue
+            data, rest = data[:cut], data[cut:]
+            starts = np.r_[0, np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10) + 1]
+            starts = starts[starts < len(data)]
+            times = pd.read_csv(io.BytesIO(data), sep='\t', header=None, usecols=[column], quoting=3, skip_blank_lines=False).iloc[:, 0]
+            seconds = pd.to_numeric(times, errors='coerce').to_numpy(dtype=float)
+            valid = ~np.isnan(seconds)
+            yield np.round(seconds[valid] * 1e9).astype(np.int64), offset + starts[valid], offset + len(data)
+            offset += len(data)
+
+
+def _regions(batches, every_packets, every_seconds):
+    # cut the packet sequence into regions and keep (offset, first packet, min/max time) of each;
+    # the cut on time follows the running maximum, so a capture that is slightly out of order isn't cut at every packet
+    step = max(int(every_seconds * 1e9), 1)
+    columns = {'offset': [], 'packet': [], 'min_time': [], 'max_time': []}
+    packet, running, last_bin, current, end = 0, None, None, None, 0
+
+    def close(region):
+        for name, value in zip(columns, region):
+            columns[name].append(value)
+
+    for ns, offsets, end in batches:
+        if not len(ns):
+            continue
+        peak = np.maximum.accumulate(ns) if running is None else np.maximum.accumulate(np.maximum(ns, running))
+        bins = peak // step
+        number = packet + np.arange(len(ns))
+        cut = (bins != np.r_[bins[0] - 1 if last_bin is None else last_bin, bins[:-1]]) | (number % every_packets == 0)
+        running, last_bin, packet = peak[-1], bins[-1], packet + len(ns)
+
+        starts = np.flatnonzero(cut)
+        head = starts[0] if len(starts) else len(ns)
+        if head:  # the start of the batch belongs to the region left open by the previous one
+            current[2], current[3] = min(current[2], ns[:head].min()), max(current[3], ns[:head].max())
+        if not len(starts):
+            continue
+        if current is not None:
+            close(current)
+        mins, maxs = np.minimum.reduceat(ns, starts), np.maximum.reduceat(ns, starts)
+        for i in range(len(starts) - 1):
+            close((offsets[starts[i]], number[starts[i]], mins[i], maxs[i]))
+        current = [offsets[starts[-1]], number[starts[-1]], mins[-1], maxs[-1]]
+    if current is not None:
+        close(current)
+    return {name: np.array(values, dtype=np.int64) for name, values in columns.items()}, packet, end
+
+
+def _index_frame(offset, packet, min_time, max_time, packets, end):
+    index = pd.DataFrame({'offset': offset, 'stop': np.r_[offset[1:], end][:len(offset)].astype(np.int64), 'packet': packet,
+                          'packets': np.diff(np.r_[packet, packets]).astype(np.int64),
+                          'min_time': min_time.view('datetime64[ns]'), 'max_time': max_time.view('datetime64[ns]')})
+    index.attrs.update(packets=int(packets), end=int(end))
+    return index
+
+
+def build_time_index(path, every_packets=INDEX_PACKETS, every_seconds=INDEX_SECONDS):
+    """
+    Index a pcap/pcapng capture or a tshark csv/tsv export by time.
+
+    Only the record headers (pcap) or the time column (csv) are read. pcapng files with simple packet blocks
+    (which carry no timestamp) can't be indexed.
+
+    Args:
+        every_packets (int): an index entry every this many packets...
+        every_seconds (float): ...and at the first packet of every this many seconds
+
+    Returns:
+        pd.DataFrame: one row per region of the file: 'offset' and 'stop' (bytes), 'packet' (number of its first
+        packet), 'packets', 'min_time' and 'max_time'
+    """
+    batches = iter_record_times(path) if is_pcap_file(path) else _csv_times(path)
+    regions, packets, end = _regions(batches, every_packets, every_seconds)
+    index = _index_frame(regions['offset'], regions['packet'], regions['min_time'], regions['max_time'], packets, end)
+    index.attrs.update(every_packets=every_packets, every_seconds=every_seconds)
+    return index
+
+
+def load_time_index(path, every_packets=INDEX_PACKETS, every_seconds=INDEX_SECONDS, save=True):
+    """
+    The time index of a capture: read from the cache folder, or built (and saved, unless save=False) on first use.
+
+    Returns None for captures that can't be indexed (parquet files are already split into row groups by time).
+    """
+    if path.endswith('.parquet'):
+        return None
+    stored = index_file(path)
+    if os.path.exists(stored):
+        with np.load(stored) as f:
+            if f['every_packets'] == every_packets and f['every_seconds'] == every_seconds:
+                index = _index_frame(f['offset'], f['packet'], f['min_time'], f['max_time'], int(f['packets']), int(f['end']))
+                index.attrs.update(every_packets=every_packets, every_seconds=every_seconds)
+                return index
+    try:
+        index = build_time_index(path, every_packets, every_seconds)
+    except ValueError:
+        return None
+    if save:
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        tmp = f'{stored}.tmp.npz'
+        np.savez(tmp, offset=index['offset'].to_numpy(), packet=index['packet'].to_numpy(),
+                 min_time=index['min_time'].to_numpy().view(np.int64), max_time=index['max_time'].to_numpy().view(np.int64),
+                 packets=index.attrs['packets'], end=index.attrs['end'], every_packets=every_packets, every_seconds=every_seconds)
+        os.replace(tmp, stored)
+        for stale in glob.glob(os.path.join(os.path.dirname(stored), f'{glob.escape(os.path.basename(path))}.*.tidx.npz')):
+            if stale != stored:
+                os.remove(stale)
+    return index
+
+
+def index_ranges(index, windows, chunksize=1_000_000):
+    """
+    Byte ranges of the regions that overlap any of the (start, end) windows.
+
+    Adjacent regions are read together, up to about chunksize packets per range.
+
+    Returns:
+        list[tuple]: (start offset, stop offset, packets)
+    """
+    hit = np.zeros(len(index), dtype=bool)
+    min_time, max_time = index['min_time'].to_numpy(), index['max_time'].to_numpy()
+    for start, end in windows:
+        hit |= (min_time <= (pd.Timestamp(end) + SLACK).to_datetime64()) & (max_time >= (pd.Timestamp(start) - SLACK).to_datetime64())
+    ranges = []
+    for offset, stop, packets in index[['offset', 'stop', 'packets']].to_numpy()[hit]:
+        if ranges and ranges[-1][1] == offset and ranges[-1][2] + packets <= chunksize:
+            ranges[-1] = (ranges[-1][0], stop, ranges[-1][2] + packets)
+        else:
+            ranges.append((offset, stop, packets))
+    return [(int(a), int(b), int(n)) for a, b, n in ranges]
+
+
+def iter_time_windows(path, windows, chunksize=1_000_000, index=None):
+    """
+    Read only the regions of a capture that overlap the time windows.
+
+    Yields the packets of those regions as they come out of the pcap reader or the csv parser (not cleaned, and
+    including the packets of a region that fall just outside the windows: mask them with capture_filters).
+    """
+    index = load_time_index(path) if index is None else index
+    ranges = index_ranges(index, windows, chunksize)
+    if is_pcap_file(path):
+        for start, stop, _ in ranges:
+            yield from iter_pcap(path, batch_size=chunksize, byte_range=(start, stop), start=start)
+        return
+    with open(path, 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n').split('\t')
+        for start, stop, _ in ranges:
+            f.seek(start)
+            yield pd.read_csv(io.BytesIO(f.read(stop - start)), header=None, names=header, sep='\t')
@@ -1,161 +1,173 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-import numpy as np
-
-def plot_top_talkers(df, top_n=10, save=False, save_path='plots/top_talkers/'):
-    df = df.copy()
-    
+from src.streaming import bytes_by, is_aggregated
+from src.addresses import format_addresses
+from src.my_plot import plot_job
+from src.heavy_hitters import SKETCH_CAPACITY, host_sketch, merge_host_sketches, host_estimates, top_hosts
+
+# the baseline and event shares side by side (share column, error column, bar kwargs)
+COMPARE_BARS = [('baseline_pct', 'baseline_error_pct', {'label': 'Baseline'}), ('event_pct', 'event_error_pct', {'label': 'Event'})]
+
+
+def _sketched(data, top_k):
+    # top_k asks for the heavy-hitter sketches, aggregates streamed with top_k only have them
+    return bool(top_k) or (is_aggregated(data) and 'heavy_hitters' in data)
+
+
+def _host_sketch(data, key, top_k):
+    # sketches kept in the aggregates, else summarized from the packets / flows / per-host aggregates
+    if is_aggregated(data):
+        if 'heavy_hitters' in data:
+            return data['heavy_hitters'][key]
+        data = data['receivers'] if key == 'ip.dst' else data['talkers']
+    return host_sketch(data, key, top_k or SKETCH_CAPACITY)
+
+
+def _top_sketched(data, key, top_n, top_k):
+    # top_n hosts of one capture with their share of the total and its error (the true share is in [pct - error_pct, pct])
+    top = top_hosts(_host_sketch(data, key, top_k), top_n)
+    top['error_pct'] = 100 * top['bytes_error'] / max(top.attrs['total'], 1)
+    return top
+
+
+def _compare_sketched(df_baseline, df_event, key, top_n, top_k):
+    # the top_n hosts of both captures together (merged sketches), estimated in each one
+    baseline, event = _host_sketch(df_baseline, key, top_k), _host_sketch(df_event, key, top_k)
+    keys = merge_host_sketches([baseline, event])['bytes']['table']['key'].head(top_n).to_numpy()
+    merged = pd.DataFrame({key: keys})
+    for name, sketch in (('baseline', baseline), ('event', event)):
+        estimates = host_estimates(sketch, keys)
+        total = max(sketch['bytes']['total'], 1)
+        merged[f'{name}_bytes'] = estimates['bytes'].to_numpy()
+        merged[f'{name}_pct'] = 100 * merged[f'{name}_bytes'] / total
+        merged[f'{name}_error_pct'] = 100 * estimates['bytes_error'].to_numpy() / total
+    merged['total_bytes'] = merged['baseline_bytes'] + merged['event_bytes']
+    return merged
+
+
+def _bars(labels, table, series):
+    # (labels, traffic share, kwargs) per (share column, error column, kwargs), with the sketches' error bars
+    # when the table has them
+    bars = []
+    for column, error, kwargs in series:
+        if error in table.columns:
+            kwargs = dict(kwargs, error=table[error].to_numpy())
+        bars.append((labels, table[column].to_numpy(), kwargs))
+    return bars
+
+def plot_top_talkers(df, top_n=10, save=False, save_path='plots/top_talkers/', top_k=None):
+    # df can be the packets or the aggregates returned by stream_capture
+    # top_k: rank the hosts with heavy-hitter sketches monitoring this many hosts (bounded memory, with error bounds)
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    # Total bytes sent per source
-    grouped = df.groupby('ip.src')['frame.len'].sum().reset_index(name='bytes_sent')
+    if _sketched(df, top_k):
+        top_talkers = _top_sketched(df, 'ip.src', top_n, top_k).rename(columns={'bytes': 'bytes_sent', 'pct': 'traffic_pct'})
+    else:
+        # Total bytes sent per source
+        grouped = bytes_by(df, 'ip.src').reset_index(name='bytes_sent')
 
-    # Calculate total traffic
-    total_bytes = grouped['bytes_sent'].sum()
+        # Calculate total traffic
+        total_bytes = grouped['bytes_sent'].sum()
 
-    # Top N only
-    top_talkers = grouped.sort_values(by='bytes_sent', ascending=False).head(top_n)
+        # Top N only
+        top_talkers = grouped.sort_values(by='bytes_sent', ascending=False).head(top_n)
 
-    # Add percentage of total
-    top_talkers['traffic_pct'] = (top_talkers['bytes_sent'] / total_bytes) * 100
+        # Add percentage of total
+        top_talkers['traffic_pct'] = (top_talkers['bytes_sent'] / total_bytes) * 100
+    top_talkers = format_addresses(top_talkers)
         
-    ax = top_talkers.plot.bar(x='ip.src', y='traffic_pct', legend=False, figsize=(10, 5), color='skyblue')
-    plt.ylabel('Traffic Share (%)')
-    plt.xlabel('IP address')
-    plt.title('Top Talkers (by % of Total Bytes Sent)')
-    plt.xticks(rotation=45, ha='right')
-    plt.ylim(0, 100)
-    plt.tight_layout()
-    
-    if save:
-        filename = f'{save_path}_{'Top Talkers (by % of Total Bytes Sent)'}.png'
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
+    plot_job({'bars': _bars(top_talkers['ip.src'].to_numpy(), top_talkers, [('traffic_pct', 'error_pct', {'color': 'skyblue'})]),
+              'title': 'Top Talkers (by % of Total Bytes Sent)', 'x_label': 'IP address', 'y_label': 'Traffic Share (%)',
+              'ylim': (0, 100), 'grid': False, 'size': (10, 5), 'filename': f'{save_path}_Top Talkers (by % of Total Bytes Sent).png'}, save=save)
+    return top_talkers
 
 
-def compare_top_talkers(df_baseline, df_event, top_n=10, save=False, save_path='plots/top_talkers/'):
-    df_baseline = df_baseline.copy()
-    df_event = df_event.copy()
-    
+def compare_top_talkers(df_baseline, df_event, top_n=10, save=False, save_path='plots/top_talkers/', top_k=None):
+    # either frame can be the packets or the aggregates returned by stream_capture (the baseline also a baseline profile)
+    # top_k: rank the hosts with heavy-hitter sketches monitoring this many hosts (bounded memory, with error bounds)
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    # Total bytes for normalization
-    total_baseline = df_baseline['frame.len'].sum()
-    total_event = df_event['frame.len'].sum()
-
-    # Group by source IP
-    baseline_group = df_baseline.groupby('label')['frame.len'].sum().rename('baseline_bytes').reset_index()
-    event_group = df_event.groupby('label')['frame.len'].sum().rename('event_bytes').reset_index()
-
-    # Merge and calculate % of total
-    merged = pd.merge(baseline_group, event_group, on='label', how='outer').fillna(0)
-    merged['baseline_pct'] = (merged['baseline_bytes'] / total_baseline) * 100
-    merged['event_pct'] = (merged['event_bytes'] / total_event) * 100
-
-    # Sort by total traffic to get top N
-    merged['total_bytes'] = merged['baseline_bytes'] + merged['event_bytes']
-    top_talkers = merged.sort_values(by='total_bytes', ascending=False).head(top_n)
-
-    x = np.arange(len(top_talkers))
-    width = 0.35
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(x - width/2, top_talkers['baseline_pct'], width, label='Baseline')
-    ax.bar(x + width/2, top_talkers['event_pct'], width, label='Event')
-
-    ax.set_ylabel('Traffic Share (%)')
-    plt.xlabel('Host')
-    ax.set_title('Top Talkers: Baseline vs Event Traffic')
-    ax.set_xticks(x)
-    ax.set_xticklabels(top_talkers['label'], rotation=45, ha='right')
-    ax.legend()
-    plt.tight_layout()
-
-    if save:
-        filename = f'{save_path}_{'Top Talkers (by % of Total Bytes Sent)'}.png'
-        plt.savefig(filename)
+    if _sketched(df_baseline, top_k) or _sketched(df_event, top_k):
+        top_talkers = _compare_sketched(df_baseline, df_event, 'label', top_n, top_k)
     else:
-        plt.show()
-
-def plot_top_receivers(df, top_n=10, save=False, save_path='plots/top_receivers/'):
-    df = df.copy()
-    
+        # Group by source IP
+        baseline_group = bytes_by(df_baseline, 'label').rename('baseline_bytes').reset_index()
+        event_group = bytes_by(df_event, 'label').rename('event_bytes').reset_index()
+
+        # Total bytes for normalization
+        total_baseline = baseline_group['baseline_bytes'].sum()
+        total_event = event_group['event_bytes'].sum()
+
+        # Merge and calculate % of total
+        merged = pd.merge(baseline_group, event_group, on='label', how='outer').fillna(0)
+        merged['baseline_pct'] = (merged['baseline_bytes'] / total_baseline) * 100
+        merged['event_pct'] = (merged['event_bytes'] / total_event) * 100
+
+        # Sort by total traffic to get top N
+        merged['total_bytes'] = merged['baseline_bytes'] + merged['event_bytes']
+        top_talkers = merged.sort_values(by='total_bytes', ascending=False).head(top_n)
+
+    plot_job({'bars': _bars(top_talkers['label'].astype(str).to_numpy(), top_talkers, COMPARE_BARS),
+              'title': 'Top Talkers: Baseline vs Event Traffic', 'x_label': 'Host', 'y_label': 'Traffic Share (%)', 'legend': True,
+              'grid': False, 'size': (12, 6), 'filename': f'{save_path}_Top Talkers (by % of Total Bytes Sent).png'}, save=save)
+    return top_talkers
+
+def plot_top_receivers(df, top_n=10, save=False, save_path='plots/top_receivers/', top_k=None):
+    # df can be the packets or the aggregates returned by stream_capture
+    # top_k: rank the hosts with heavy-hitter sketches monitoring this many hosts (bounded memory, with error bounds)
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    # Total bytes sent per source
-    grouped = df.groupby('ip.dst')['frame.len'].sum().reset_index(name='bytes_received')
+    if _sketched(df, top_k):
+        top_receivers = _top_sketched(df, 'ip.dst', top_n, top_k).rename(columns={'bytes': 'bytes_received', 'pct': 'traffic_pct'})
+    else:
+        # Total bytes sent per source
+        grouped = bytes_by(df, 'ip.dst').reset_index(name='bytes_received')
 
-    # Calculate total traffic
-    total_bytes = grouped['bytes_received'].sum()
+        # Calculate total traffic
+        total_bytes = grouped['bytes_received'].sum()
 
-    # Top N only
-    top_receivers = grouped.sort_values(by='bytes_received', ascending=False).head(top_n)
+        # Top N only
+        top_receivers = grouped.sort_values(by='bytes_received', ascending=False).head(top_n)
 
-    # Add percentage of total
-    top_receivers['traffic_pct'] = (top_receivers['bytes_received'] / total_bytes) * 100
+        # Add percentage of total
+        top_receivers['traffic_pct'] = (top_receivers['bytes_received'] / total_bytes) * 100
+    top_receivers = format_addresses(top_receivers)
         
-    ax = top_receivers.plot.bar(x='ip.dst', y='traffic_pct', legend=False, figsize=(10, 5), color='skyblue')
-    plt.ylabel('Traffic Share (%)')
-    plt.xlabel('IP address')
-    plt.title('Top Receivers (by % of Total Bytes Sent)')
-    plt.xticks(rotation=45, ha='right')
-    plt.ylim(0, 100)
-    plt.tight_layout()
-    
-    if save:
-        filename = f'{save_path}_{'Top Receivers (by % of Total Bytes Sent)'}.png'
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
-
-def compare_top_receivers(df_baseline, df_event, top_n=10, save=False, save_path='plots/top_receivers/'):
-    df_baseline = df_baseline.copy()
-    df_event = df_event.copy()
-    
+    plot_job({'bars': _bars(top_receivers['ip.dst'].to_numpy(), top_receivers, [('traffic_pct', 'error_pct', {'color': 'skyblue'})]),
+              'title': 'Top Receivers (by % of Total Bytes Sent)', 'x_label': 'IP address', 'y_label': 'Traffic Share (%)',
+              'ylim': (0, 100), 'grid': False, 'size': (10, 5), 'filename': f'{save_path}_Top Receivers (by % of Total Bytes Sent).png'}, save=save)
+    return top_receivers
+
+def compare_top_receivers(df_baseline, df_event, top_n=10, save=False, save_path='plots/top_receivers/', top_k=None):
+    # either frame can be the packets or the aggregates returned by stream_capture (the baseline also a baseline profile)
+    # top_k: rank the hosts with heavy-hitter sketches monitoring this many hosts (bounded memory, with error bounds)
     if save:
         os.makedirs(save_path, exist_ok=True)
 
-    # Total bytes for normalization
-    total_baseline = df_baseline['frame.len'].sum()
-    total_event = df_event['frame.len'].sum()
-
-    # Group by source IP
-    baseline_group = df_baseline.groupby('ip.dst')['frame.len'].sum().rename('baseline_bytes').reset_index()
-    event_group = df_event.groupby('ip.dst')['frame.len'].sum().rename('event_bytes').reset_index()
-
-    # Merge and calculate % of total
-    merged = pd.merge(baseline_group, event_group, on='ip.dst', how='outer').fillna(0)
-    merged['baseline_pct'] = (merged['baseline_bytes'] / total_baseline) * 100
-    merged['event_pct'] = (merged['event_bytes'] / total_event) * 100
-
-    # Sort by total traffic to get top N
-    merged['total_bytes'] = merged['baseline_bytes'] + merged['event_bytes']
-    top_talkers = merged.sort_values(by='total_bytes', ascending=False).head(top_n)
-
-    x = np.arange(len(top_talkers))
-    width = 0.35
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(x - width/2, top_talkers['baseline_pct'], width, label='Baseline')
-    ax.bar(x + width/2, top_talkers['event_pct'], width, label='Event')
-
-    ax.set_ylabel('Traffic Share (%)')
-    plt.xlabel('Host')
-    ax.set_title('Top Receivers: Baseline vs Event Traffic')
-    ax.set_xticks(x)
-    ax.set_xticklabels(top_talkers['ip.dst'], rotation=45, ha='right')
-    ax.legend()
-    plt.tight_layout()
-
-    if save:
-        filename = f'{save_path}_{'Top Receivers (by % of Total Bytes Sent)'}.png'
-        plt.savefig(filename)
+    if _sketched(df_baseline, top_k) or _sketched(df_event, top_k):
+        top_talkers = _compare_sketched(df_baseline, df_event, 'ip.dst', top_n, top_k)
     else:
-        plt.show()
+        # Group by source IP
+        baseline_group = bytes_by(df_baseline, 'ip.dst').rename('baseline_bytes').reset_index()
+        event_group = bytes_by(df_event, 'ip.dst').rename('event_bytes').reset_index()
+
+        # Total bytes for normalization
+        total_baseline = baseline_group['baseline_bytes'].sum()
+        total_event = event_group['event_bytes'].sum()
+
+        # Merge and calculate % of total
+        merged = pd.merge(baseline_group, event_group, on='ip.dst', how='outer').fillna(0)
+        merged['baseline_pct'] = (merged['baseline_bytes'] / total_baseline) * 100
+        merged['event_pct'] = (merged['event_bytes'] / total_event) * 100
+
+        # Sort by total traffic to get top N
+        merged['total_bytes'] = merged['baseline_bytes'] + merged['event_bytes']
+        top_talkers = merged.sort_values(by='total_bytes', ascending=False).head(top_n)
+
+    plot_job({'bars': _bars(format_addresses(top_talkers)['ip.dst'].to_numpy(), top_talkers, COMPARE_BARS),
+              'title': 'Top Receivers: Baseline vs Event Traffic', 'x_label': 'Host', 'y_label': 'Traffic Share (%)', 'legend': True,
+              'grid': False, 'size': (12, 6), 'filename': f'{save_path}_Top Receivers (by % of Total Bytes Sent).png'}, save=save)
+    return top_talkers
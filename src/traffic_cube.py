@@ -0,0 +1,90 @@
+# one (vlan, protocol, time_bin) aggregation shared by every time-series metric
+import numpy as np
+import pandas as pd
+from src.capture_schema import protocol_names
+
+CUBE_KEYS = ['vlan.id', 'ip.proto', 'frame.time_epoch']
+# 'frame.len' is the bytes (= packet size sum) per cell, 'frame.len_sq' the sum of squared sizes
+CUBE_VALUES = ['frame.len', 'packet_count', 'frame.len_sq']
+
+
+def build_cube(df, interval='1S'):
+    """
+    Scan the packets once and aggregate them per VLAN, protocol and time bin.
+
+    Args:
+        df (pd.DataFrame): packets with 'frame.time_epoch', 'frame.len', 'vlan.id' and 'ip.proto'
+        interval (str): finest time bin; metrics can ask for any multiple of it
+
+    Returns:
+        pd.DataFrame: one row per (vlan.id, ip.proto, frame.time_epoch) with bytes ('frame.len'),
+        'packet_count', the sum of squared sizes ('frame.len_sq') and the protocol name ('protocol').
+        The interval is kept in cube.attrs.
+    """
+    size = df['frame.len'].to_numpy(dtype=np.int64)
+    cells = pd.DataFrame({
+        'vlan.id': df['vlan.id'].to_numpy(),
+        'ip.proto': df['ip.proto'].to_numpy(),
+        'frame.time_epoch': df['frame.time_epoch'].dt.floor(interval).to_numpy(),
+        'frame.len': size,
+        'packet_count': np.ones(len(df), dtype=np.int64),
+        'frame.len_sq': size * size,
+    })
+    return _sum_cells(cells, interval)
+
+
+def _sum_cells(cells, interval):
+    # grouped on the fixed-width keys only, the protocol name is looked up per cell afterwards
+    cube = cells.groupby(CUBE_KEYS, sort=False)[CUBE_VALUES].sum().reset_index()
+    cube['protocol'] = protocol_names(cube['ip.proto']).astype(str)
+    cube.attrs['interval'] = interval
+    return cube
+
+
+def merge_cubes(cubes):
+    """Merge cubes with the same interval (e.g. from several chunks or files)."""
+    cubes = [c for c in cubes if c is not None]
+    return _sum_cells(pd.concat(cubes, ignore_index=True), cubes[0].attrs['interval'])
+
+
+def rollup_cube(cube, interval):
+    """Re-bin a cube to a coarser interval (a multiple of the one it was built with) without touching the packets."""
+    stored, wanted = pd.to_timedelta(cube.attrs['interval']), pd.to_timedelta(interval)
+    if wanted == stored:
+        return cube
+    if wanted % stored != pd.Timedelta(0):
+        raise ValueError(f"cube was built with interval {cube.attrs['interval']}, which doesn't divide {interval}")
+    return _sum_cells(cube.assign(**{'frame.time_epoch': cube['frame.time_epoch'].dt.floor(interval)}), interval)
+
+
+def is_cube(data):
+    return isinstance(data, pd.DataFrame) and 'interval' in data.attrs and 'packet_count' in data.columns
+
+
+def get_cube(data, interval):
+    """
+    Return the cube for `interval` from whatever the caller has: raw packets, a cube built with a finer
+    interval, the aggregates returned by stream_capture or a rollup pyramid (see load_pyramid).
+    """
+    if isinstance(data, dict) and 'cubes' in data:
+        from src.rollup_pyramid import pyramid_cube
+        return pyramid_cube(data, interval)
+    if isinstance(data, dict):
+        data = data['cube']
+    if is_cube(data):
+        return rollup_cube(data, interval)
+    return build_cube(data, interval)
+
+
+def cube_series(cube, keys, value='frame.len'):
+    # collapse the cube onto a subset of its keys (e.g. ['vlan.id', 'frame.time_epoch'])
+    return cube.groupby(keys)[value].sum().reset_index()
+
+
+def size_stats(cube, keys):
+    # mean and standard deviation of the packet size per group, from the additive size sums
+    grouped = cube.groupby(keys)[CUBE_VALUES].sum().reset_index()
+    grouped['avg_packet_size'] = grouped['frame.len'] / grouped['packet_count']
+    variance = grouped['frame.len_sq'] / grouped['packet_count'] - grouped['avg_packet_size'] ** 2
+    grouped['std_packet_size'] = np.sqrt(variance.clip(lower=0))
+    return grouped
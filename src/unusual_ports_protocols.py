@@ -1,75 +1,31 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
 import os
+from src.streaming import port_counts, protocol_counts
+from src.my_plot import plot_job
+
+def _compare_job(table, top_n, title, filename):
+    # the top_n rows by event share, baseline and event side by side
+    top = table.sort_values('event_pct', ascending=False).head(top_n)
+    labels = top.index.astype(str).to_numpy()
+    return {'bars': [(labels, top['baseline_pct'].to_numpy(), {'label': 'Baseline'}), (labels, top['event_pct'].to_numpy(), {'label': 'Event'})],
+            'title': title, 'x_label': '', 'y_label': 'Traffic Share (%)', 'legend': True, 'grid': False, 'size': (10, 5), 'filename': filename}
 
 def plot_port_activity_trace(proto_df, port_df, top_n=10, title_suffix='', save=False, save_path='plots/port_protocol_activity/'):
     # --- Protocol Plot ---
-    top_proto = proto_df.sort_values('event_pct', ascending=False).head(top_n)
-    x = np.arange(len(top_proto))
-    width = 0.35
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.bar(x - width/2, top_proto['baseline_pct'], width, label='Baseline')
-    ax.bar(x + width/2, top_proto['event_pct'], width, label='Event')
-    ax.set_xticks(x)
-    ax.set_xticklabels(top_proto.index.astype(str), rotation=45, ha='right')
-    ax.set_title(f'Top {top_n} Protocols: Baseline vs Event {title_suffix}')
-    ax.set_ylabel('Traffic Share (%)')
-    ax.legend()
-    plt.tight_layout()
-    
-    if save:
-        filename = f'{save_path}{f'Unusual Protocols - {title_suffix}'}.png'
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
+    plot_job(_compare_job(proto_df, top_n, f'Top {top_n} Protocols: Baseline vs Event {title_suffix}',
+                          f'{save_path}Unusual Protocols - {title_suffix}.png'), save=save)
 
     # --- Port Plot ---
-    top_ports = port_df.sort_values('event_pct', ascending=False).head(top_n)
-    x = np.arange(len(top_ports))
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.bar(x - width/2, top_ports['baseline_pct'], width, label='Baseline')
-    ax.bar(x + width/2, top_ports['event_pct'], width, label='Event')
-    ax.set_xticks(x)
-    ax.set_xticklabels(top_ports.index.astype(str), rotation=45, ha='right')
-    ax.set_title(f'Top {top_n} Ports: Baseline vs Event {title_suffix}')
-    ax.set_ylabel('Traffic Share (%)')
-    ax.legend()
-    plt.tight_layout()
-    
-    if save:
-        filename = f'{save_path}{f'Unusual Ports - {title_suffix}'}.png'
-        plt.savefig(filename)
-        plt.close()
-    else:
-        plt.show()
+    plot_job(_compare_job(port_df, top_n, f'Top {top_n} Ports: Baseline vs Event {title_suffix}',
+                          f'{save_path}Unusual Ports - {title_suffix}.png'), save=save)
 
 def plot_port_protocol_activity(df_baseline, df_event, port='src', top_n=10, save=False, save_path='plots/port_protocol_activity/'):
-    df_baseline = df_baseline.copy()
-    df_event = df_event.copy()
-
+    # either frame can be the packets or aggregates (stream_capture / append_captures), the baseline also a baseline profile
     if save:
         os.makedirs(save_path, exist_ok=True)
 
     def count_values(df, port='src'):
-        # Combine TCP and UDP ports
-        if port=='dst':
-            ports = pd.concat([
-                df['tcp.dstport'].dropna().astype(int),
-                df['udp.dstport'].dropna().astype(int)
-            ])
-        else:
-            ports = pd.concat([
-                df['tcp.srcport'].dropna().astype(int),
-                df['udp.srcport'].dropna().astype(int)
-            ])
-        port_counts = ports.value_counts()
-
-        proto_counts = df['ip.proto'].value_counts()
-        return proto_counts, port_counts
+        return protocol_counts(df), port_counts(df, port)
     
     base_proto, base_ports = count_values(df_baseline, port)
     event_proto, event_ports = count_values(df_event, port)
@@ -83,7 +39,7 @@ def plot_port_protocol_activity(df_baseline, df_event, port='src', top_n=10, sav
     port_df['baseline_pct'] = port_df['baseline']/port_df['baseline'].sum() * 100
     port_df['event_pct'] = port_df['event']/port_df['event'].sum() * 100
 
-    plot_port_activity_trace(proto_df, port_df, title_suffix=f'({port} ports)', top_n=top_n, save=save)
+    plot_port_activity_trace(proto_df, port_df, title_suffix=f'({port} ports)', top_n=top_n, save=save, save_path=save_path)
 
 
 # def detect_anomolous_port_protocols(df_baseline, df_event, method='zscore', z_thresh=2.0, save=False, save_path='plots/unusual_ports_protocols/'):
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from src.analysis_state import TABLES, append_captures
+from src.synthetic_capture import generate_capture
+
+
+@pytest.fixture(scope='module')
+def capture(tmp_path_factory):
+    stem = tmp_path_factory.mktemp('capture') / 'capture'
+    paths = {fmt: f'{stem}.{fmt}' for fmt in ('csv', 'pcap')}
+    generate_capture(20_000, csv_path=paths['csv'], pcap_path=paths['pcap'], hosts=40, vlans=2, flows=500)
+    return paths
+
+
+def _table(df):
+    keys = [c for c in df.columns if df[c].dtype.kind != 'f']
+    return df.sort_values(keys, ignore_index=True)[sorted(df.columns)]
+
+
+def _assert_same_state(state, rebuilt):
+    for name in TABLES:
+        pd.testing.assert_frame_equal(_table(state[name]), _table(rebuilt[name]), check_dtype=False)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'pcap'])
+def test_growing_capture_matches_a_full_rebuild(capture, fmt, tmp_path):
+    with open(capture[fmt], 'rb') as f:
+        data = f.read()
+    growing = str(tmp_path / f'growing.{fmt}')
+    # offsets that are (almost surely) inside a record or line, then the whole file
+    for stop in (len(data) * 3 // 10 + 3, len(data) * 7 // 10 + 3, len(data)):
+        # the writer may stop mid-record: the partial record is read by the next append
+        with open(growing, 'wb') as f:
+            f.write(data[:stop])
+        state = append_captures(str(tmp_path / 'state'), growing)
+    rebuilt = append_captures(str(tmp_path / 'rebuilt'), capture[fmt])
+    _assert_same_state(state, rebuilt)
+
+
+def test_added_files_match_a_full_rebuild(capture, tmp_path):
+    with open(capture['csv']) as f:
+        header, *lines = f.readlines()
+    half = len(lines) // 2
+    for name, part in (('first.csv', lines[:half]), ('second.csv', lines[half:])):
+        with open(tmp_path / name, 'w') as f:
+            f.writelines([header] + part)
+    append_captures(str(tmp_path / 'state'), str(tmp_path / 'first.csv'))
+    state = append_captures(str(tmp_path / 'state'), [str(tmp_path / 'first.csv'), str(tmp_path / 'second.csv')])
+    rebuilt = append_captures(str(tmp_path / 'rebuilt'), capture['csv'])
+    _assert_same_state(state, rebuilt)
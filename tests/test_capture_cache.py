@@ -0,0 +1,57 @@
+import glob
+import os
+import pandas as pd
+import pytest
+from src.capture_cache import CACHE_DIR, cache_file, load_cached_capture
+from src.pcap_to_pandas import read_pcap_csv
+from src.synthetic_capture import generate_capture
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = str(tmp_path / 'capture.csv')
+    generate_capture(2_000, csv_path=path, hosts=20, vlans=2, flows=100)
+    return path
+
+
+def _entries(path):
+    return glob.glob(os.path.join(os.path.dirname(path), CACHE_DIR, '*.parquet'))
+
+
+def _rewrite(path, transform):
+    # rewrite the capture in place, keeping its size and mtime
+    stat = os.stat(path)
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, 'w') as f:
+        f.writelines(transform(lines))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.path.getsize(path) == stat.st_size
+
+
+def test_read_writes_and_reuses_the_cache(capture):
+    packets = read_pcap_csv(capture)
+    assert _entries(capture) == [cache_file(capture)]
+    pd.testing.assert_frame_equal(load_cached_capture(capture), packets)
+    pd.testing.assert_frame_equal(read_pcap_csv(capture), packets)
+
+
+def test_appended_capture_invalidates_the_cache(capture):
+    read_pcap_csv(capture)
+    with open(capture) as f:
+        lines = f.readlines()
+    with open(capture, 'a') as f:
+        f.writelines(lines[-10:])
+    assert load_cached_capture(capture) is None
+    assert len(read_pcap_csv(capture)) == len(lines) - 1 + 10
+    # the entry of the old version is replaced, not kept next to the new one
+    assert _entries(capture) == [cache_file(capture)]
+
+
+def test_rewrite_with_same_size_and_mtime_invalidates_the_cache(capture):
+    before = read_pcap_csv(capture)
+    # swap two packets: same bytes, same size, different content
+    _rewrite(capture, lambda lines: lines[:1] + [lines[2], lines[1]] + lines[3:])
+    assert load_cached_capture(capture) is None
+    after = read_pcap_csv(capture)
+    pd.testing.assert_frame_equal(after.iloc[[1, 0]].reset_index(drop=True), before.iloc[:2].reset_index(drop=True))
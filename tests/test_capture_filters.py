@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from src.addresses import int_to_ipv4
+from src.capture_filters import capture_filters
+from src.pcap_to_pandas import read_pcap_csv
+from src.synthetic_capture import generate_capture
+
+
+@pytest.fixture(scope='module')
+def capture(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('capture') / 'capture.csv')
+    generate_capture(20_000, csv_path=path, hosts=40, vlans=2, flows=500)
+    return path
+
+
+def _sorted(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_cached_read_matches_uncached(capture):
+    packets = read_pcap_csv(capture, cache=False)
+    read_pcap_csv(capture)  # writes the cache entry
+    times = packets['frame.time_epoch'].sort_values()
+    host = int_to_ipv4(packets['ip.src'].iloc[0])
+    # the time bounds are real packet times, so a packet sits on the inclusive end bound
+    time_filter = (times.iloc[100], times.iloc[len(times) // 2])
+    cases = [dict(vlan_filter=[10]), dict(protocol_filter=[6]), dict(time_filter=time_filter),
+             dict(vlan_filter=[10], protocol_filter=[6], time_filter=time_filter),
+             dict(host_filter=[host]), dict(subnet_filter=['10.1.0.0/16'])]
+    for case in cases:
+        filters = capture_filters(**case)
+        uncached = read_pcap_csv(capture, cache=False, filters=filters)
+        cached = read_pcap_csv(capture, filters=filters)
+        assert len(uncached), case
+        pd.testing.assert_frame_equal(_sorted(cached), _sorted(uncached), check_categorical=False)
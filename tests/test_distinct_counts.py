@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from src.distinct_counts import distinct_counts, distinct_sketch, merge_distinct
+
+
+def _items(seed=0):
+    # groups with 10 to 200k distinct items, every item seen several times
+    rng = np.random.default_rng(seed)
+    sizes = {1: 10, 2: 1_000, 3: 20_000, 4: 200_000}
+    parts = [pd.DataFrame({'group': group, 'item': rng.choice(rng.integers(0, 2**32, n, dtype=np.uint64), 2 * n)})
+             for group, n in sizes.items()]
+    return pd.concat(parts, ignore_index=True).sample(frac=1, random_state=seed, ignore_index=True)
+
+
+def _counts(sketch):
+    return distinct_counts(sketch).set_index('group')['count'].sort_index()
+
+
+def test_hll_error_at_precision_10():
+    df = _items()
+    exact = _counts(distinct_sketch(df, ['group'], 'item', exact=True))
+    estimate = _counts(distinct_sketch(df, ['group'], 'item', precision=10))
+    # standard error 1.04 / sqrt(1024) ~ 3.3%, allow three of them
+    error = (estimate - exact).abs() / exact
+    assert (error < 0.1).all(), error
+
+
+def test_merge_is_independent_of_chunking():
+    df = _items(1)
+    whole = distinct_sketch(df, ['group'], 'item')
+    for chunk in (1_000, 77_777, 250_000):
+        parts = [distinct_sketch(df.iloc[start:start + chunk], ['group'], 'item') for start in range(0, len(df), chunk)]
+        pd.testing.assert_series_equal(_counts(merge_distinct(parts)), _counts(whole))
+        # exact sketches give the exact counts however they are chunked
+        exact = [distinct_sketch(df.iloc[start:start + chunk], ['group'], 'item', exact=True) for start in range(0, len(df), chunk)]
+        pd.testing.assert_series_equal(_counts(merge_distinct(exact)), _counts(distinct_sketch(df, ['group'], 'item', exact=True)))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.addresses import ipv4_to_int
+from src.enrichment import SUBNET_UNKNOWN, as_asset_map, host_labels, subnet_labels
+from src.pcap_to_pandas import label_traffic
+from src.read_hostnames import load_asset_map
+
+
+def _ips(*addresses):
+    return np.array([ipv4_to_int(a) for a in addresses], dtype=np.uint32)
+
+
+def test_exact_address_inventory():
+    # the shipped hostname file has no CIDR blocks
+    asset_map = load_asset_map('files/ip_to_hostnames.txt')
+    ips = _ips('127.0.0.1', '123.45.67.89', '10.0.0.1')
+    assert list(host_labels(ips, asset_map)) == ['server', 'client', '10.0.0.1']
+    assert list(subnet_labels(ips, asset_map)) == [SUBNET_UNKNOWN] * 3
+
+
+def test_hostname_dict():
+    df = pd.DataFrame({'ip.src': _ips('127.0.0.1', '10.0.0.1'), 'ip.proto': [6, 17]})
+    df = label_traffic(df, {'127.0.0.1': 'server'})
+    assert list(df['label']) == ['server', '10.0.0.1']
+    assert list(df['subnet']) == [SUBNET_UNKNOWN] * 2
+
+
+def test_mixed_inventory_longest_prefix():
+    asset_map = as_asset_map(pd.DataFrame({'ip': ['10.0.0.0/8', '10.1.0.0/16', '10.1.2.3', '192.168.0.0/24'],
+                                           'hostname': ['lan', 'engineering', 'build', '']}))
+    ips = _ips('10.1.2.3', '10.1.9.9', '10.2.0.1', '192.168.0.7', '8.8.8.8')
+    assert list(host_labels(ips, asset_map)) == ['build', '10.1.9.9', '10.2.0.1', '192.168.0.7', '8.8.8.8']
+    assert list(subnet_labels(ips, asset_map)) == ['engineering', 'engineering', 'lan', '192.168.0.0/24', SUBNET_UNKNOWN]
+
+
+def test_ipv6_rows_are_skipped():
+    asset_map = as_asset_map(pd.DataFrame({'ip': ['10.0.0.0/8', '2001:db8::/32', '::1', '10.0.0.5'],
+                                           'hostname': ['lan', 'v6', 'localhost', 'printer']}))
+    assert list(asset_map['entries']['hostname']) == ['lan', 'printer']
+    ips = _ips('10.0.0.5', '10.9.9.9')
+    assert list(host_labels(ips, asset_map)) == ['printer', '10.9.9.9']
+    assert list(subnet_labels(ips, asset_map)) == ['lan', 'lan']
+
+
+def test_bad_row_is_named():
+    with pytest.raises(ValueError, match='row 1'):
+        as_asset_map(pd.DataFrame({'ip': ['10.0.0.1', 'not-an-ip'], 'hostname': ['a', 'b']}))
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from src.flows import FLOW_KEYS, assemble_flows
+
+START = pd.Timestamp('2025-01-01')
+
+
+def _packets(flows):
+    # {source port: packet times in seconds} -> packets of one flow per source port, in time order
+    rows = [(port, t) for port, times in flows.items() for t in times]
+    ports, seconds = (np.array(v) for v in zip(*rows))
+    df = pd.DataFrame({'vlan.id': 10, 'ip.src': 1, 'ip.dst': 2, 'ip.proto': 6, 'l4.proto': 6,
+                       'l4.srcport': ports, 'l4.dstport': 443,
+                       'frame.time_epoch': START + pd.to_timedelta(seconds, unit='s'), 'frame.len': 100})
+    return df.sort_values('frame.time_epoch', kind='stable', ignore_index=True)
+
+
+def _records(flows):
+    # (source port, first and last packet in seconds, packets) per record
+    start, end = (((flows[col] - START) / pd.Timedelta(1, 's')).astype(int) for col in ('start_time', 'end_time'))
+    table = pd.DataFrame({'port': flows['l4.srcport'], 'start': start, 'end': end, 'packets': flows['packets']})
+    return sorted(map(tuple, table.to_numpy().tolist()))
+
+
+def test_idle_gap_starts_a_new_record():
+    # a gap of exactly the idle timeout keeps the flow going, a longer one ends it
+    flows = assemble_flows(_packets({1000: [0, 5, 20, 36, 37]}), idle_timeout='15s')
+    assert _records(flows) == [(1000, 0, 20, 3), (1000, 36, 37, 2)]
+
+
+def test_active_timeout_cuts_long_flows_from_the_first_packet_after_a_gap():
+    packets = _packets({1000: [0, 10, 20, 30, 40, 50, 60, 70, 100, 110, 125, 131]})
+    flows = assemble_flows(packets, idle_timeout='15s', active_timeout='30s')
+    assert _records(flows) == [(1000, 0, 20, 3), (1000, 30, 50, 3), (1000, 60, 70, 2), (1000, 100, 125, 3), (1000, 131, 131, 1)]
+
+
+def test_interleaved_flows_and_capture_order():
+    packets = _packets({1000: [0, 1, 2, 30], 2000: [1, 20, 25], 3000: [3]})
+    flows = assemble_flows(packets, idle_timeout='15s')
+    assert _records(flows) == [(1000, 0, 2, 3), (1000, 30, 30, 1), (2000, 1, 1, 1), (2000, 20, 25, 2), (3000, 3, 3, 1)]
+    assert flows['packets'].sum() == len(packets) and flows['bytes'].sum() == packets['frame.len'].sum()
+    assert flows['start_time'].is_monotonic_increasing
+    assert set(FLOW_KEYS) <= set(flows.columns)
+    # out of order packets are put in time order first
+    shuffled = packets.sample(frac=1, random_state=0)
+    assert _records(assemble_flows(shuffled, idle_timeout='15s')) == _records(flows)
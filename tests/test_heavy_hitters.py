@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from src import heavy_hitters
+from src.heavy_hitters import host_estimates, host_sketch, merge_host_sketches, top_summary, merge_top_summaries
+
+
+def _packets(n=200_000, hosts=5_000, seed=0):
+    # zipf-like host popularity, so a few hosts dominate and many are rare
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'ip.src': (rng.zipf(1.3, n) % hosts).astype(np.uint32),
+                         'frame.len': rng.integers(60, 1500, n).astype(np.int64),
+                         'frame.time_epoch': pd.Timestamp('2025-01-01') + pd.to_timedelta(np.arange(n), unit='ms')})
+
+
+def _assert_contains(table, truth):
+    true = truth.reindex(table['key']).to_numpy()
+    assert (table['count'].to_numpy() >= true).all()
+    assert (table['count'].to_numpy() - table['error'].to_numpy() <= true).all()
+
+
+def test_merged_summaries_bound_the_true_totals():
+    df = _packets()
+    truth = df.groupby('ip.src')['frame.len'].sum()
+    parts = [top_summary(chunk['ip.src'].to_numpy(), chunk['frame.len'].to_numpy(), capacity=100)
+             for chunk in (df.iloc[start:start + 5_000] for start in range(0, len(df), 5_000))]
+    merged = merge_top_summaries(parts)
+    _assert_contains(merged['table'], truth)
+    # a key that was dropped weighs at most the bound
+    dropped = truth.drop(merged['table']['key'])
+    assert dropped.max() <= merged['bound']
+    assert merged['total'] == truth.sum()
+
+
+def test_host_sketch_estimates_bound_the_true_totals(monkeypatch):
+    monkeypatch.setattr(heavy_hitters, 'CHUNK_ROWS', 10_000)
+    df = _packets(seed=1)
+    truth = df.groupby('ip.src')['frame.len'].sum()
+    half = len(df) // 2
+    sketch = merge_host_sketches([host_sketch(df.iloc[:half], 'ip.src', 200), host_sketch(df.iloc[half:], 'ip.src', 200)])
+    _assert_contains(sketch['bytes']['table'], truth)
+    # every host, monitored or not: the true bytes are in [estimate - error, estimate]
+    # (the Count-Min lower bound holds with probability 1 - e^-depth; the hashes and the data are seeded)
+    estimates = host_estimates(sketch, truth.index.to_numpy())
+    assert (estimates['bytes'].to_numpy() >= truth.to_numpy()).all()
+    assert (estimates['bytes'].to_numpy() - estimates['bytes_error'].to_numpy() <= truth.to_numpy()).all()
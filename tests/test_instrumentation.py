@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from src.instrumentation import start_report, finish_report, stage, _reset_peak_rss
+
+BLOCK = 256 * 2**20
+
+
+def _touch():
+    # allocate and write a block so it counts towards the resident set, then free it
+    block = np.ones(BLOCK, dtype=np.uint8)
+    del block
+
+
+def test_parent_keeps_its_peak_before_a_child_stage():
+    if not _reset_peak_rss():
+        pytest.skip('the rss high-water mark cannot be reset here')
+    start_report()
+    with stage('parent'):
+        _touch()
+        with stage('child'):
+            pass
+    report = finish_report()
+    peaks = {s['name']: s['peak_rss_bytes'] for s in report['stages']}
+    assert peaks['parent'] >= BLOCK
+    assert peaks['child'] < BLOCK
+    assert report['peak_rss_bytes'] >= BLOCK
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from src.multi_ingest import iter_time_ordered, merge_time_ordered, write_time_ordered
+
+
+def _parts(k=5, n=3_000, seed=0):
+    # time-ordered parts with overlapping ranges and repeated timestamps
+    rng = np.random.default_rng(seed)
+    parts = []
+    for part in range(k):
+        ms = np.sort(rng.integers(0, 2_000, n - part * 500))
+        parts.append(pd.DataFrame({'frame.time_epoch': pd.Timestamp('2025-01-01') + pd.to_timedelta(ms, unit='ms'),
+                                   'part': part, 'row': np.arange(len(ms))}))
+    return parts + [parts[0].iloc[:0]]
+
+
+def _stable_sort(parts):
+    merged = pd.concat(parts, ignore_index=True)
+    return merged.sort_values('frame.time_epoch', kind='stable', ignore_index=True)
+
+
+def test_merge_matches_a_stable_sort():
+    parts = _parts()
+    pd.testing.assert_frame_equal(merge_time_ordered(parts), _stable_sort(parts))
+    blocks = list(iter_time_ordered(parts, rows=700))
+    assert max(len(b) for b in blocks) <= 700 * len(parts)
+    pd.testing.assert_frame_equal(pd.concat(blocks, ignore_index=True), _stable_sort(parts))
+
+
+def test_written_merge_matches_a_stable_sort(tmp_path):
+    parts = _parts(seed=1)
+    output = str(tmp_path / 'merged.parquet')
+    assert write_time_ordered(parts, output) == sum(len(p) for p in parts)
+    pd.testing.assert_frame_equal(pd.read_parquet(output), _stable_sort(parts))
@@ -0,0 +1,63 @@
+import os
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+from src.pcap_reader import iter_pcap
+from src.pcap_to_pandas import read_pcap_csv
+from src.synthetic_capture import generate_capture
+
+
+@pytest.fixture(scope='module')
+def capture(tmp_path_factory):
+    stem = tmp_path_factory.mktemp('capture') / 'capture'
+    paths = {fmt: f'{stem}.{fmt}' for fmt in ('csv', 'pcap', 'pcapng')}
+    generate_capture(5_000, csv_path=paths['csv'], pcap_path=paths['pcap'], hosts=40, vlans=2, flows=300)
+    _write_pcapng(paths['pcap'], paths['pcapng'])
+    return paths
+
+
+def _write_pcapng(pcap_path, pcapng_path):
+    # the same records as enhanced packet blocks (one ethernet interface, microsecond timestamps)
+    with open(pcap_path, 'rb') as f:
+        data = f.read()
+    linktype = struct.unpack_from('<I', data, 20)[0]
+    blocks = [struct.pack('<IIIHHqI', 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1, 28),
+              struct.pack('<IIHHII', 1, 20, linktype, 0, 65535, 20)]
+    pos = 24
+    while pos < len(data):
+        sec, usec, caplen, frame_len = struct.unpack_from('<IIII', data, pos)
+        payload = data[pos + 16:pos + 16 + caplen]
+        payload += b'\0' * (-len(payload) % 4)
+        ts = sec * 1_000_000 + usec
+        length = 32 + len(payload)
+        blocks.append(struct.pack('<IIIIIII', 6, length, 0, ts >> 32, ts & 0xFFFFFFFF, caplen, frame_len) + payload + struct.pack('<I', length))
+        pos += 16 + caplen
+    with open(pcapng_path, 'wb') as f:
+        f.write(b''.join(blocks))
+
+
+def _whole(path):
+    return pd.concat(list(iter_pcap(path)), ignore_index=True)
+
+
+def test_pcap_decodes_like_the_csv_export(capture):
+    csv = read_pcap_csv(capture['csv'], cache=False)
+    for fmt in ('pcap', 'pcapng'):
+        decoded = read_pcap_csv(capture[fmt], cache=False)
+        pd.testing.assert_frame_equal(decoded.drop(columns='frame.time_epoch'), csv.drop(columns='frame.time_epoch'))
+        # the csv has the times as decimal seconds, the captures as microseconds
+        drift = np.abs(decoded['frame.time_epoch'].to_numpy() - csv['frame.time_epoch'].to_numpy())
+        assert drift.max() <= np.timedelta64(2, 'us')
+
+
+@pytest.mark.parametrize('fmt', ['pcap', 'pcapng'])
+def test_byte_ranges_resync_to_the_whole_file(capture, fmt):
+    path = capture[fmt]
+    whole = _whole(path)
+    size = os.path.getsize(path)
+    rng = np.random.default_rng(0)
+    # arbitrary offsets, including ones inside the file header and inside records
+    cuts = [0, 5, 40] + sorted(rng.integers(41, size, 12).tolist()) + [size]
+    parts = [df for start, stop in zip(cuts, cuts[1:]) for df in iter_pcap(path, byte_range=(start, stop))]
+    pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True), whole)
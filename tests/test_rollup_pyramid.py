@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from src.pcap_to_pandas import read_pcap_csv
+from src.rollup_pyramid import build_pyramid, load_pyramid, pyramid_cube, pyramid_hosts
+from src.synthetic_capture import generate_capture
+from src.traffic_cube import CUBE_KEYS, build_cube
+
+INTERVALS = ['1s', '5s', '10s', '1min', '2min', '10min', '30min', '1h', '2h']
+
+
+@pytest.fixture(scope='module')
+def capture(tmp_path_factory):
+    # about two hours of traffic, so every level of the pyramid has several bins
+    path = str(tmp_path_factory.mktemp('capture') / 'capture.csv')
+    generate_capture(20_000, csv_path=path, hosts=40, vlans=2, flows=500, pps=3)
+    return path
+
+
+def _sorted(table, keys):
+    return table.sort_values(keys, ignore_index=True)[sorted(table.columns)]
+
+
+@pytest.mark.parametrize('interval', INTERVALS)
+def test_pyramid_cube_matches_build_cube(capture, interval):
+    packets = read_pcap_csv(capture, cache=False)
+    # two chunks, so the finest level is merged from partial cubes too
+    half = len(packets) // 2
+    pyramid = build_pyramid([packets.iloc[:half], packets.iloc[half:]])
+    pd.testing.assert_frame_equal(_sorted(pyramid_cube(pyramid, interval), CUBE_KEYS),
+                                  _sorted(build_cube(packets, interval), CUBE_KEYS), check_dtype=False)
+
+
+def test_stored_pyramid_matches_build_cube(capture):
+    packets = read_pcap_csv(capture, cache=False)
+    load_pyramid(capture, chunksize=7_000)
+    stored = load_pyramid(capture)
+    assert stored['dir'] is not None and not stored['cubes']  # read back from disk, level by level
+    for interval in ('1min', '2h'):
+        pd.testing.assert_frame_equal(_sorted(pyramid_cube(stored, interval), CUBE_KEYS),
+                                      _sorted(build_cube(packets, interval), CUBE_KEYS), check_dtype=False)
+    hosts = packets.groupby(['ip.src', packets['frame.time_epoch'].dt.floor('30min')]).agg(
+        **{'frame.len': ('frame.len', 'sum'), 'packet_count': ('frame.len', 'size')}).reset_index()
+    keys = ['ip.src', 'frame.time_epoch']
+    pd.testing.assert_frame_equal(_sorted(pyramid_hosts(stored, '30min'), keys), _sorted(hosts, keys), check_dtype=False)